@@ -0,0 +1,173 @@
+"""Admission control for model runs.
+
+At most ``max_running`` generations run at once, and at most
+``max_per_model`` for any one model. Requests beyond that wait in a FIFO
+queue and are told their position as it changes. A request whose model is
+at its own limit doesn't hold up requests for other models behind it. Once
+``max_queue`` requests are waiting, new ones are turned away with a
+suggested retry delay.
+
+The limits are for the whole server: with several server processes each
+one enforces its share of them (see ``per_worker``).
+"""
+
+import asyncio
+import math
+import time
+from typing import Dict, List, Optional
+
+from starlette.concurrency import iterate_in_threadpool
+
+from .events import QUEUED
+
+
+def per_worker(limit: int, workers: int) -> int:
+    """One worker's share of a server-wide limit; 0 (no limit) stays 0.
+
+    Every worker gets at least 1, so a limit below the number of workers
+    is exceeded rather than blocking some workers entirely.
+    """
+    if not limit or workers <= 1:
+        return limit
+    return max(1, limit // workers)
+
+
+class QueueFull(Exception):
+    """Raised when no more requests can wait for a slot."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many requests are queued, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    def __init__(self, key: str):
+        self.key = key
+        self.admitted = False
+        self.withdrawn = False
+        self.released = False
+        # 1-based place in the queue while waiting
+        self.position = 0
+        self.started_at: Optional[float] = None
+        self._changed = asyncio.Event()
+
+    async def changed(self):
+        """Wait until the ticket is admitted, withdrawn or moves up the queue."""
+        await self._changed.wait()
+        self._changed.clear()
+
+    def _notify(self):
+        self._changed.set()
+
+
+class AdmissionController:
+    def __init__(self, max_running: int = 8, max_per_model: int = 0, max_queue: int = 64):
+        # 0 means no limit
+        self.max_running = max_running
+        self.max_per_model = max_per_model
+        self.max_queue = max_queue
+        self.running = 0
+        self.running_by_key: Dict[str, int] = {}
+        self.queue: List[Ticket] = []
+        # Moving average of run time, used to suggest a Retry-After
+        self.average_runtime = 10.0
+
+    def request(self, key: str = "") -> Ticket:
+        """Take a ticket for a run of model ``key``, admitted now or queued.
+
+        Raises QueueFull instead of queueing past ``max_queue``.
+        """
+        ticket = Ticket(key)
+        self.queue.append(ticket)
+        self._dispatch()
+        if not ticket.admitted and len(self.queue) > self.max_queue:
+            self.queue.remove(ticket)
+            raise QueueFull(self.retry_after())
+        return ticket
+
+    async def wait(self, ticket: Ticket) -> bool:
+        """Wait until ``ticket`` is admitted; False if it was withdrawn instead."""
+        while not (ticket.admitted or ticket.withdrawn):
+            await ticket.changed()
+        return ticket.admitted
+
+    def withdraw(self, ticket: Ticket):
+        """Give up a place in the queue; admitted tickets are unaffected."""
+        if ticket.admitted or ticket.withdrawn:
+            return
+        ticket.withdrawn = True
+        if ticket in self.queue:
+            self.queue.remove(ticket)
+        ticket._notify()
+        self._dispatch()
+
+    def release(self, ticket: Ticket):
+        """Hand back the slot of a finished run (or the queue place of a waiting one)."""
+        if not ticket.admitted:
+            self.withdraw(ticket)
+            return
+        if ticket.released:
+            return
+        ticket.released = True
+        self.running -= 1
+        self.running_by_key[ticket.key] -= 1
+        if not self.running_by_key[ticket.key]:
+            del self.running_by_key[ticket.key]
+        runtime = time.monotonic() - ticket.started_at
+        self.average_runtime = 0.8 * self.average_runtime + 0.2 * runtime
+        self._dispatch()
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up for a new request."""
+        slots = self.max_running or 1
+        return max(1, math.ceil(self.average_runtime * (len(self.queue) + 1) / slots))
+
+    def _has_room(self, key: str) -> bool:
+        if self.max_running and self.running >= self.max_running:
+            return False
+        if self.max_per_model and self.running_by_key.get(key, 0) >= self.max_per_model:
+            return False
+        return True
+
+    def _dispatch(self):
+        waiting = []
+        for ticket in self.queue:
+            if self._has_room(ticket.key):
+                ticket.admitted = True
+                ticket.started_at = time.monotonic()
+                self.running += 1
+                self.running_by_key[ticket.key] = self.running_by_key.get(ticket.key, 0) + 1
+                ticket._notify()
+            else:
+                waiting.append(ticket)
+        self.queue = waiting
+        for position, ticket in enumerate(waiting, 1):
+            if ticket.position != position:
+                ticket.position = position
+                ticket._notify()
+
+
+async def admitted_events(controller: AdmissionController, ticket: Ticket, events):
+    """Report queue positions until ``ticket`` is admitted, then yield ``events``.
+
+    The slot is handed back when the events end, or the place in the queue
+    when the generation is cancelled first.
+    """
+    try:
+        while not ticket.admitted:
+            if ticket.withdrawn:
+                return
+            yield QUEUED, {"position": ticket.position}
+            await ticket.changed()
+        if hasattr(events, "__aiter__"):
+            try:
+                async for event in events:
+                    yield event
+            finally:
+                await events.aclose()
+        else:
+            # In-process generators block, so pull them from a worker thread
+            async for event in iterate_in_threadpool(events):
+                yield event
+    finally:
+        controller.release(ticket)
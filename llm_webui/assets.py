@@ -0,0 +1,442 @@
+"""Self-hosted, fingerprinted and precompressed static assets.
+
+``python scripts/build_assets.py`` (run before packaging) builds
+``static/dist``:
+
+- Bootstrap and Font Awesome are downloaded into ``static/vendor`` (once;
+  existing files are kept), so the page needs no third-party CDN.
+- Vendored CSS rules whose classes appear nowhere in the templates or
+  scripts are dropped, and icon fonts are cut down to the glyphs the
+  remaining rules use (the latter needs ``pip install llm-webui[assets]``).
+- Every file is written under a name containing a hash of its content,
+  e.g. ``js/app.3f9c2a61d0b4.js``, with gzip and (with brotli installed)
+  Brotli copies next to it. ``dist/manifest.json`` maps source names to
+  built ones.
+
+StaticAssets serves those files with ``Cache-Control: immutable`` and picks
+the precompressed copy the browser accepts. Without a build, templates
+fall back to the plain files and the CDNs.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import posixpath
+import re
+import shutil
+import stat
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+from jinja2 import pass_context
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:
+    font_subset = None
+
+
+logger = logging.getLogger(__name__)
+
+DIST = "dist"
+MANIFEST = "manifest.json"
+VENDOR = "vendor"
+
+# Third-party files the page uses, by where they go under static/. Fonts
+# the stylesheets refer to are fetched along with them.
+VENDOR_URLS = {
+    "vendor/bootstrap/css/bootstrap.min.css":
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css",
+    "vendor/bootstrap/js/bootstrap.bundle.min.js":
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js",
+    "vendor/fontawesome/css/all.min.css":
+        "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css",
+}
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Content-encoding and file suffix of precompressed copies, best first
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+COMPRESSIBLE = {".css", ".js", ".json", ".svg", ".html", ".txt", ".ttf"}
+FONTS = {".woff2", ".woff", ".ttf"}
+
+FINGERPRINT_RE = re.compile(r"\.[0-9a-f]{12}(\.[^./]+)+$")
+URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+# Strings are matched so comment markers inside them are left alone;
+# /*! license */ comments are kept
+COMMENT_RE = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*(?!!)[\s\S]*?\*/)""")
+PSEUDO_ARGS_RE = re.compile(r":(?:not|is|where|has|matches|-webkit-any|-moz-any)\([^()]*\)")
+CLASS_RE = re.compile(r"\.((?:\\.|[\w-])+)")
+GLYPH_RE = re.compile(r"""["']\\([0-9a-fA-F]{4,6})["']""")
+TOKEN_RE = re.compile(r"[A-Za-z_][\w-]*")
+# At-rules whose body holds ordinary rules that can be trimmed
+NESTING_AT_RULES = {"media", "supports", "layer", "container"}
+
+
+# Building
+
+
+def fetch_vendor(static_dir: Path, urls: Dict[str, str] = VENDOR_URLS, opener=urllib.request.urlopen):
+    """Download the vendored files that aren't there yet, and their fonts."""
+    for name, url in urls.items():
+        path = static_dir / name
+        if not path.exists():
+            _download(url, path, opener)
+        if path.suffix == ".css":
+            for ref in URL_RE.findall(path.read_text("utf-8")):
+                ref = _strip_query(ref[1])
+                if ref.startswith(("data:", "#")) or urllib.parse.urlparse(ref).scheme:
+                    continue
+                target = static_dir / posixpath.normpath(posixpath.join(posixpath.dirname(name), ref))
+                if not target.exists():
+                    _download(urllib.parse.urljoin(url, ref), target, opener)
+
+
+def _download(url: str, path: Path, opener):
+    logger.info("Downloading %s", url)
+    with opener(url) as response:
+        data = response.read()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def used_tokens(texts: Iterable[str]) -> Set[str]:
+    """Every identifier-like word in the templates and scripts.
+
+    Generous on purpose: a class only has to appear somewhere (including in
+    Bootstrap's own JavaScript, which adds classes at runtime) to be kept.
+    """
+    tokens: Set[str] = set()
+    for text in texts:
+        tokens.update(TOKEN_RE.findall(text))
+    return tokens
+
+
+def prune_css(css: str, tokens: Set[str]) -> str:
+    """Drop the rules of a stylesheet whose classes aren't all in ``tokens``."""
+    out = []
+    for prelude, body in _css_rules(_strip_comments(css)):
+        if prelude.startswith("/*"):
+            out.append(prelude)
+        elif body is None:
+            out.append(f"{prelude};")
+        elif prelude.startswith("@"):
+            name = re.split(r"[\s(]", prelude[1:], 1)[0].lower()
+            if name in NESTING_AT_RULES:
+                inner = prune_css(body, tokens)
+                if inner:
+                    out.append(f"{prelude}{{{inner}}}")
+            else:
+                # @font-face, @keyframes, ... are kept as they are
+                out.append(f"{prelude}{{{body}}}")
+        else:
+            selectors = [s for s in _split_selectors(prelude) if _selector_used(s, tokens)]
+            if selectors:
+                out.append(f"{','.join(selectors)}{{{body}}}")
+    return "".join(out)
+
+
+def _strip_comments(css: str) -> str:
+    return COMMENT_RE.sub(lambda m: m.group(1) or "", css)
+
+
+def _skip_string(css: str, i: int) -> int:
+    """Index just past the string literal starting at ``i``."""
+    quote = css[i]
+    i += 1
+    while i < len(css) and css[i] != quote:
+        i += 2 if css[i] == "\\" else 1
+    return i + 1
+
+
+def _css_rules(css: str):
+    """Yield (prelude, body) per top-level rule; body is None for statements."""
+    i, n = 0, len(css)
+    while i < n:
+        while i < n and css[i].isspace():
+            i += 1
+        if css.startswith("/*", i):
+            end = css.find("*/", i)
+            end = n if end < 0 else end + 2
+            # A kept license comment
+            yield css[i:end], None
+            i = end
+            continue
+        start = i
+        while i < n and css[i] not in "{;":
+            i = _skip_string(css, i) if css[i] in "\"'" else i + 1
+        if i >= n:
+            break
+        prelude = css[start:i].strip()
+        if css[i] == ";":
+            yield prelude, None
+            i += 1
+            continue
+        depth, body_start = 0, i + 1
+        while i < n:
+            char = css[i]
+            if char in "\"'":
+                i = _skip_string(css, i)
+                continue
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    break
+            i += 1
+        yield prelude, css[body_start:i]
+        i += 1
+
+
+def _split_selectors(prelude: str):
+    selectors, depth, start = [], 0, 0
+    for i, char in enumerate(prelude):
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == "," and depth == 0:
+            selectors.append(prelude[start:i].strip())
+            start = i + 1
+    selectors.append(prelude[start:].strip())
+    return selectors
+
+
+def _selector_used(selector: str, tokens: Set[str]) -> bool:
+    # Classes in :not(), :is(), ... and attribute values don't have to exist
+    previous = None
+    while previous != selector:
+        previous, selector = selector, PSEUDO_ARGS_RE.sub("", selector)
+    selector = re.sub(r"\[[^\]]*\]", "", selector)
+    classes = (re.sub(r"\\(.)", r"\1", name) for name in CLASS_RE.findall(selector))
+    return all(name in tokens for name in classes)
+
+
+def subset_font(data: bytes, suffix: str, codepoints: Set[int]) -> bytes:
+    """Cut a font down to ``codepoints``; unchanged without fontTools."""
+    if font_subset is None or not codepoints:
+        return data
+    import io
+
+    options = font_subset.Options()
+    options.flavor = {".woff2": "woff2", ".woff": "woff"}.get(suffix)
+    options.layout_features = ["*"]
+    try:
+        font = font_subset.load_font(io.BytesIO(data), options)
+        subsetter = font_subset.Subsetter(options)
+        subsetter.populate(unicodes=codepoints)
+        subsetter.subset(font)
+        out = io.BytesIO()
+        font_subset.save_font(font, out, options)
+    except Exception as e:
+        # e.g. woff2 without the brotli module
+        logger.warning("Could not subset font (%s); keeping it whole", e)
+        return data
+    return out.getvalue()
+
+
+def fingerprint(name: str, data: bytes) -> str:
+    """``css/style.css`` -> ``css/style.<hash>.css``."""
+    stem, ext = posixpath.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def rewrite_urls(css: str, name: str, manifest: Dict[str, Dict[str, str]]) -> str:
+    """Point url() references at the fingerprinted names of their targets."""
+    directory = posixpath.dirname(name)
+
+    def replace(match):
+        ref = match.group(2)
+        target = posixpath.normpath(posixpath.join(directory, _strip_query(ref)))
+        if ref.startswith(("data:", "#")) or urllib.parse.urlparse(ref).scheme or target not in manifest:
+            return match.group(0)
+        return f"url({posixpath.relpath(manifest[target]['path'], directory)})"
+
+    return URL_RE.sub(replace, css)
+
+
+def _strip_query(ref: str) -> str:
+    return re.split(r"[?#]", ref, 1)[0]
+
+
+def precompress(path: Path, data: bytes):
+    """Write .gz (and .br) copies of a text file when they are smaller."""
+    if path.suffix not in COMPRESSIBLE:
+        return
+    variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            path.with_name(path.name + suffix).write_bytes(compressed)
+
+
+def build(
+    static_dir: Path, templates_dir: Path, fetch: bool = True
+) -> Dict[str, Dict[str, str]]:
+    """Build ``static_dir/dist`` and return its manifest."""
+    static_dir, templates_dir = Path(static_dir), Path(templates_dir)
+    if fetch:
+        fetch_vendor(static_dir)
+    dist = static_dir / DIST
+    shutil.rmtree(dist, ignore_errors=True)
+
+    sources = {}
+    for path in sorted(static_dir.rglob("*")):
+        name = path.relative_to(static_dir).as_posix()
+        if path.is_file() and not name.startswith(f"{DIST}/"):
+            sources[name] = path.read_bytes()
+
+    tokens = used_tokens(
+        [path.read_text("utf-8") for path in templates_dir.rglob("*.html")]
+        + [data.decode("utf-8", "replace") for name, data in sources.items() if name.endswith(".js")]
+    )
+    contents = dict(sources)
+    vendored = [name for name in sources if name.startswith(f"{VENDOR}/")]
+    for name in vendored:
+        if name.endswith(".css"):
+            contents[name] = prune_css(sources[name].decode("utf-8"), tokens).encode("utf-8")
+        elif name.endswith(".js"):
+            # The source maps aren't vendored
+            contents[name] = re.sub(rb"\n//# sourceMappingURL=\S+\s*$", b"\n", sources[name])
+    codepoints = {
+        int(code, 16)
+        for name in vendored if name.endswith(".css")
+        for code in GLYPH_RE.findall(contents[name].decode("utf-8"))
+    }
+    for name in vendored:
+        suffix = posixpath.splitext(name)[1]
+        if suffix in FONTS:
+            contents[name] = subset_font(sources[name], suffix, codepoints)
+
+    # Stylesheets last, so the files they refer to already have their names
+    manifest: Dict[str, Dict[str, str]] = {}
+    for name in sorted(contents, key=lambda name: (name.endswith(".css"), name)):
+        data = contents[name]
+        if name.endswith(".css"):
+            data = rewrite_urls(data.decode("utf-8"), name, manifest).encode("utf-8")
+        built = fingerprint(name, data)
+        path = dist / built
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        precompress(path, data)
+        manifest[name] = {"path": built, "source": hashlib.sha256(sources[name]).hexdigest()}
+    (dist / MANIFEST).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+
+# Serving
+
+
+class AssetManifest:
+    """Maps asset names in templates to the URLs they are served from."""
+
+    def __init__(self, static_dir: Path):
+        self.static_dir = Path(static_dir)
+        self.entries: Dict[str, str] = {}
+        self.load()
+
+    def load(self):
+        path = self.static_dir / DIST / MANIFEST
+        try:
+            manifest = json.loads(path.read_text())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable asset manifest %s: %s", path, e)
+            return
+        self.entries = {}
+        for name, entry in manifest.items():
+            # A source edited since the build is served as it is now
+            source = self.static_dir / name
+            if source.exists() and hashlib.sha256(source.read_bytes()).hexdigest() != entry["source"]:
+                logger.info("%s changed since the assets were built; serving it unbuilt", name)
+                continue
+            self.entries[name] = entry["path"]
+
+    def path(self, name: str) -> Optional[str]:
+        """Where under /static an asset is, or None if it's only on the CDN."""
+        if name in self.entries:
+            return f"{DIST}/{self.entries[name]}"
+        if name in VENDOR_URLS and not (self.static_dir / name).exists():
+            return None
+        return name
+
+    def url(self, request, name: str) -> str:
+        path = self.path(name)
+        if path is None:
+            return VENDOR_URLS[name]
+        return str(request.url_for("static", path=f"/{path}"))
+
+    def template_global(self):
+        """``asset_url(name)`` for Jinja templates."""
+
+        @pass_context
+        def asset_url(context, name: str) -> str:
+            return self.url(context["request"], name)
+
+        return asset_url
+
+
+def accepted_encodings(header: str) -> Set[str]:
+    accepted = set()
+    for part in header.split(","):
+        encoding, _, params = part.partition(";")
+        match = re.search(r"q\s*=\s*([0-9.]+)", params)
+        try:
+            quality = float(match.group(1)) if match else 1.0
+        except ValueError:
+            quality = 0.0
+        if quality > 0:
+            accepted.add(encoding.strip().lower())
+    return accepted
+
+
+class StaticAssets(StaticFiles):
+    """StaticFiles that serves precompressed copies and caches built files for good."""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = None
+        if scope["method"] in ("GET", "HEAD"):
+            response = await self._precompressed(path, scope)
+        if response is None:
+            response = await super().get_response(path, scope)
+        if posixpath.splitext(path)[1] in COMPRESSIBLE:
+            response.headers["vary"] = "Accept-Encoding"
+        if response.status_code in (200, 304):
+            # Built names change with their content; anything else is revalidated
+            built = path.startswith(f"{DIST}/") and FINGERPRINT_RE.search(path)
+            response.headers["cache-control"] = IMMUTABLE if built else "no-cache"
+        return response
+
+    async def _precompressed(self, path: str, scope: Scope) -> Optional[Response]:
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = await run_in_threadpool(self.lookup_path, path + suffix)
+            if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+                continue
+            response = self.file_response(full_path, stat_result, scope)
+            response.headers["content-encoding"] = encoding
+            media_type = mimetypes.guess_type(path)[0]
+            if media_type and response.status_code == 200:
+                if media_type.startswith("text/") or media_type.endswith("javascript"):
+                    media_type += "; charset=utf-8"
+                response.headers["content-type"] = media_type
+            return response
+        return None
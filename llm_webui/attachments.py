@@ -0,0 +1,276 @@
+"""Content-addressed store for uploaded attachments.
+
+Uploads are kept under their SHA-256 (``<root>/ab/abcdef...``), so the same
+screenshot or PDF uploaded twice is stored once, and a client that already
+knows a file's hash can reuse the stored copy without sending it again.
+
+Each upload, and each client that reuses a stored file, takes a reference,
+which the client hands back when the attachment is removed or the page
+is closed. A reference is a lease: a blob nobody has used for
+``max_age`` seconds loses its references, so a client that never handed
+them back (a closed tab, a crash) doesn't keep it forever. Blobs nobody
+references are deleted once unused for ``max_age`` seconds, and when they
+add up to more than ``quota`` bytes the least recently used go first.
+Referenced blobs never count against the quota and are never deleted
+for it.
+
+The index is a SQLite database next to the blobs, and every change to it
+and to the blob files happens in one write transaction, so several server
+workers can share the store.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Union
+
+SCHEMA = """
+create table if not exists blobs (
+    sha256 text primary key,
+    size integer not null,
+    mimetype text,
+    created real not null,
+    last_used real not null,
+    refs integer not null default 0
+);
+create index if not exists blobs_last_used on blobs (refs, last_used);
+"""
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+# Unfinished uploads left behind by a crash are removed after this long
+STALE_UPLOAD_AGE = 24 * 3600
+
+
+def default_root() -> Path:
+    import llm
+
+    return llm.user_dir() / "webui-attachments"
+
+
+def valid_sha256(sha256: str) -> bool:
+    return bool(SHA256_RE.match(sha256 or ""))
+
+
+def file_sha256(path: Union[str, Path], chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AttachmentStore:
+    def __init__(
+        self,
+        root: Optional[Union[str, Path]] = None,
+        max_age: float = 7 * 24 * 3600,
+        quota: int = 2 * 1024 * 1024 * 1024,
+        collect_interval: float = 60.0,
+    ):
+        # None: resolved from the llm user directory whenever it is needed
+        self._root = Path(root) if root is not None else None
+        self.max_age = max_age
+        # Bytes of unreferenced blobs kept; 0 means no limit
+        self.quota = quota
+        self.collect_interval = collect_interval
+        self._last_collect = 0.0
+        self._local = threading.local()
+
+    @property
+    def root(self) -> Path:
+        return self._root if self._root is not None else default_root()
+
+    @property
+    def upload_dir(self) -> Path:
+        """Where uploads are written before they are added to the store."""
+        path = self.root / "tmp"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    def get(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Describe a stored blob, or None if it isn't stored."""
+        if not valid_sha256(sha256):
+            return None
+        row = self._connect().execute(
+            "select sha256, size, mimetype, refs from blobs where sha256 = ?", [sha256]
+        ).fetchone()
+        if row is None or not self.blob_path(sha256).exists():
+            return None
+        return self._describe(row)
+
+    def add(
+        self, path: Union[str, Path], sha256: str, mimetype: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Move a finished upload into the store and take a reference to it.
+
+        If the content is already stored, ``path`` is deleted and the
+        existing blob is used instead; ``deduplicated`` says which happened.
+        """
+        blob = self.blob_path(sha256)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        conn = self._connect()
+        with self._write(conn):
+            stored = conn.execute("select 1 from blobs where sha256 = ?", [sha256]).fetchone()
+            deduplicated = stored is not None and blob.exists()
+            if deduplicated:
+                os.unlink(path)
+            else:
+                os.replace(path, blob)
+            conn.execute(
+                "insert into blobs (sha256, size, mimetype, created, last_used, refs)"
+                " values (?, ?, ?, ?, ?, 1)"
+                " on conflict (sha256) do update set refs = refs + 1, last_used = excluded.last_used",
+                [sha256, blob.stat().st_size, mimetype, now, now],
+            )
+            row = conn.execute(
+                "select sha256, size, mimetype, refs from blobs where sha256 = ?", [sha256]
+            ).fetchone()
+        self.maybe_collect()
+        return dict(self._describe(row), deduplicated=deduplicated)
+
+    def acquire(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Take a reference to a stored blob; None if it isn't stored."""
+        if not valid_sha256(sha256):
+            return None
+        conn = self._connect()
+        with self._write(conn):
+            if not self.blob_path(sha256).exists():
+                return None
+            conn.execute(
+                "update blobs set refs = refs + 1, last_used = ? where sha256 = ?",
+                [time.time(), sha256],
+            )
+            row = conn.execute(
+                "select sha256, size, mimetype, refs from blobs where sha256 = ?", [sha256]
+            ).fetchone()
+        return self._describe(row) if row is not None else None
+
+    def release(self, sha256: str) -> bool:
+        """Hand back a reference; the blob stays until garbage collection."""
+        if not valid_sha256(sha256):
+            return False
+        conn = self._connect()
+        with self._write(conn):
+            cursor = conn.execute(
+                "update blobs set refs = refs - 1 where sha256 = ? and refs > 0", [sha256]
+            )
+        return cursor.rowcount > 0
+
+    def sha256_of(self, path: Union[str, Path]) -> Optional[str]:
+        """The hash a path is stored under, or None if it's not in the store."""
+        path = Path(path).resolve()
+        if path.parent.parent == self.root.resolve() and valid_sha256(path.name):
+            return path.name
+        return None
+
+    def touch(self, paths: Iterable[str]):
+        """Mark stored blobs as just used, e.g. when a prompt attaches them."""
+        hashes = [sha256 for sha256 in map(self.sha256_of, paths) if sha256]
+        if not hashes:
+            return
+        conn = self._connect()
+        with self._write(conn):
+            conn.executemany(
+                "update blobs set last_used = ? where sha256 = ?",
+                [(time.time(), sha256) for sha256 in hashes],
+            )
+
+    def maybe_collect(self):
+        now = time.monotonic()
+        if now - self._last_collect >= self.collect_interval:
+            self._last_collect = now
+            self.collect()
+
+    def collect(self) -> int:
+        """Delete expired and over-quota unreferenced blobs; returns how many were removed."""
+        now = time.time()
+        conn = self._connect()
+        removed = 0
+        with self._write(conn):
+            # Leases of references held by clients that went away
+            conn.execute(
+                "update blobs set refs = 0 where refs > 0 and last_used < ?",
+                [now - self.max_age],
+            )
+            expired = [
+                row[0]
+                for row in conn.execute(
+                    "select sha256 from blobs where refs = 0 and last_used < ?",
+                    [now - self.max_age],
+                )
+            ]
+            for sha256 in expired:
+                self._delete(conn, sha256)
+            removed += len(expired)
+            if self.quota:
+                total = conn.execute(
+                    "select coalesce(sum(size), 0) from blobs where refs = 0"
+                ).fetchone()[0]
+                if total > self.quota:
+                    rows = conn.execute(
+                        "select sha256, size from blobs where refs = 0 order by last_used"
+                    ).fetchall()
+                    for sha256, size in rows:
+                        if total <= self.quota:
+                            break
+                        self._delete(conn, sha256)
+                        total -= size
+                        removed += 1
+        # Temporary files of uploads that never finished
+        for path in self.upload_dir.iterdir():
+            try:
+                if now - path.stat().st_mtime > STALE_UPLOAD_AGE:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def _delete(self, conn: sqlite3.Connection, sha256: str):
+        conn.execute("delete from blobs where sha256 = ?", [sha256])
+        blob = self.blob_path(sha256)
+        # The blob and any variants derived from it (see llm_webui.images)
+        for path in [blob, *blob.parent.glob(f"{sha256}.*")]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _describe(self, row) -> Dict[str, Any]:
+        sha256, size, mimetype, refs = row
+        return {
+            "sha256": sha256,
+            "path": str(self.blob_path(sha256)),
+            "size": size,
+            "mimetype": mimetype,
+            "refs": refs,
+        }
+
+    def _write(self, conn: sqlite3.Connection):
+        # "begin immediate" takes the write lock up front, so blob files
+        # change in step with the index across processes
+        conn.execute("begin immediate")
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread (and per root, which can change with
+        # the llm user directory); sqlite3 connections can't be shared
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        root = self.root
+        conn = conns.get(root)
+        if conn is None:
+            root.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(root / "index.db"), timeout=30, isolation_level=None)
+            conn.execute("pragma journal_mode=wal")
+            conn.executescript(SCHEMA)
+            conns[root] = conn
+        return conn
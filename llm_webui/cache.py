@@ -0,0 +1,118 @@
+"""Cache of non-streamed prompt responses.
+
+Dashboards and batch jobs often send the very same prompt again. With
+``LLM_WEBUI_RESPONSE_CACHE`` on, the text of a non-streamed ``/api/prompt``
+response is kept under a hash of everything that went into it (model,
+prompt, system prompt, template, options, attachment contents, ...), and an
+identical request is answered from the cache instead of the model.
+
+Entries expire after ``ttl`` seconds; past ``max_size`` characters the
+least recently used are evicted. The cache is a SQLite file in the llm user
+directory, so it survives restarts and is shared by all server workers.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+SCHEMA = """
+create table if not exists responses (
+    key text primary key,
+    response text not null,
+    size integer not null,
+    created real not null,
+    last_used real not null
+);
+create index if not exists responses_last_used on responses (last_used);
+"""
+
+
+def default_path() -> Path:
+    import llm
+
+    return llm.user_dir() / "webui-cache.db"
+
+
+def cache_key(material: Dict[str, Any]) -> str:
+    """Hash of the canonical JSON form of a request."""
+    body = json.dumps(material, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        ttl: float = 3600.0,
+        max_size: int = 64 * 1024 * 1024,
+    ):
+        # None: resolved from the llm user directory whenever it is needed
+        self._path = Path(path) if path is not None else None
+        self.ttl = ttl
+        self.max_size = max_size
+        self._local = threading.local()
+
+    @property
+    def path(self) -> Path:
+        return self._path if self._path is not None else default_path()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Return (response, age in seconds) for a fresh entry, or None."""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "select response, created from responses where key = ? and created > ?",
+            [key, now - self.ttl],
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("update responses set last_used = ? where key = ?", [now, key])
+        return row[0], now - row[1]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("begin immediate")
+            conn.execute(
+                "insert or replace into responses (key, response, size, created, last_used)"
+                " values (?, ?, ?, ?, ?)",
+                [key, response, len(response), now, now],
+            )
+            self._evict(conn, now)
+
+    def clear(self):
+        self._connect().execute("delete from responses")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("delete from responses where created <= ?", [now - self.ttl])
+        total = conn.execute("select coalesce(sum(size), 0) from responses").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for key, size in conn.execute(
+            "select key, size from responses order by last_used"
+        ).fetchall():
+            if total <= self.max_size:
+                break
+            conn.execute("delete from responses where key = ?", [key])
+            total -= size
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread (and per path, which can change with
+        # the llm user directory); sqlite3 connections can't be shared
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        path = self.path
+        conn = conns.get(path)
+        if conn is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+            conn.execute("pragma journal_mode=wal")
+            conn.executescript(SCHEMA)
+            conns[path] = conn
+        return conn
@@ -0,0 +1,196 @@
+"""gzip/Brotli compression of responses, without delaying streamed output.
+
+Responses sent in one piece (JSON from /api/logs, /api/models, ...) are
+compressed whole. Streamed responses (/api/prompt, /api/chat, large files)
+are compressed chunk by chunk, and each chunk's compressed bytes are
+flushed straight away: a streamed event is one chunk, so a token reaches
+the client as soon as it would have uncompressed, while repeated framing
+(SSE fields, JSON keys) still compresses against the earlier ones.
+
+Responses that already have a Content-Encoding (the precompressed assets
+of llm_webui.assets) and media types that don't compress are left alone.
+Brotli is used when the client accepts it and the brotli module is
+installed, gzip otherwise.
+"""
+
+import zlib
+from typing import List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .assets import accepted_encodings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "image/svg+xml",
+)
+
+
+class GzipEncoder:
+    encoding = "gzip"
+
+    def __init__(self, level: int = 6):
+        # wbits 31: gzip container
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    encoding = "br"
+
+    def __init__(self, quality: int = 4):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def choose_encoder(accept_encoding: str, gzip_level: int = 6, brotli_quality: int = 4):
+    """An encoder for the best encoding the client accepts, or None."""
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return BrotliEncoder(brotli_quality)
+    if "gzip" in accepted:
+        return GzipEncoder(gzip_level)
+    return None
+
+
+def compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers or "content-range" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 512,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ):
+        self.app = app
+        # Responses sent whole and smaller than this aren't worth compressing
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        # Low qualities are much faster and still beat gzip; the static
+        # assets are precompressed at the highest quality instead
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoder = choose_encoder(
+            Headers(scope=scope).get("accept-encoding", ""), self.gzip_level, self.brotli_quality
+        )
+        if encoder is None:
+            await self.app(scope, receive, send)
+            return
+        await CompressedResponder(self, encoder, send).run(scope, receive)
+
+
+class CompressedResponder:
+    """Compresses one response as the app sends it."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoder, send: Send):
+        self.app = middleware.app
+        self.minimum_size = middleware.minimum_size
+        self.encoder = encoder
+        self.send = send
+        # The start message is held back until the first body chunk shows
+        # whether the response comes whole or streamed
+        self.start: Optional[Message] = None
+        # None: not decided yet; then True (compressing) or False (as is)
+        self.compressing: Optional[bool] = None
+
+    async def run(self, scope: Scope, receive: Receive):
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if message["status"] in (204, 304) or not compressible(headers):
+                self.compressing = False
+                await self.send(message)
+            else:
+                self.start = message
+            return
+        if self.compressing is False:
+            await self.send(message)
+            return
+        if self.start is None:
+            # Extension messages ahead of the response (http.response.debug)
+            await self.send(message)
+            return
+        if message["type"] != "http.response.body":
+            # e.g. http.response.pathsend: sent as the app meant it
+            self.compressing = False
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressing is None:
+            if not more_body:
+                await self.send_whole(body)
+                return
+            self.compressing = True
+            await self.send(self.compressed_start())
+        # Flushed per chunk: a streamed event is never held back
+        data = self.encoder.compress(body)
+        data += self.encoder.flush() if more_body else self.encoder.finish()
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def send_whole(self, body: bytes):
+        if len(body) < self.minimum_size:
+            self.compressing = False
+            await self.send(self.start)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+        self.compressing = True
+        data = self.encoder.compress(body) + self.encoder.finish()
+        await self.send(self.compressed_start(len(data)))
+        await self.send({"type": "http.response.body", "body": data})
+
+    def compressed_start(self, length: Optional[int] = None) -> Message:
+        headers = MutableHeaders(raw=list(self.start["headers"]))
+        headers["content-encoding"] = self.encoder.encoding
+        vary: List[str] = [v.strip() for v in headers.get("vary", "").split(",") if v.strip()]
+        if "accept-encoding" not in (v.lower() for v in vary):
+            headers["vary"] = ", ".join(vary + ["Accept-Encoding"])
+        # The compressed bytes differ from what a strong ETag names
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["etag"] = f"W/{etag}"
+        if length is None:
+            del headers["content-length"]
+        else:
+            headers["content-length"] = str(length)
+        return dict(self.start, headers=headers.raw)
@@ -0,0 +1,311 @@
+"""In-process prompt execution using the llm Python API.
+
+This mirrors the flags ``execute_prompt`` passes to ``llm prompt`` (model,
+system, template, options, reasoning, attachments and tools) without paying
+for a fresh interpreter and plugin import on every request.
+"""
+
+import inspect
+import json
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import llm
+import pydantic
+
+from . import events, logsdb
+
+
+class PromptError(Exception):
+    """Raised when a prompt cannot be prepared or executed."""
+
+
+def resolve_model(model_id: Optional[str] = None):
+    """Return the llm model for an id or alias, falling back to the default."""
+    try:
+        return llm.get_model(model_id or llm.get_default_model())
+    except llm.UnknownModelError as e:
+        raise PromptError(str(e))
+
+
+def model_id_for(model: Optional[str] = None, template: Optional[str] = None) -> str:
+    """Id of the model a prompt would run on, following aliases, the
+    template's model and the default model.
+
+    Falls back to ``model`` as given when it can't be resolved.
+    """
+    if template and not model:
+        from llm.cli import LoadTemplateError, load_template
+
+        try:
+            model = load_template(template).model
+        except LoadTemplateError:
+            pass
+    try:
+        return resolve_model(model).model_id
+    except PromptError:
+        return model or ""
+
+
+def default_model_options(model_id: str) -> Dict[str, Any]:
+    """Options saved with ``llm models options set`` for this model."""
+    from llm import cli
+
+    get_model_options = getattr(cli, "get_model_options", None)
+    if get_model_options is None:
+        return {}
+    return get_model_options(model_id) or {}
+
+
+def build_options(
+    model,
+    options: Optional[Dict[str, Any]] = None,
+    reasoning: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Validate options the same way ``llm prompt -o KEY VALUE`` does."""
+    merged: Dict[str, Any] = {str(k): v for k, v in (options or {}).items()}
+    if reasoning:
+        try:
+            merged["reasoning"] = json.dumps(reasoning)
+        except Exception:
+            merged.update({str(k): v for k, v in reasoning.items()})
+    for key, value in default_model_options(model.model_id).items():
+        merged.setdefault(key, value)
+    try:
+        validated = model.Options(**merged)
+    except pydantic.ValidationError as e:
+        raise PromptError(f"Invalid options: {e}")
+    return {key: value for key, value in validated if value is not None}
+
+
+def build_attachments(
+    attachments: Optional[List[str]] = None,
+    attachment_types: Optional[List[List[str]]] = None,
+) -> List[llm.Attachment]:
+    """Turn ``-a`` paths and ``--at`` (path, mimetype) pairs into attachments.
+
+    The web UI sends every upload in both lists, so a path is only attached
+    once, using the explicit mimetype when one was given.
+    """
+    types = {path: mimetype for path, mimetype in (attachment_types or [])}
+    resolved: List[llm.Attachment] = []
+    seen = set()
+    for path in [*(attachments or []), *types]:
+        if path in seen:
+            continue
+        seen.add(path)
+        if path.startswith(("http://", "https://")):
+            resolved.append(llm.Attachment(type=types.get(path), url=path))
+        else:
+            resolved.append(llm.Attachment(type=types.get(path), path=path))
+    return resolved
+
+
+def build_tools(names: Optional[List[str]] = None) -> list:
+    """Look up ``-T`` tool names among the tools registered by plugins."""
+    if not names:
+        return []
+    registered = llm.get_tools()
+    missing = [name for name in names if name not in registered]
+    if missing:
+        raise PromptError(
+            "Tool(s) {} not found. Available tools: {}".format(
+                ", ".join(missing), ", ".join(sorted(registered)) or "none"
+            )
+        )
+    tools = []
+    for name in names:
+        tool = registered[name]
+        # Toolboxes are registered as classes and need an instance
+        tools.append(tool() if inspect.isclass(tool) else tool)
+    return tools
+
+
+def apply_template(name: str, prompt: str, system: Optional[str]):
+    """Apply an ``llm`` template, returning (prompt, system, template)."""
+    from llm.cli import LoadTemplateError, load_template
+
+    try:
+        template = load_template(name)
+    except LoadTemplateError as e:
+        raise PromptError(str(e))
+    uses_input = "input" in template.vars()
+    try:
+        template_prompt, template_system = template.evaluate(
+            prompt if uses_input else "", {}
+        )
+    except template.MissingVariables as e:
+        raise PromptError(str(e))
+    if template_system and not system:
+        system = template_system
+    if template_prompt:
+        if prompt and not uses_input:
+            prompt = f"{template_prompt}\n{prompt}"
+        else:
+            prompt = template_prompt
+    return prompt, system, template
+
+
+def apply_template_defaults(
+    template: Optional[str],
+    prompt: str,
+    system: Optional[str],
+    model: Optional[str],
+    options: Optional[Dict[str, Any]],
+):
+    """Apply a template, if any, returning (prompt, system, model, options).
+
+    The template's model and options are used where the request has none.
+    """
+    if not template:
+        return prompt, system, model, options
+    prompt, system, template_obj = apply_template(template, prompt, system)
+    return (
+        prompt,
+        system,
+        model or template_obj.model,
+        {**(template_obj.options or {}), **(options or {})},
+    )
+
+
+def resolve_prompt(
+    prompt: str,
+    *,
+    model: Optional[str] = None,
+    system: Optional[str] = None,
+    template: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+    reasoning: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """What start_response would send the model, without running anything.
+
+    The prompt and system prompt come out with the template applied, and the
+    options merged with the template's and the model's saved defaults.
+    """
+    prompt, system, model, options = apply_template_defaults(
+        template, prompt, system, model, options
+    )
+    llm_model = resolve_model(model)
+    return {
+        "prompt": prompt,
+        "system": system,
+        "model": llm_model.model_id,
+        "options": build_options(llm_model, options, reasoning),
+    }
+
+
+def start_response(
+    prompt: str,
+    *,
+    model: Optional[str] = None,
+    conversation=None,
+    system: Optional[str] = None,
+    template: Optional[str] = None,
+    attachments: Optional[List[str]] = None,
+    attachment_types: Optional[List[List[str]]] = None,
+    tools: Optional[List[str]] = None,
+    options: Optional[Dict[str, Any]] = None,
+    reasoning: Optional[Dict[str, Any]] = None,
+    stream: bool = True,
+):
+    """Build a lazy llm response; the model runs when it is iterated.
+
+    Pass ``conversation`` to continue an existing llm conversation instead of
+    starting a new one.
+    """
+    prompt, system, model, options = apply_template_defaults(
+        template, prompt, system, model, options
+    )
+
+    if conversation is None:
+        conversation = resolve_model(model).conversation()
+    elif model:
+        conversation.model = resolve_model(model)
+    llm_model = conversation.model
+
+    kwargs: Dict[str, Any] = {
+        "system": system,
+        "stream": stream and llm_model.can_stream,
+        "options": build_options(llm_model, options, reasoning),
+    }
+    resolved_attachments = build_attachments(attachments, attachment_types)
+    if resolved_attachments:
+        kwargs["attachments"] = resolved_attachments
+    resolved_tools = build_tools(tools)
+    if resolved_tools:
+        return conversation.chain(prompt, tools=resolved_tools, **kwargs)
+    return conversation.prompt(prompt, **kwargs)
+
+
+def log_response(response):
+    """Write a finished response to the logs database, if logging is on."""
+    import sqlite_utils
+    from llm.cli import logs_db_path, logs_on
+    from llm.migrations import migrate
+
+    if not logs_on():
+        return
+    path = logs_db_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite_utils.Database(path)
+    try:
+        migrate(db)
+        response.log_to_db(db)
+    finally:
+        db.close()
+    logsdb.search_indexer.schedule(path)
+
+
+def iter_events(
+    response, cancelled: Optional[threading.Event] = None
+) -> Iterator[Tuple[str, Any]]:
+    """Yield ``(event, data)`` pairs from a response, logging it once it completes.
+
+    Text arrives as token events. After each model response in a tool chain
+    its tool calls and token usage follow. If ``cancelled`` is set the model
+    is abandoned before its next chunk and the partial response is not logged.
+    """
+    rounds = response.responses() if hasattr(response, "responses") else [response]
+    for round_response in rounds:
+        for chunk in round_response:
+            if cancelled is not None and cancelled.is_set():
+                return
+            yield events.TOKEN, chunk
+        for tool_call in round_response.tool_calls():
+            yield events.TOOL_CALL, {
+                "name": tool_call.name,
+                "arguments": tool_call.arguments,
+                "tool_call_id": tool_call.tool_call_id,
+            }
+        usage = round_response.usage()
+        if usage.input is not None or usage.output is not None:
+            yield events.USAGE, {
+                "input": usage.input,
+                "output": usage.output,
+                "details": usage.details,
+            }
+    log_response(response)
+
+
+def iter_response(response, cancelled: Optional[threading.Event] = None) -> Iterator[str]:
+    """Yield just the text chunks of a response; see iter_events."""
+    for event, data in iter_events(response, cancelled):
+        if event == events.TOKEN:
+            yield data
+
+
+def stream_events(
+    prompt: str, cancelled: Optional[threading.Event] = None, **kwargs
+) -> Iterator[Tuple[str, Any]]:
+    """Run a prompt, yielding typed events as the model produces them."""
+    yield from iter_events(start_response(prompt, **kwargs), cancelled)
+
+
+def stream_prompt(prompt: str, cancelled: Optional[threading.Event] = None, **kwargs) -> Iterator[str]:
+    """Run a prompt, yielding text chunks as the model produces them."""
+    yield from iter_response(start_response(prompt, **kwargs), cancelled)
+
+
+def run_prompt(prompt: str, **kwargs) -> str:
+    """Run a prompt to completion and return the full text."""
+    return "".join(stream_prompt(prompt, stream=False, **kwargs))
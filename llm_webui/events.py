@@ -0,0 +1,80 @@
+"""Typed stream events and their wire formats.
+
+Streaming endpoints produce ``(event, data)`` pairs. By default only the
+text reaches the client, as plain text with errors appended inline
+(``"\\nError: ..."``), exactly as before. Clients that send
+``Accept: text/event-stream`` get every event as a Server-Sent Event with
+a numeric id instead, so tokens, tool calls, usage, errors and completion
+arrive as separate, typed messages. The ids let a client that lost its
+connection resume from the last event it saw.
+"""
+
+import json
+from typing import Any, Optional
+
+# Waiting for a free slot: {"position"}, 1 being next in line
+QUEUED = "queued"
+# Which conversation a chat turn went to: {"conversation_id"}
+CONVERSATION = "conversation"
+# Text delta: data is the new text
+TOKEN = "token"
+# A tool the model asked to run: {"name", "arguments", "tool_call_id"}
+TOOL_CALL = "tool_call"
+# Token counts once a model response completes: {"input", "output", "details"}
+USAGE = "usage"
+# Something went wrong; data is the message. The stream then ends.
+ERROR = "error"
+# Always the last event: {"generation_id"}
+DONE = "done"
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+def wants_sse(accept: Optional[str]) -> bool:
+    """Whether an Accept header opts in to Server-Sent Events."""
+    if not accept:
+        return False
+    return any(
+        part.split(";")[0].strip().lower() == SSE_MEDIA_TYPE
+        for part in accept.split(",")
+    )
+
+
+def encode_text(event: str, data: Any) -> str:
+    """Plain-text form of an event; anything but text and errors is dropped."""
+    if event == TOKEN:
+        return data
+    if event == ERROR:
+        return f"\nError: {data}"
+    return ""
+
+
+def event_payload(event: str, data: Any) -> Any:
+    """The JSON-ready data of an event, as sent over SSE and WebSockets."""
+    if event == TOKEN:
+        return {"text": data}
+    if event == ERROR:
+        return {"message": data}
+    return data
+
+
+def encode_sse(event_id: int, event: str, data: Any) -> str:
+    """Format one event as an SSE message."""
+    # JSON keeps newlines in token text off the data: line
+    payload = json.dumps(event_payload(event, data), default=str)
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+
+
+async def encode_stream(records, sse: bool = False):
+    """Encode ``(id, event, data)`` records for a StreamingResponse.
+
+    Closing the result closes ``records`` too, which detaches the reader
+    from its generation when a client disconnects.
+    """
+    try:
+        async for event_id, event, data in records:
+            chunk = encode_sse(event_id, event, data) if sse else encode_text(event, data)
+            if chunk:
+                yield chunk
+    finally:
+        await records.aclose()
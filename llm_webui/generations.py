@@ -0,0 +1,321 @@
+"""Registry of running generations, so they can be cancelled and resumed.
+
+Every streamed prompt or chat turn gets an id (sent to the client in the
+``X-Generation-Id`` header). The model's events are pumped into a bounded
+replay buffer by a background task, and clients read from that buffer, so
+a client whose connection drops can reconnect and receive only the events
+it missed (``Last-Event-ID``) without re-running the prompt.
+
+Cancelling a generation terminates the llm child process, or stops the
+in-process engine before its next chunk. A generation nobody is reading
+is cancelled once ``resume_grace`` seconds pass without a reconnect.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from starlette.concurrency import iterate_in_threadpool
+
+from .events import DONE, ERROR, TOKEN
+
+
+# (id, event, data, size)
+Record = Tuple[int, str, Any, int]
+
+
+class ReplayExpired(Exception):
+    """The events a client asked to resume from are no longer buffered."""
+
+
+def stop_process(process: asyncio.subprocess.Process, grace: float = 5.0):
+    """Terminate a child process, killing it if it outlives ``grace`` seconds.
+
+    Doesn't wait, so it is safe to call from a cancelled task.
+    """
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+    except ProcessLookupError:
+        return
+
+    def kill():
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+
+    asyncio.get_running_loop().call_later(grace, kill)
+
+
+def record_size(event: str, data: Any) -> int:
+    """Rough memory cost of a buffered event, in characters."""
+    # Fixed overhead for the tuple, ids and event name
+    return 64 + len(data if event == TOKEN else str(data))
+
+
+class Generation:
+    def __init__(
+        self,
+        generation_id: str,
+        grace: float = 5.0,
+        buffer_size: int = 1024 * 1024,
+        resume_grace: float = 15.0,
+    ):
+        self.id = generation_id
+        self.grace = grace
+        self.buffer_size = buffer_size
+        self.resume_grace = resume_grace
+        self.started = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.cancelled = threading.Event()
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.task: Optional[asyncio.Task] = None
+        self.records: Deque[Record] = deque()
+        self.last_id = 0
+        self.buffered = 0
+        # Set once the final "done" event is buffered
+        self.done = False
+        # Reader -> id of the last event it received
+        self.readers: Dict[object, int] = {}
+        # Called when the generation is cancelled
+        self.cancel_callbacks: List[Callable[[], None]] = []
+        # Called with (id, event, data) for every event buffered
+        self.listeners: List[Callable[[int, str, Any], None]] = []
+        # Readers elsewhere (another server worker) keep it alive until then
+        self.held_until = 0.0
+        self._changed = asyncio.Event()
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def first_id(self) -> int:
+        """Id of the oldest buffered event."""
+        return self.records[0][0] if self.records else self.last_id + 1
+
+    def attach(self, process: asyncio.subprocess.Process):
+        """Associate the child process producing this generation."""
+        self.process = process
+        if self.cancelled.is_set():
+            stop_process(process, self.grace)
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.process is not None:
+            stop_process(self.process, self.grace)
+        for callback in self.cancel_callbacks:
+            callback()
+        # Wake a pump waiting for room in the buffer
+        self._notify()
+
+    async def pump(self, events):
+        """Buffer events from a sync or async event iterator until it ends."""
+        if not hasattr(events, "__aiter__"):
+            # In-process generators block, so pull them from a worker thread
+            events = iterate_in_threadpool(events)
+        try:
+            async for event, data in events:
+                await self._make_room(record_size(event, data))
+                self._append(event, data)
+        except Exception as e:
+            self._append(ERROR, str(e))
+        finally:
+            self._append(DONE, {"generation_id": self.id})
+            self.done = True
+            if self.finished_at is None:
+                self.finished_at = time.monotonic()
+            await events.aclose()
+
+    def check_resume(self, after: int):
+        """Raise unless a reader can pick up right after event ``after``."""
+        if after < 0 or after > self.last_id:
+            raise ValueError(f"Generation {self.id} has no event {after}")
+        if after < self.first_id - 1:
+            raise ReplayExpired(
+                f"Events up to {self.first_id - 1} of generation {self.id} are no longer buffered"
+            )
+
+    async def follow(self, after: int = 0):
+        """Yield ``(id, event, data)`` for every event after ``after``.
+
+        Waits for new events until ``done`` has been sent. While this
+        reader lags behind, the pump waits instead of dropping events it
+        hasn't seen, so a slow reader slows the model down too.
+        """
+        self.check_resume(after)
+        reader = object()
+        self.readers[reader] = after
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+        try:
+            while True:
+                changed = self._changed
+                position = self.readers[reader]
+                start = max(position - self.first_id + 1, 0)
+                for event_id, event, data, _ in list(itertools.islice(self.records, start, None)):
+                    self.readers[reader] = event_id
+                    yield event_id, event, data
+                    if event == DONE:
+                        return
+                if self.readers[reader] == position:
+                    if self.done and position >= self.last_id:
+                        # Everything, including "done", was trimmed away
+                        return
+                    await changed.wait()
+                else:
+                    # Let a pump blocked on this reader move on
+                    self._notify()
+        finally:
+            del self.readers[reader]
+            self._notify()
+            if not self.readers and not self.finished:
+                self._abandon_timer = asyncio.get_running_loop().call_later(
+                    self.resume_grace, self._abandon
+                )
+
+    def hold(self, seconds: float):
+        """Keep running for ``seconds`` even with no local reader attached."""
+        self.held_until = max(self.held_until, time.monotonic() + seconds)
+
+    def trim(self):
+        """Drop every buffered event no reader still needs."""
+        while self.records and not self._needed(self.records[0][0]):
+            self._evict_oldest()
+
+    def _abandon(self):
+        self._abandon_timer = None
+        if self.readers or self.finished:
+            return
+        remaining = self.held_until - time.monotonic()
+        if remaining > 0:
+            self._abandon_timer = asyncio.get_running_loop().call_later(remaining, self._abandon)
+        else:
+            self.cancel()
+
+    def _append(self, event: str, data: Any):
+        self.last_id += 1
+        size = record_size(event, data)
+        self.records.append((self.last_id, event, data, size))
+        self.buffered += size
+        for listener in self.listeners:
+            listener(self.last_id, event, data)
+        self._notify()
+
+    def _needed(self, event_id: int) -> bool:
+        return any(position < event_id for position in self.readers.values())
+
+    async def _make_room(self, size: int):
+        while self.records and self.buffered + size > self.buffer_size:
+            if self._needed(self.records[0][0]) and not self.cancelled.is_set():
+                await self._changed.wait()
+                continue
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        self.buffered -= self.records.popleft()[3]
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class GenerationRegistry:
+    def __init__(
+        self,
+        grace: float = 5.0,
+        max_age: float = 3600.0,
+        buffer_size: int = 1024 * 1024,
+        resume_grace: float = 15.0,
+        replay_ttl: float = 300.0,
+        replay_memory: int = 64 * 1024 * 1024,
+    ):
+        self.grace = grace
+        # Entries whose stream never started are dropped after this long
+        self.max_age = max_age
+        self.buffer_size = buffer_size
+        self.resume_grace = resume_grace
+        # Finished generations stay replayable this long, within replay_memory
+        self.replay_ttl = replay_ttl
+        self.replay_memory = replay_memory
+        self._generations: Dict[str, Generation] = {}
+        self._lock = threading.Lock()
+        # Called with every new generation
+        self.start_callbacks: List[Callable[[Generation], None]] = []
+
+    def __contains__(self, generation_id):
+        return generation_id in self._generations
+
+    def start(self) -> Generation:
+        generation = Generation(
+            uuid.uuid4().hex,
+            grace=self.grace,
+            buffer_size=self.buffer_size,
+            resume_grace=self.resume_grace,
+        )
+        with self._lock:
+            self._prune()
+            self._generations[generation.id] = generation
+        for callback in self.start_callbacks:
+            callback(generation)
+        return generation
+
+    def run(self, generation: Generation, events):
+        """Start pumping ``events`` into the generation's replay buffer."""
+        generation.task = asyncio.ensure_future(generation.pump(events))
+        generation.task.add_done_callback(lambda task: self.finish(generation))
+
+    def get(self, generation_id: str) -> Optional[Generation]:
+        return self._generations.get(generation_id)
+
+    def running(self) -> List[Generation]:
+        return [g for g in list(self._generations.values()) if not g.finished]
+
+    def finish(self, generation: Optional[Generation]):
+        """Mark a generation as no longer running; its buffer stays replayable."""
+        if generation is None:
+            return
+        if generation.finished_at is None:
+            generation.finished_at = time.monotonic()
+        with self._lock:
+            self._prune()
+
+    def _prune(self):
+        now = time.monotonic()
+        for generation in list(self._generations.values()):
+            if generation.finished:
+                expired = now - generation.finished_at >= self.replay_ttl
+            else:
+                expired = generation.task is None and now - generation.started >= self.max_age
+            if expired:
+                del self._generations[generation.id]
+
+        # Over the memory cap: drop finished generations, oldest first, then
+        # trim what running generations' readers have already received
+        total = sum(g.buffered for g in self._generations.values())
+        if total <= self.replay_memory:
+            return
+        finished = sorted(
+            (g for g in self._generations.values() if g.finished and not g.readers),
+            key=lambda g: g.finished_at,
+        )
+        for generation in finished:
+            if total <= self.replay_memory:
+                return
+            total -= generation.buffered
+            del self._generations[generation.id]
+        for generation in self._generations.values():
+            if total <= self.replay_memory:
+                return
+            before = generation.buffered
+            generation.trim()
+            total -= before - generation.buffered
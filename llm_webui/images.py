@@ -0,0 +1,144 @@
+"""Downscaled, re-encoded variants of image attachments.
+
+Screenshots are often 4K PNGs of several megabytes, far more than models
+look at. Before a prompt is sent, stored image attachments larger than the
+model's maximum dimension are scaled down, and PNGs re-encoded as WebP
+(JPEGs stay JPEG). Each variant is cached next to the original in the
+attachment store, so the work is done once per image and size.
+
+Needs Pillow (``pip install llm-webui[images]``); without it, and with
+``LLM_WEBUI_IMAGE_MAX_DIMENSION`` at 0, originals are sent unchanged.
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+logger = logging.getLogger(__name__)
+
+# Formats a variant is written in, by the format of the original
+VARIANT_FORMATS = {"JPEG": ("JPEG", "image/jpeg", "jpg"), "PNG": ("WEBP", "image/webp", "webp")}
+DEFAULT_VARIANT_FORMAT = ("WEBP", "image/webp", "webp")
+QUALITY = 85
+
+# Resizing and encoding are CPU-bound but release the GIL, so a few threads
+# of their own keep them off the event loop and the request thread pool
+_executor: Optional[ThreadPoolExecutor] = None
+_pending: Dict[Path, "asyncio.Future"] = {}
+# Images found not to need a variant at a given size, least recently
+# checked first; only the newest SKIPPED_LIMIT are remembered
+_skipped: "OrderedDict[Path, None]" = OrderedDict()
+SKIPPED_LIMIT = 4096
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def parse_dimensions(spec: str) -> Dict[str, int]:
+    """Parse ``"model=1568,other-model=2048"`` into a dict."""
+    dimensions = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        model, _, value = item.rpartition("=")
+        if not model.strip() or not value.strip().isdigit():
+            raise ValueError(f"Expected model=pixels, got {item.strip()!r}")
+        dimensions[model.strip()] = int(value)
+    return dimensions
+
+
+def variant_path(original: Path, max_dimension: int, extension: str) -> Path:
+    return original.with_name(f"{original.name}.{max_dimension}.{extension}")
+
+
+def make_variant(original: Path, max_dimension: int) -> Optional[Tuple[Path, str]]:
+    """Return (path, mimetype) of a smaller copy of an image, creating it if needed.
+
+    None when ``original`` isn't an image Pillow can read, or when no
+    smaller copy is worth sending. Other OSErrors (a full disk, the original
+    collected meanwhile) are raised: they say nothing about the image.
+    """
+    try:
+        with Image.open(original) as image:
+            source_format = image.format
+            variant_format, mimetype, extension = VARIANT_FORMATS.get(
+                source_format, DEFAULT_VARIANT_FORMAT
+            )
+            path = variant_path(original, max_dimension, extension)
+            if path.exists():
+                return path, mimetype
+            oversized = max(image.size) > max_dimension
+            if not oversized and source_format != "PNG":
+                return None
+            if getattr(image, "is_animated", False):
+                # Only the first frame would survive
+                return None
+            image.load()
+            if oversized:
+                image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            if variant_format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            # Written under a temporary name, so readers never see half a file
+            fd, tmp = tempfile.mkstemp(dir=original.parent, suffix=f".{extension}")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    image.save(f, variant_format, quality=QUALITY)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+    except (Image.UnidentifiedImageError, ValueError, Image.DecompressionBombError) as e:
+        logger.debug("Not an image we can downscale: %s (%s)", original, e)
+        return None
+    if os.path.getsize(tmp) >= os.path.getsize(original):
+        # The original is already compact
+        os.unlink(tmp)
+        return None
+    os.replace(tmp, path)
+    return path, mimetype
+
+
+async def prepare(original: Path, max_dimension: int) -> Optional[Tuple[Path, str]]:
+    """Like make_variant, run in the image thread pool.
+
+    Concurrent requests for the same variant share one conversion.
+    """
+    global _executor
+    if Image is None or max_dimension <= 0:
+        return None
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="llm-webui-images"
+        )
+    key = variant_path(original, max_dimension, "")
+    if key in _skipped:
+        _skipped.move_to_end(key)
+        return None
+    future = _pending.get(key)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(_executor, make_variant, original, max_dimension)
+        _pending[key] = future
+        future.add_done_callback(lambda _: _pending.pop(key, None))
+    try:
+        variant = await asyncio.shield(future)
+    except OSError as e:
+        # Sent as uploaded this time; the next prompt tries again
+        logger.warning("Could not downscale %s: %s", original, e)
+        return None
+    if variant is None:
+        _skipped[key] = None
+        while len(_skipped) > SKIPPED_LIMIT:
+            _skipped.popitem(last=False)
+    return variant
@@ -0,0 +1,696 @@
+"""Direct queries against the llm logs database.
+
+Older llm releases log each exchange to the ``responses`` table, grouped by
+``conversation_id``; newer ones write ``turns`` grouped by ``thread_id``,
+with the prompt and response text in ``turn_search``. The queries here read
+whichever of those exist, so the web UI never has to dump the whole log
+through ``llm logs list``.
+
+Listings are paginated with keyset cursors on (datetime_utc, id), so an old
+page of logs costs the same to fetch as the first one.
+"""
+
+import base64
+import html
+import json
+import re
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import llm
+
+
+# Indexes the keyset queries rely on: (table, index name, columns)
+INDEXES = [
+    ("responses", "idx_llm_webui_responses_datetime_utc_id", "datetime_utc, id"),
+    ("responses", "idx_llm_webui_responses_conversation_id", "conversation_id, datetime_utc"),
+    ("turns", "idx_llm_webui_turns_datetime_utc_id", "datetime_utc, id"),
+    ("turns", "idx_llm_webui_turns_thread_id_datetime_utc", "thread_id, datetime_utc"),
+]
+
+_indexed_paths = set()
+
+EXCHANGE_COLUMNS = [
+    "id",
+    "conversation_id",
+    "datetime_utc",
+    "model",
+    "prompt",
+    "system",
+    "response",
+    "input_tokens",
+    "output_tokens",
+    "duration_ms",
+]
+
+
+class InvalidCursor(ValueError):
+    """Raised for a pagination cursor this module did not produce."""
+
+
+def logs_db_path() -> Path:
+    """Same location ``llm logs path`` reports."""
+    return llm.user_dir() / "logs.db"
+
+
+def connect(path: Optional[Path] = None) -> Optional[sqlite3.Connection]:
+    """Open the logs database read-only, or return None if it doesn't exist."""
+    path = Path(path or logs_db_path())
+    if not path.exists():
+        return None
+    ensure_indexes(path)
+    conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def ensure_indexes(path: Path):
+    """Create the pagination indexes once per database per process.
+
+    Failures (a read-only file, a locked database) are ignored; queries still
+    work, just without the index.
+    """
+    key = str(Path(path).resolve())
+    if key in _indexed_paths:
+        return
+    try:
+        conn = sqlite3.connect(str(path))
+        try:
+            tables = table_names(conn)
+            for table, name, columns in INDEXES:
+                if table in tables:
+                    conn.execute(f"create index if not exists [{name}] on [{table}] ({columns})")
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return
+    _indexed_paths.add(key)
+
+
+def table_names(conn: sqlite3.Connection) -> set:
+    return {
+        row[0]
+        for row in conn.execute("select name from sqlite_master where type in ('table', 'view')")
+    }
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int = 2) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    return values
+
+
+def limit_clause(limit: Optional[int], params: List[Any]) -> str:
+    """SQL fetching one row more than a page, so the caller knows if there's another.
+
+    A ``limit`` of None or 0 fetches every row.
+    """
+    if not limit:
+        return ""
+    params.append(limit + 1)
+    return " limit ?"
+
+
+def split_page(rows: List[Any], limit: Optional[int], *key: str) -> Tuple[List[Any], Optional[str]]:
+    """Trim rows fetched with limit_clause to the page, and the cursor for the next."""
+    if not limit or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*(rows[-1][name] for name in key))
+
+
+def exchange_selects(conn: sqlite3.Connection) -> List[str]:
+    """SQL selecting one row per logged prompt/response, per schema.
+
+    Columns: id, conversation_id, datetime_utc, model, prompt, system,
+    response, input_tokens, output_tokens, duration_ms.
+    """
+    tables = table_names(conn)
+    selects = []
+    if "responses" in tables:
+        # Token counts and durations only exist in newer releases
+        present = {row[1] for row in conn.execute("pragma table_info(responses)")}
+        columns = ", ".join(
+            column if column in present else f"null as {column}"
+            for column in EXCHANGE_COLUMNS
+        )
+        selects.append(f"select {columns} from responses")
+    if {"turns", "turn_search"} <= tables:
+        sql = (
+            "select turns.id, turns.thread_id as conversation_id, turns.datetime_utc,"
+            " turns.model, turn_search.prompt, null as system, turn_search.response,"
+            " turns.input_tokens, turns.output_tokens, turns.duration_ms"
+            " from turns left join turn_search on turn_search.turn_id = turns.id"
+        )
+        if "responses" in tables:
+            # Skip turns that were also written to responses during migration
+            sql += " where turns.id not in (select id from responses)"
+        selects.append(sql)
+    return selects
+
+
+def exchanges_sql(conn: sqlite3.Connection) -> Optional[str]:
+    """All exchanges from every schema as a single compound select."""
+    selects = exchange_selects(conn)
+    if not selects:
+        return None
+    return " union all ".join(selects)
+
+
+def list_logs(
+    count: Optional[int] = 5, cursor: Optional[str] = None, path: Optional[Path] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """A page of logged exchanges, newest first, and the cursor for the next.
+
+    A ``count`` of None or 0 returns every exchange, as ``llm logs list -n 0`` does.
+    """
+    conn = connect(path)
+    if conn is None:
+        return [], None
+    try:
+        where = ""
+        params: List[Any] = []
+        if cursor:
+            where = "where (datetime_utc, id) < (?, ?)"
+            params.extend(decode_cursor(cursor))
+        limit_sql = limit_clause(count, params)
+        # Page each schema separately so each query walks its index in order
+        rows = []
+        for select in exchange_selects(conn):
+            sql = (
+                f"select * from ({select}) {where}"
+                f" order by datetime_utc desc, id desc{limit_sql}"
+            )
+            rows.extend(dict(row) for row in conn.execute(sql, params))
+    finally:
+        conn.close()
+    rows.sort(key=lambda row: (row["datetime_utc"] or "", row["id"]), reverse=True)
+    return split_page(rows, count, "datetime_utc", "id")
+
+
+def conversation_groups(conn: sqlite3.Connection) -> List[str]:
+    """SQL grouping each schema's exchanges by conversation.
+
+    Columns: conversation_id, latest, count. Only columns in the
+    (conversation, datetime_utc) indexes are read, so the grouping walks the
+    index instead of sorting every logged exchange.
+    """
+    tables = table_names(conn)
+    selects = []
+    if "responses" in tables:
+        selects.append(
+            "select conversation_id, max(datetime_utc) as latest, count(*) as count"
+            " from responses where conversation_id is not null group by conversation_id"
+        )
+    if {"turns", "turn_search"} <= tables:
+        sql = (
+            "select thread_id as conversation_id, max(datetime_utc) as latest, count(*) as count"
+            " from turns where thread_id is not null"
+        )
+        if "responses" in tables:
+            # Skip turns that were also written to responses during migration
+            sql += " and id not in (select id from responses)"
+        selects.append(sql + " group by thread_id")
+    return selects
+
+
+def latest_exchange(conn: sqlite3.Connection, conversation_id: str) -> Optional[sqlite3.Row]:
+    """The newest exchange of a conversation, from whichever schema has it."""
+    latest = None
+    for select in exchange_selects(conn):
+        row = conn.execute(
+            f"select * from ({select}) where conversation_id = ?"
+            " order by datetime_utc desc, id desc limit 1",
+            [conversation_id],
+        ).fetchone()
+        if row is not None and (
+            latest is None or (row["datetime_utc"] or "", row["id"]) > (latest["datetime_utc"] or "", latest["id"])
+        ):
+            latest = row
+    return latest
+
+
+def list_conversations(
+    limit: Optional[int] = 50, cursor: Optional[str] = None, path: Optional[Path] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """A page of conversations, most recently active first.
+
+    Each item has conversation_id, latest, model, count and last_prompt
+    (model and last_prompt come from the latest exchange). Returns the items
+    and the cursor for the next page, or None on the last page. A ``limit``
+    of None or 0 returns every conversation.
+    """
+    conn = connect(path)
+    if conn is None:
+        return [], None
+    try:
+        groups = conversation_groups(conn)
+        if not groups:
+            return [], None
+        params: List[Any] = []
+        having = ""
+        if cursor:
+            having = "having (latest, conversation_id) < (?, ?)"
+            params.extend(decode_cursor(cursor))
+        # Grouped per schema first, then merged: a conversation can span
+        # both during a migration
+        sql = f"""
+            select conversation_id, max(latest) as latest, sum(count) as count
+            from ({" union all ".join(groups)})
+            group by conversation_id
+            {having}
+            order by latest desc, conversation_id desc
+        """
+        sql += limit_clause(limit, params)
+        rows = [dict(row) for row in conn.execute(sql, params)]
+        rows, next_cursor = split_page(rows, limit, "latest", "conversation_id")
+        # Model and prompt text only for the conversations on this page
+        for row in rows:
+            latest = latest_exchange(conn, row["conversation_id"])
+            row["model"] = latest["model"] if latest else None
+            row["last_prompt"] = latest["prompt"] if latest else None
+    finally:
+        conn.close()
+    return rows, next_cursor
+
+
+def conversation_messages(
+    conversation_id: str,
+    limit: Optional[int] = 50,
+    cursor: Optional[str] = None,
+    path: Optional[Path] = None,
+    after_id: Optional[str] = None,
+    since: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """A page of one conversation's exchanges, newest first.
+
+    Pass the returned cursor back for the page of older exchanges; it is
+    None once the first exchange has been returned. A ``limit`` of None or
+    0 returns every exchange at once. ``after_id`` (an
+    exchange id) and ``since`` (a datetime_utc) leave out the exchanges up
+    to and including that point, so a client only fetches what is new.
+    """
+    conn = connect(path)
+    if conn is None:
+        return [], None
+    try:
+        selects = exchange_selects(conn)
+        where = "where conversation_id = ?"
+        params: List[Any] = [conversation_id]
+        if after_id:
+            anchor = None
+            for select in selects:
+                anchor = conn.execute(
+                    f"select datetime_utc, id from ({select}) where conversation_id = ? and id = ?",
+                    [conversation_id, after_id],
+                ).fetchone()
+                if anchor is not None:
+                    break
+            if anchor is None:
+                raise InvalidCursor(f"No exchange {after_id} in conversation {conversation_id}")
+            where += " and (datetime_utc, id) > (?, ?)"
+            params.extend(anchor)
+        if since:
+            where += " and datetime_utc > ?"
+            params.append(since)
+        if cursor:
+            where += " and (datetime_utc, id) < (?, ?)"
+            params.extend(decode_cursor(cursor))
+        limit_sql = limit_clause(limit, params)
+        rows = []
+        for select in selects:
+            sql = (
+                f"select * from ({select}) {where}"
+                f" order by datetime_utc desc, id desc{limit_sql}"
+            )
+            rows.extend(dict(row) for row in conn.execute(sql, params))
+    finally:
+        conn.close()
+    rows.sort(key=lambda row: (row["datetime_utc"] or "", row["id"]), reverse=True)
+    return split_page(rows, limit, "datetime_utc", "id")
+
+
+def conversation_version(conversation_id: str, path: Optional[Path] = None) -> Optional[str]:
+    """An ETag for a conversation: its latest exchange id and exchange count.
+
+    None if nothing of the conversation has been logged.
+    """
+    conn = connect(path)
+    if conn is None:
+        return None
+    try:
+        latest = []
+        count = 0
+        for select in exchange_selects(conn):
+            row = conn.execute(
+                f"select datetime_utc, id, (select count(*) from ({select}) where conversation_id = ?)"
+                f" from ({select}) where conversation_id = ?"
+                " order by datetime_utc desc, id desc limit 1",
+                [conversation_id, conversation_id],
+            ).fetchone()
+            if row is not None:
+                latest.append((row[0] or "", row[1]))
+                count += row[2]
+    finally:
+        conn.close()
+    if not latest:
+        return None
+    return f'"{max(latest)[1]}-{count}"'
+
+
+def count_exchanges(conversation_id: str, path: Optional[Path] = None) -> int:
+    """How many exchanges of a conversation have been logged."""
+    conn = connect(path)
+    if conn is None:
+        return 0
+    try:
+        tables = table_names(conn)
+        counts = [0]
+        if "responses" in tables:
+            counts.append(conn.execute(
+                "select count(*) from responses where conversation_id = ?", [conversation_id]
+            ).fetchone()[0])
+        if "turns" in tables:
+            counts.append(conn.execute(
+                "select count(*) from turns where thread_id = ?", [conversation_id]
+            ).fetchone()[0])
+    finally:
+        conn.close()
+    return max(counts)
+
+
+# Full-text search over prompts, responses and system prompts. The index is
+# owned by the web UI and kept up to date incrementally from a background
+# thread: each source table remembers the highest rowid already indexed.
+# search() only ever reads it.
+#
+# The index is contentless, so it adds only the term index to logs.db, not
+# another copy of every prompt and response. Its rowid encodes where an
+# exchange came from (source rowid * len(SEARCH_SOURCES) + source number);
+# results and their snippets are read back from the source rows. Word
+# positions aren't kept (detail=column), which roughly pays for the prefix
+# indexes that keep short prefix searches fast; queries are built from
+# single words, so no phrase search needs the positions.
+SEARCH_TABLE = "llm_webui_search"
+SEARCH_STATE_TABLE = "llm_webui_search_state"
+SEARCH_SOURCES = ("responses", "turn_search")
+
+# Only this many of the newest matches are ranked, so a query matching most
+# of the log costs no more than a rare one
+SEARCH_RANK_WINDOW = 2000
+# Words of context in a snippet
+SNIPPET_WORDS = 16
+
+SEARCH_TABLE_OPTIONS = "content='', detail=column, prefix='2 3'"
+
+_search_lock = threading.Lock()
+# Roughly what the unicode61 tokenizer counts as one word
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def search_sources(tables: set) -> Dict[str, Tuple[str, str]]:
+    """Per source: SQL selecting its exchanges, and the column of its rowid.
+
+    Add a ``where`` on the rowid column to pick rows.
+    """
+    sources = {}
+    if "responses" in tables:
+        sources["responses"] = (
+            """
+            select rowid, id, conversation_id, model, datetime_utc, prompt, response, system
+            from responses
+            """,
+            "rowid",
+        )
+    if {"turns", "turn_search"} <= tables:
+        skip_dual_written = (
+            "and turns.id not in (select id from responses)" if "responses" in tables else ""
+        )
+        sources["turn_search"] = (
+            f"""
+            select turn_search.id as rowid, turns.id, turns.thread_id as conversation_id,
+                turns.model, turns.datetime_utc, turn_search.prompt, turn_search.response,
+                null as system
+            from turn_search join turns on turns.id = turn_search.turn_id {skip_dual_written}
+            """,
+            "turn_search.id",
+        )
+    return sources
+
+
+def create_search_index(conn: sqlite3.Connection):
+    """Create the index tables, replacing an index from an older release."""
+    row = conn.execute(
+        "select sql from sqlite_master where name = ?", [SEARCH_TABLE]
+    ).fetchone()
+    if row is not None and SEARCH_TABLE_OPTIONS not in row[0]:
+        # Built by an older release (one kept a full copy of the text)
+        conn.execute(f"drop table [{SEARCH_TABLE}]")
+        conn.execute(f"drop table if exists [{SEARCH_STATE_TABLE}]")
+    conn.execute(f"""
+        create virtual table if not exists [{SEARCH_TABLE}] using fts5(
+            prompt, response, system,
+            {SEARCH_TABLE_OPTIONS},
+            tokenize = 'porter unicode61'
+        )
+    """)
+    conn.execute(
+        f"create table if not exists [{SEARCH_STATE_TABLE}]"
+        " (source text primary key, last_rowid integer)"
+    )
+
+
+def sync_search_index(path: Optional[Path] = None, batch_size: int = 5000) -> int:
+    """Index exchanges logged since the last sync; returns how many were added.
+
+    Each batch is its own write transaction that re-reads the indexed rowid,
+    so several processes syncing the same database never index a row twice.
+    """
+    path = Path(path or logs_db_path())
+    if not path.exists():
+        return 0
+    added = 0
+    with _search_lock, closing(sqlite3.connect(str(path), isolation_level=None)) as conn:
+        conn.row_factory = sqlite3.Row
+        conn.execute("begin immediate")
+        try:
+            create_search_index(conn)
+            conn.execute("commit")
+        except BaseException:
+            conn.execute("rollback")
+            raise
+        for source, (select, rowid) in search_sources(table_names(conn)).items():
+            number = SEARCH_SOURCES.index(source)
+            sql = f"{select} where {rowid} > ? order by {rowid} limit ?"
+            while True:
+                conn.execute("begin immediate")
+                try:
+                    row = conn.execute(
+                        f"select last_rowid from [{SEARCH_STATE_TABLE}] where source = ?", [source]
+                    ).fetchone()
+                    rows = conn.execute(sql, [row[0] if row else 0, batch_size]).fetchall()
+                    if rows:
+                        conn.executemany(
+                            f"insert into [{SEARCH_TABLE}] (rowid, prompt, response, system)"
+                            " values (?, ?, ?, ?)",
+                            [
+                                (r["rowid"] * len(SEARCH_SOURCES) + number,
+                                 r["prompt"], r["response"], r["system"])
+                                for r in rows
+                            ],
+                        )
+                        conn.execute(
+                            f"insert or replace into [{SEARCH_STATE_TABLE}] (source, last_rowid) values (?, ?)",
+                            [source, rows[-1]["rowid"]],
+                        )
+                    conn.execute("commit")
+                except BaseException:
+                    conn.execute("rollback")
+                    raise
+                if not rows:
+                    break
+                added += len(rows)
+    return added
+
+
+class SearchIndexer:
+    """Runs sync_search_index in a background thread when asked to.
+
+    Requests made while a sync is running are coalesced into one more pass,
+    so logging many exchanges in a row never queues up many syncs.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending: Dict[str, Path] = {}
+        self._running = False
+
+    def schedule(self, path: Optional[Path] = None):
+        path = Path(path or logs_db_path())
+        with self._condition:
+            self._pending[str(path)] = path
+            if self._running:
+                return
+            self._running = True
+        threading.Thread(target=self._run, name="llm-webui-search-index", daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._pending:
+                    self._running = False
+                    self._condition.notify_all()
+                    return
+                paths = list(self._pending.values())
+                self._pending.clear()
+            for path in paths:
+                try:
+                    sync_search_index(path)
+                except sqlite3.Error:
+                    # Locked or read-only: the next schedule() tries again
+                    pass
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until no sync is running or pending; False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._running, timeout)
+
+
+search_indexer = SearchIndexer()
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, the last as a prefix.
+
+    A single-letter last word is matched whole; as a prefix it would match
+    most of the index.
+    """
+    words = _WORD_RE.findall(text)
+    terms = [f'"{word}"' for word in words]
+    if terms and len(words[-1]) > 1:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def snippet(text: Optional[str], words: List[str], size: int = SNIPPET_WORDS) -> Optional[str]:
+    """HTML-escaped excerpt of ``text`` around the first match, matches in <mark>.
+
+    A word matches when it starts with one of ``words`` (lowercased), which
+    covers the prefix term and most of what the porter stemmer matches.
+    """
+    if text is None:
+        return None
+    tokens = list(_WORD_RE.finditer(text))
+    matches = [
+        i for i, token in enumerate(tokens)
+        if any(token.group().lower().startswith(word) for word in words)
+    ]
+    first = matches[0] if matches else 0
+    start = max(0, min(first - size // 4, len(tokens) - size))
+    window = tokens[start:start + size]
+    if not window:
+        return html.escape(text, quote=False)
+    end = start + len(window)
+    position = 0 if start == 0 else window[0].start()
+    parts = ["…" if start > 0 else ""]
+    for i, token in enumerate(window, start):
+        parts.append(html.escape(text[position:token.start()], quote=False))
+        word = html.escape(token.group(), quote=False)
+        parts.append(f"<mark>{word}</mark>" if i in matches else word)
+        position = token.end()
+    if end < len(tokens):
+        parts.append("…")
+    else:
+        parts.append(html.escape(text[position:], quote=False))
+    return "".join(parts)
+
+
+def search_rows(conn: sqlite3.Connection, rowids: List[int]) -> Dict[int, sqlite3.Row]:
+    """The source rows behind index rowids, keyed by index rowid."""
+    wanted: Dict[str, List[int]] = {}
+    for rowid in rowids:
+        source = SEARCH_SOURCES[rowid % len(SEARCH_SOURCES)]
+        wanted.setdefault(source, []).append(rowid // len(SEARCH_SOURCES))
+    found = {}
+    for source, (select, rowid_column) in search_sources(table_names(conn)).items():
+        ids = wanted.get(source)
+        if not ids:
+            continue
+        number = SEARCH_SOURCES.index(source)
+        placeholders = ", ".join("?" for _ in ids)
+        for row in conn.execute(f"{select} where {rowid_column} in ({placeholders})", ids):
+            found[row["rowid"] * len(SEARCH_SOURCES) + number] = row
+    return found
+
+
+def search(
+    q: str, limit: int = 20, cursor: Optional[str] = None, path: Optional[Path] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Ranked full-text search over logged prompts, responses and system prompts.
+
+    Snippets are HTML-escaped with matches wrapped in <mark>. Returns a page
+    of results and the cursor for the next page. Only the newest
+    SEARCH_RANK_WINDOW matches are ranked and paged through.
+    """
+    query = fts_query(q)
+    if not query:
+        return [], None
+    offset = decode_cursor(cursor, size=1)[0] if cursor else 0
+    if not isinstance(offset, int) or offset < 0:
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    path = Path(path or logs_db_path())
+    # Picks up exchanges other processes logged; this page is served from
+    # the index as it stands
+    search_indexer.schedule(path)
+    conn = connect(path)
+    if conn is None:
+        return [], None
+    with closing(conn):
+        if SEARCH_TABLE not in table_names(conn):
+            return [], None
+        # Newest matches first walks the index in rowid order and stops at
+        # the window; bm25 is then computed for those rows only
+        rowids = [
+            row[0]
+            for row in conn.execute(
+                f"""
+                select rowid from (
+                    select rowid, rank from [{SEARCH_TABLE}]
+                    where [{SEARCH_TABLE}] match ?
+                    order by rowid desc
+                    limit ?
+                )
+                order by rank
+                limit ? offset ?
+                """,
+                [query, SEARCH_RANK_WINDOW, limit + 1, offset],
+            )
+        ]
+        rows = search_rows(conn, rowids[:limit])
+    words = [word.lower() for word in _WORD_RE.findall(q)]
+    results = []
+    for rowid in rowids[:limit]:
+        row = rows.get(rowid)
+        if row is None:
+            # Deleted from the log since it was indexed
+            continue
+        result = {name: row[name] for name in ("id", "conversation_id", "model", "datetime_utc")}
+        for name in ("prompt", "response", "system"):
+            result[name] = snippet(row[name], words)
+        results.append(result)
+    next_cursor = encode_cursor(offset + limit) if len(rowids) > limit else None
+    return results, next_cursor
@@ -0,0 +1,128 @@
+"""Several chat generations multiplexed over one WebSocket.
+
+The client tags every request with its own stream id and the server tags
+every event it sends back with the same id, so one connection per browser
+tab can carry any number of concurrent chat turns::
+
+    -> {"type": "chat", "stream": "s1", "message": "Hi", "conversation_id": ...}
+    <- {"stream": "s1", "event": "started", "data": {"generation_id": ...}}
+    <- {"stream": "s1", "id": 1, "event": "conversation", "data": {...}}
+    <- {"stream": "s1", "id": 2, "event": "token", "data": {"text": "Hel"}}
+    -> {"type": "pause", "stream": "s1"}     # stop reading from the model
+    -> {"type": "resume", "stream": "s1"}
+    -> {"type": "cancel", "stream": "s1"}
+    <- {"stream": "s1", "id": 9, "event": "done", "data": {...}}
+
+After a reconnect, ``{"type": "attach", "stream": "s2", "generation": ...,
+"after": 4}`` picks a generation back up from its replay buffer.
+
+Event names, ids and payloads are the same as the SSE mode of /api/chat.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set
+
+from starlette.websockets import WebSocket
+
+from .events import ERROR, event_payload
+from .generations import Generation
+
+
+logger = logging.getLogger(__name__)
+
+
+class MultiplexError(Exception):
+    """A client message that cannot be acted on; reported back as an error event."""
+
+
+class MuxStream:
+    def __init__(self, stream_id: str, generation: Generation):
+        self.id = stream_id
+        self.generation = generation
+        # Cleared while the client has paused the stream
+        self.flowing = asyncio.Event()
+        self.flowing.set()
+        self.task: Optional[asyncio.Task] = None
+
+
+class StreamMultiplexer:
+    def __init__(self, websocket: WebSocket, max_streams: int = 8):
+        self.websocket = websocket
+        self.max_streams = max_streams
+        self.streams: Dict[str, MuxStream] = {}
+        self.closed = False
+        self._send_lock = asyncio.Lock()
+        # Streams still winding down after the socket closed
+        self._orphans: Set[asyncio.Task] = set()
+
+    async def send(self, stream_id: Optional[str], event: str, data: Any, event_id: Optional[int] = None):
+        if self.closed:
+            return
+        message = {"stream": stream_id, "event": event, "data": event_payload(event, data)}
+        if event_id is not None:
+            message["id"] = event_id
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    def start(self, stream_id: str, generation: Generation, after: int = 0):
+        """Send the events of ``generation`` after ``after`` as stream ``stream_id``."""
+        if stream_id in self.streams:
+            raise MultiplexError(f"Stream {stream_id} is already running")
+        if len(self.streams) >= self.max_streams:
+            raise MultiplexError(f"Too many concurrent streams (max {self.max_streams})")
+        stream = MuxStream(stream_id, generation)
+        self.streams[stream_id] = stream
+        stream.task = asyncio.ensure_future(self._run(stream, after))
+
+    def cancel(self, stream_id: str):
+        stream = self._get(stream_id)
+        stream.generation.cancel()
+        # A paused stream has to run on to notice the cancellation
+        stream.flowing.set()
+
+    def pause(self, stream_id: str):
+        self._get(stream_id).flowing.clear()
+
+    def resume(self, stream_id: str):
+        self._get(stream_id).flowing.set()
+
+    def close(self):
+        """Stop sending; called once the socket has gone away.
+
+        The generations keep running for a while, in case the client
+        reconnects and attaches to them again.
+        """
+        self.closed = True
+        for stream in list(self.streams.values()):
+            stream.task.cancel()
+            self._orphans.add(stream.task)
+            stream.task.add_done_callback(self._orphans.discard)
+
+    def _get(self, stream_id: str) -> MuxStream:
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            raise MultiplexError(f"No running stream: {stream_id}")
+        return stream
+
+    async def _run(self, stream: MuxStream, after: int):
+        records = stream.generation.follow(after)
+        try:
+            await self.send(stream.id, "started", {"generation_id": stream.generation.id})
+            async for event_id, event, data in records:
+                # Backpressure: a paused stream stops reading the replay
+                # buffer, and once that fills up the model waits too
+                await stream.flowing.wait()
+                await self.send(stream.id, event, data, event_id)
+        except Exception as e:
+            # Usually the socket closing under us
+            logger.debug("Stream %s ended: %s", stream.id, e)
+            try:
+                await self.send(stream.id, ERROR, str(e))
+            except Exception:
+                pass
+        finally:
+            self.streams.pop(stream.id, None)
+            # Detaches from the generation, which is then cancelled unless
+            # another reader attaches within the resume grace period
+            await records.aclose()
@@ -2,7 +2,6 @@
 
 import click
 import llm
-from .server import start_server
 
 
 @llm.hookimpl
@@ -29,7 +28,33 @@ def register_commands(cli):
         is_flag=True, 
         help="Enable debug mode"
     )
-    def webui_command(host, port, reload, debug):
+    @click.option(
+        "--backend",
+        type=click.Choice(["inprocess", "subprocess"]),
+        default=None,
+        help="Run prompts via the llm Python API (inprocess, default) or the llm CLI (subprocess)"
+    )
+    @click.option(
+        "--workers",
+        type=click.IntRange(min=1),
+        default=None,
+        help="Number of server processes to run (cannot be combined with --reload)"
+    )
+    def webui_command(host, port, reload, debug, backend, workers):
         """Start the LLM Web UI server."""
+        # --backend and --workers are checked by their click types
+        if reload and workers and workers > 1:
+            raise click.UsageError("--reload only works with a single worker")
+        # The server module builds its settings from the environment when it
+        # is imported, so they have to be there first
+        from .settings import export_to_env
+
+        export_to_env(backend=backend, workers=workers)
+        # llm loads every plugin on every command, so the server stack
+        # (FastAPI, uvicorn, ...) is only imported when webui actually runs
+        from .server import start_server
+
         click.echo(f"Starting LLM Web UI on http://{host}:{port}")
-        start_server(host=host, port=port, reload=reload, debug=debug)
\ No newline at end of file
+        start_server(
+            host=host, port=port, reload=reload, debug=debug, backend=backend, workers=workers
+        )
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""In-memory cache for the model, template and tool listings.
+
+Each listing is loaded once (by running the llm CLI), then served from
+memory. After ``ttl`` seconds the cached value is still served while a
+background task refreshes it (stale-while-revalidate).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+def compute_etag(value: Any) -> str:
+    """Strong ETag derived from the JSON form of a value."""
+    body = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    return '"{}"'.format(hashlib.sha256(body).hexdigest()[:32])
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class CachedListing:
+    def __init__(self, name: str, loader: Callable[[], Awaitable[Any]], ttl: float = 300.0):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.value: Any = None
+        self.etag: Optional[str] = None
+        self.fetched_at: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.fetched_at is not None
+
+    @property
+    def stale(self) -> bool:
+        return self.loaded and time.monotonic() - self.fetched_at >= self.ttl
+
+    async def get(self) -> Tuple[Any, str]:
+        """Return (value, etag), loading on first use."""
+        if not self.loaded:
+            await self.refresh()
+        elif self.stale:
+            self._schedule_refresh()
+        return self.value, self.etag
+
+    async def refresh(self):
+        """Load the listing now; concurrent callers share a single load."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        fetched_before = self.fetched_at
+        async with self._lock:
+            if self.fetched_at != fetched_before and not self.stale:
+                # Someone else refreshed it while we waited
+                return
+            value = await self.loader()
+            self.value = value
+            self.etag = compute_etag(value)
+            self.fetched_at = time.monotonic()
+
+    def invalidate(self):
+        """Drop the cached value so the next request loads it afresh."""
+        self.value = None
+        self.etag = None
+        self.fetched_at = None
+
+    def _schedule_refresh(self):
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        self._refresh_task = asyncio.ensure_future(self._background_refresh())
+
+    async def _background_refresh(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            # Keep serving the stale value; the next request retries
+            logger.warning("Failed to refresh %s: %s", self.name, e)
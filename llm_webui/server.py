@@ -1,20 +1,38 @@
 """FastAPI server for LLM WebUI."""
 
 import asyncio
+import codecs
 import json
 import subprocess
-import tempfile
 import os
 import shlex
+import sqlite3
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional, List, Dict, Any
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Form, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+
+from . import engine, images, logsdb
+from .assets import AssetManifest, StaticAssets
+from .attachments import AttachmentStore, file_sha256
+from .admission import AdmissionController, QueueFull, Ticket, admitted_events, per_worker
+from .cache import ResponseCache, cache_key
+from .compression import CompressionMiddleware
+from .events import CONVERSATION, ERROR, SSE_MEDIA_TYPE, TOKEN, encode_stream, wants_sse
+from .generations import Generation, GenerationRegistry, ReplayExpired, stop_process
+from .multiplex import MultiplexError, StreamMultiplexer
+from .registry import CachedListing, etag_matches
+from .sessions import SessionPool
+from .settings import export_to_env, settings
+from .shared import Coordinator, SharedState, default_path
+from .uploads import UploadError, receive_upload
+from .workers import WorkerPool, spawn
 
 
 # Pydantic models for API requests
@@ -45,41 +63,133 @@ class ChatMessage(BaseModel):
     extra_args: Optional[str] = None
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up llm workers before the first request needs one
+    await worker_pool.start()
+    # Bring the search index up to date so the first search doesn't wait
+    logsdb.search_indexer.schedule()
+    if coordinator is not None:
+        coordinator.start()
+    yield
+    if coordinator is not None:
+        await coordinator.close()
+    await worker_pool.close()
+
+
 # FastAPI app
-app = FastAPI(title="LLM WebUI", description="Web interface for LLM CLI tool")
+app = FastAPI(title="LLM WebUI", description="Web interface for LLM CLI tool", lifespan=lifespan)
+if settings.compression:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_min_size)
 
 # Get the package directory
 package_dir = Path(__file__).parent
 static_dir = package_dir / "static"
 templates_dir = package_dir / "templates"
 
-# Create directories if they don't exist
-static_dir.mkdir(exist_ok=True)
-templates_dir.mkdir(exist_ok=True)
-
-# Mount static files
-app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
+# Mount static files; built assets are served precompressed and cached for good
+app.mount("/static", StaticAssets(directory=str(static_dir)), name="static")
+asset_manifest = AssetManifest(static_dir)
 
 # Templates
 templates = Jinja2Templates(directory=str(templates_dir))
+templates.env.globals["asset_url"] = asset_manifest.template_global()
+
+# Streams in flight, so they can be cancelled
+generations = GenerationRegistry(
+    grace=settings.cancel_grace,
+    buffer_size=settings.replay_buffer_size,
+    resume_grace=settings.resume_grace,
+    replay_ttl=settings.replay_ttl,
+    replay_memory=settings.replay_memory,
+)
+
+# Pre-started llm processes for the subprocess backend
+worker_pool = WorkerPool(size=settings.worker_pool if settings.backend == "subprocess" else 0)
+
+# Bounds how many generations run at once; the rest wait in a queue. The
+# limits are server-wide, so with several workers each enforces its share
+admission = AdmissionController(
+    max_running=per_worker(settings.max_concurrent, settings.workers),
+    max_per_model=per_worker(settings.max_concurrent_per_model, settings.workers),
+    max_queue=per_worker(settings.max_queue, settings.workers),
+)
+
+# Uploaded attachments, stored once per distinct content
+attachment_store = AttachmentStore(
+    max_age=settings.attachment_max_age, quota=settings.attachment_quota
+)
+
+# Responses of non-streamed prompts, when settings.response_cache is on
+response_cache = ResponseCache(
+    ttl=settings.response_cache_ttl, max_size=settings.response_cache_size
+)
+
+# Per-model overrides of settings.image_max_dimension
+image_dimensions = images.parse_dimensions(settings.image_max_dimensions)
+
+# Live conversations reused across chat turns by the in-process backend
+chat_sessions = SessionPool(
+    max_sessions=settings.chat_sessions,
+    ttl=settings.chat_session_ttl,
+    max_size=settings.chat_session_max_size,
+)
+
+
+async def run_command(
+    cmd: List[str], check: bool = True, timeout: Optional[float] = None
+) -> subprocess.CompletedProcess:
+    """Async counterpart of subprocess.run(cmd, capture_output=True, text=True).
+
+    The event loop keeps serving other requests (and token streams) while
+    the command runs. If it outlives ``timeout`` seconds the child is killed
+    and subprocess.TimeoutExpired is raised.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    finally:
+        # Timed out, or the request was cancelled
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    result = subprocess.CompletedProcess(
+        cmd,
+        process.returncode,
+        stdout.decode("utf-8", errors="replace"),
+        stderr.decode("utf-8", errors="replace"),
+    )
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(
+            result.returncode, cmd, output=result.stdout, stderr=result.stderr
+        )
+    return result
+
+
+@app.exception_handler(subprocess.TimeoutExpired)
+async def command_timeout_handler(request: Request, exc: subprocess.TimeoutExpired):
+    return JSONResponse(
+        status_code=504,
+        content={"detail": f"Command timed out after {exc.timeout:g}s: {' '.join(exc.cmd)}"},
+    )
 
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """Serve the main page."""
-    return templates.TemplateResponse("index.html", {"request": request})
+    return templates.TemplateResponse(request, "index.html")
 
 
-@app.get("/api/models")
-async def get_models():
-    """Get available models."""
+async def load_models():
+    """Load available models from the llm CLI."""
     try:
-        result = subprocess.run(
-            ["llm", "models", "list", "--json"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        result = await run_command(["llm", "models", "list", "--json"], timeout=settings.command_timeout)
         return json.loads(result.stdout)
     except subprocess.CalledProcessError as e:
         raise HTTPException(status_code=500, detail=f"Failed to get models: {e.stderr}")
@@ -87,16 +197,10 @@ async def get_models():
         raise HTTPException(status_code=500, detail="Failed to parse models response")
 
 
-@app.get("/api/templates")
-async def get_templates():
-    """Get available templates."""
+async def load_templates():
+    """Load available templates from the llm CLI."""
     try:
-        result = subprocess.run(
-            ["llm", "templates", "list"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        result = await run_command(["llm", "templates", "list"], timeout=settings.command_timeout)
         # Parse the simple text output from templates list
         lines = result.stdout.strip().split('\n')
         templates = [line.strip() for line in lines if line.strip()]
@@ -105,16 +209,10 @@ async def get_templates():
         raise HTTPException(status_code=500, detail=f"Failed to get templates: {e.stderr}")
 
 
-@app.get("/api/tools")
-async def get_tools():
-    """Get available tools."""
+async def load_tools():
+    """Load available tools from the llm CLI."""
     try:
-        result = subprocess.run(
-            ["llm", "tools", "list", "--json"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        result = await run_command(["llm", "tools", "list", "--json"], timeout=settings.command_timeout)
         return json.loads(result.stdout)
     except subprocess.CalledProcessError as e:
         raise HTTPException(status_code=500, detail=f"Failed to get tools: {e.stderr}")
@@ -122,9 +220,247 @@ async def get_tools():
         return {"tools": []}
 
 
+# Listings the UI fetches on every page load, served from memory
+registries = {
+    "models": CachedListing("models", load_models, ttl=settings.registry_ttl),
+    "templates": CachedListing("templates", load_templates, ttl=settings.registry_ttl),
+    "tools": CachedListing("tools", load_tools, ttl=settings.registry_ttl),
+}
+
+# With several server workers, keeps generations and the listings above in
+# step across them
+coordinator = (
+    Coordinator(
+        SharedState(default_path()),
+        generations,
+        registries,
+        resume_grace=settings.resume_grace,
+    )
+    if settings.workers > 1
+    else None
+)
+
+
+async def start_generation() -> Generation:
+    """Start a generation, shared with the other workers when there are several."""
+    generation = generations.start()
+    if coordinator is not None:
+        await coordinator.share(generation)
+    return generation
+
+
+async def find_generation(generation_id: str):
+    """A generation of this worker or, with several workers, of another one."""
+    generation = generations.get(generation_id)
+    if generation is None and coordinator is not None:
+        generation = await coordinator.remote(generation_id)
+    return generation
+
+
+async def registry_response(request: Request, name: str):
+    """Serve a cached listing, answering 304 when the client's copy is current."""
+    value, etag = await registries[name].get()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(value, headers=headers)
+
+
+@app.get("/api/models")
+async def get_models(request: Request):
+    """Get available models."""
+    return await registry_response(request, "models")
+
+
+@app.get("/api/templates")
+async def get_templates(request: Request):
+    """Get available templates."""
+    return await registry_response(request, "templates")
+
+
+@app.get("/api/tools")
+async def get_tools(request: Request):
+    """Get available tools."""
+    return await registry_response(request, "tools")
+
+
+@app.post("/api/registry/invalidate")
+async def invalidate_registry(name: Optional[str] = None):
+    """Drop cached models/templates/tools, e.g. after installing a plugin.
+
+    Example: /api/registry/invalidate            -> all listings
+             /api/registry/invalidate?name=tools -> just the tools
+    """
+    if name is not None and name not in registries:
+        raise HTTPException(status_code=404, detail=f"Unknown registry: {name}")
+    names = [name] if name else list(registries)
+    for registry_name in names:
+        registries[registry_name].invalidate()
+        if coordinator is not None:
+            coordinator.invalidate(registry_name)
+    return {"invalidated": names}
+
+
+def admission_key(
+    model: Optional[str], template: Optional[str] = None, conversation_id: Optional[str] = None
+) -> str:
+    """Id of the model a request will actually run on.
+
+    An alias, the default model, a template's model or the model of the
+    conversation being continued must count against the same per-model
+    limit as the model named by its id.
+    """
+    if conversation_id and not model:
+        try:
+            latest, _ = logsdb.conversation_messages(conversation_id, limit=1)
+        except sqlite3.Error:
+            latest = []
+        if latest:
+            model = latest[0]["model"]
+    return engine.model_id_for(model, template)
+
+
+async def request_admission(
+    model: Optional[str], template: Optional[str] = None, conversation_id: Optional[str] = None
+) -> Ticket:
+    key = await run_in_threadpool(admission_key, model, template, conversation_id)
+    return admission.request(key)
+
+
+async def admit(
+    model: Optional[str], template: Optional[str] = None, conversation_id: Optional[str] = None
+) -> Ticket:
+    """Take a place in the run queue, or answer 429 when it is full."""
+    try:
+        return await request_admission(model, template, conversation_id)
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+def run_admitted(generation: Generation, ticket: Ticket, events):
+    """Run a generation once its ticket is admitted, reporting queue position until then."""
+    generation.cancel_callbacks.append(lambda: admission.withdraw(ticket))
+    generations.run(generation, admitted_events(admission, ticket, events))
+
+
+def event_stream_response(
+    http_request: Request, events, generation: Generation, ticket: Ticket
+) -> StreamingResponse:
+    """Run a generation and stream its events to the client."""
+    run_admitted(generation, ticket, events)
+    return follow_generation_response(http_request, generation)
+
+
+def follow_generation_response(
+    http_request: Request, generation: Generation, after: int = 0
+) -> StreamingResponse:
+    """Stream a generation's events after ``after``, as plain text or SSE."""
+    sse = wants_sse(http_request.headers.get("accept"))
+    headers = {"X-Generation-Id": generation.id}
+    if sse:
+        headers["Cache-Control"] = "no-cache"
+    return StreamingResponse(
+        encode_stream(generation.follow(after), sse),
+        media_type=SSE_MEDIA_TYPE if sse else "text/plain",
+        headers=headers,
+    )
+
+
 @app.post("/api/prompt")
-async def execute_prompt(request: PromptRequest):
-    """Execute a prompt."""
+async def execute_prompt(request: PromptRequest, http_request: Request):
+    """Execute a prompt.
+
+    Streams plain text by default; send ``Accept: text/event-stream`` for
+    typed Server-Sent Events instead.
+    """
+    if request.stream or not settings.response_cache:
+        return await run_prompt_request(request, http_request)
+    return await cached_prompt_response(request, http_request)
+
+
+def prompt_cache_key(request: PromptRequest) -> Optional[str]:
+    """Hash of everything that shapes a prompt's response; None if it can't be cached."""
+    # Tools can have side effects that a cached answer would skip
+    if request.tools:
+        return None
+    # Hashed as resolved: template text and model defaults shape the answer
+    # as much as the request does
+    try:
+        resolved = engine.resolve_prompt(
+            request.prompt,
+            model=request.model,
+            system=request.system,
+            template=request.template,
+            options=request.options,
+            reasoning=request.reasoning,
+        )
+    except engine.PromptError:
+        return None
+
+    def digest(path: str) -> Optional[str]:
+        try:
+            return attachment_store.sha256_of(path) or file_sha256(path)
+        except OSError:
+            return None
+
+    attachments = [digest(path) for path in request.attachments or []]
+    attachment_types = [
+        [digest(pair[0]), *pair[1:]] if pair else pair for pair in request.attachment_types or []
+    ]
+    if None in attachments or any(pair and pair[0] is None for pair in attachment_types):
+        return None
+    return cache_key({
+        **resolved,
+        "extra_args": request.extra_args,
+        "attachments": attachments,
+        "attachment_types": attachment_types,
+        # Images may be sent downscaled
+        "image_max_dimension": [settings.image_max_dimension, settings.image_max_dimensions],
+    })
+
+
+async def cached_prompt_response(request: PromptRequest, http_request: Request):
+    """Answer a non-streamed prompt from the response cache when possible.
+
+    ``Cache-Control: no-cache`` skips the lookup, ``no-store`` skips the
+    cache entirely. The X-Cache header says HIT, MISS or BYPASS.
+    """
+    directives = {
+        part.strip().lower() for part in http_request.headers.get("cache-control", "").split(",")
+    }
+    key = None
+    if "no-store" not in directives:
+        key = await run_in_threadpool(prompt_cache_key, request)
+    if key is not None and "no-cache" not in directives:
+        cached = await run_in_threadpool(response_cache.get, key)
+        if cached is not None:
+            text, age = cached
+            return JSONResponse(
+                {"response": text}, headers={"X-Cache": "HIT", "Age": str(int(age))}
+            )
+    result = await run_prompt_request(request, http_request)
+    if key is not None:
+        await run_in_threadpool(response_cache.put, key, result["response"])
+    return JSONResponse(result, headers={"X-Cache": "MISS" if key is not None else "BYPASS"})
+
+
+async def run_prompt_request(request: PromptRequest, http_request: Request):
+    """Run a prompt on the configured backend."""
+    attachment_paths = [
+        *(request.attachments or []),
+        *(pair[0] for pair in request.attachment_types or [] if pair),
+    ]
+    if attachment_paths:
+        # Keeps attachments in use from being garbage-collected
+        await run_in_threadpool(attachment_store.touch, attachment_paths)
+        await prepare_attachments(request, attachment_paths)
+
+    # Raw CLI flags can only be honoured by the llm CLI itself
+    if settings.backend == "inprocess" and not request.extra_args:
+        return await execute_prompt_inprocess(request, http_request)
+
     cmd = ["llm", "prompt"]
     
     if request.model:
@@ -173,27 +509,211 @@ async def execute_prompt(request: PromptRequest):
             pass
     cmd.append(request.prompt)
     
+    ticket = await admit(request.model, request.template)
     if request.stream:
-        return StreamingResponse(
-            stream_llm_response(cmd), 
-            media_type="text/plain"
+        generation = await start_generation()
+        return event_stream_response(
+            http_request, stream_llm_response(cmd, generation), generation, ticket
         )
     else:
         try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=True
-            )
+            await admission.wait(ticket)
+            result = await run_command(cmd)
             return {"response": result.stdout}
         except subprocess.CalledProcessError as e:
             raise HTTPException(status_code=500, detail=f"LLM command failed: {e.stderr}")
+        finally:
+            admission.release(ticket)
+
+
+async def prepare_attachments(request: PromptRequest, paths: List[str]):
+    """Swap stored images for variants downscaled for the prompt's model."""
+    max_dimension = settings.image_max_dimension
+    if image_dimensions:
+        try:
+            model_id = engine.resolve_model(request.model).model_id
+        except engine.PromptError:
+            model_id = request.model
+        max_dimension = image_dimensions.get(
+            model_id, image_dimensions.get(request.model or "", max_dimension)
+        )
+    if not max_dimension or not images.available():
+        return
+    variants = {}
+    for path in set(paths):
+        if attachment_store.sha256_of(path):
+            variant = await images.prepare(Path(path), max_dimension)
+            if variant is not None:
+                variants[path] = (str(variant[0]), variant[1])
+    if not variants:
+        return
+    if request.attachments:
+        request.attachments = [variants.get(path, (path,))[0] for path in request.attachments]
+    if request.attachment_types:
+        request.attachment_types = [
+            list(variants[pair[0]]) if pair and pair[0] in variants else pair
+            for pair in request.attachment_types
+        ]
+
+
+async def execute_prompt_inprocess(request: PromptRequest, http_request: Request):
+    """Execute a prompt through the llm Python API inside the server."""
+    kwargs = dict(
+        model=request.model,
+        system=request.system,
+        template=request.template,
+        attachments=request.attachments,
+        attachment_types=request.attachment_types,
+        tools=request.tools,
+        options=request.options,
+        reasoning=request.reasoning,
+    )
+    ticket = await admit(request.model, request.template)
+    if request.stream:
+        generation = await start_generation()
+        return event_stream_response(
+            http_request,
+            stream_inprocess_response(request.prompt, kwargs, generation),
+            generation,
+            ticket,
+        )
+    try:
+        await admission.wait(ticket)
+        text = await run_in_threadpool(engine.run_prompt, request.prompt, **kwargs)
+        return {"response": text}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"LLM command failed: {str(e)}")
+    finally:
+        admission.release(ticket)
+
+
+@app.post("/api/prompt/{generation_id}/cancel")
+async def cancel_generation(generation_id: str):
+    """Stop a running prompt or chat generation.
+
+    The id is sent in the X-Generation-Id header of the streamed response.
+    """
+    generation = await find_generation(generation_id)
+    if generation is None or generation.finished:
+        raise HTTPException(status_code=404, detail=f"No running generation: {generation_id}")
+    generation.cancel()
+    return {"cancelled": generation_id}
+
+
+@app.get("/api/generations/{generation_id}/events")
+async def resume_generation(
+    generation_id: str, http_request: Request, after: Optional[int] = None
+):
+    """Reconnect to a generation, receiving only the events after ``after``.
+
+    SSE clients can send the standard Last-Event-ID header instead. Recently
+    finished generations can be replayed too, for LLM_WEBUI_REPLAY_TTL seconds.
+    """
+    generation = await find_generation(generation_id)
+    if generation is None:
+        raise HTTPException(status_code=404, detail=f"No such generation: {generation_id}")
+    if after is None:
+        try:
+            after = int(http_request.headers.get("last-event-id") or 0)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID must be an event id")
+    try:
+        generation.check_resume(after)
+    except ReplayExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return follow_generation_response(http_request, generation, after)
 
 
 @app.post("/api/chat")
-async def chat_message(message: ChatMessage):
-    """Send a chat message."""
+async def chat_message(message: ChatMessage, http_request: Request):
+    """Send a chat message.
+
+    Like /api/prompt, answers with SSE for ``Accept: text/event-stream``.
+    """
+    ticket = await admit(message.model, conversation_id=message.conversation_id)
+    generation = await start_generation()
+    return event_stream_response(
+        http_request, chat_events(message, generation), generation, ticket
+    )
+
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    """Chat over one long-lived WebSocket; see llm_webui.multiplex for the protocol."""
+    await websocket.accept()
+    mux = StreamMultiplexer(websocket, settings.ws_max_streams)
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            if frame.get("text") is None:
+                await mux.send(None, ERROR, "Messages must be JSON text frames, not binary")
+                continue
+            try:
+                request = json.loads(frame["text"])
+            except ValueError:
+                await mux.send(None, ERROR, "Messages must be JSON objects")
+                continue
+            stream_id = request.get("stream") if isinstance(request, dict) else None
+            try:
+                if not isinstance(stream_id, str) or not stream_id:
+                    raise MultiplexError("Every message needs a string 'stream' id")
+                kind = request.get("type")
+                if kind == "chat":
+                    fields = {k: v for k, v in request.items() if k not in ("type", "stream")}
+                    try:
+                        message = ChatMessage(**fields)
+                    except ValidationError as e:
+                        raise MultiplexError(f"Invalid chat message: {e}")
+                    try:
+                        ticket = await request_admission(
+                            message.model, conversation_id=message.conversation_id
+                        )
+                    except QueueFull as e:
+                        raise MultiplexError(str(e))
+                    generation = await start_generation()
+                    try:
+                        mux.start(stream_id, generation)
+                    except MultiplexError:
+                        generations.finish(generation)
+                        admission.release(ticket)
+                        raise
+                    run_admitted(generation, ticket, chat_events(message, generation))
+                elif kind == "attach":
+                    # Pick a generation back up after reconnecting
+                    generation = await find_generation(str(request.get("generation")))
+                    if generation is None:
+                        raise MultiplexError(f"No such generation: {request.get('generation')}")
+                    after = request.get("after") or 0
+                    try:
+                        generation.check_resume(int(after))
+                    except (ReplayExpired, ValueError) as e:
+                        raise MultiplexError(str(e))
+                    mux.start(stream_id, generation, int(after))
+                elif kind == "cancel":
+                    mux.cancel(stream_id)
+                elif kind == "pause":
+                    mux.pause(stream_id)
+                elif kind == "resume":
+                    mux.resume(stream_id)
+                else:
+                    raise MultiplexError(f"Unknown message type: {kind}")
+            except MultiplexError as e:
+                await mux.send(stream_id, ERROR, str(e))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        mux.close()
+
+
+def chat_events(message: ChatMessage, generation: Generation):
+    """Event stream for one chat turn on the configured backend."""
+    if settings.backend == "inprocess" and not message.extra_args:
+        return stream_chat_session(message, generation)
+
     cmd = ["llm", "chat"]
     
     if message.model:
@@ -228,102 +748,247 @@ async def chat_message(message: ChatMessage):
         except Exception:
             pass
     
-    return StreamingResponse(
-        stream_llm_chat_response(cmd, message.message), 
-        media_type="text/plain"
-    )
+    return stream_llm_chat_response(cmd, message.message, generation)
 
 
 @app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Upload a file for use as an attachment."""
+async def upload_file(request: Request):
+    """Upload a file for use as an attachment.
+
+    Send a multipart form with a file field, or the file itself as the body
+    with ?filename=. It is streamed to disk as it arrives; uploads over
+    LLM_WEBUI_MAX_UPLOAD_SIZE bytes get HTTP 413.
+    """
     try:
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{file.filename}") as tmp:
-            content = await file.read()
-            tmp.write(content)
-            tmp_path = tmp.name
-        return {"filename": file.filename, "path": tmp_path, "size": len(content), "mimetype": file.content_type}
+        upload = await receive_upload(
+            request, settings.max_upload_size, directory=str(attachment_store.upload_dir)
+        )
+        stored = await run_in_threadpool(
+            attachment_store.add, upload["path"], upload["sha256"], upload["mimetype"]
+        )
+        return {
+            "filename": upload["filename"],
+            "path": stored["path"],
+            "size": stored["size"],
+            "mimetype": upload["mimetype"],
+            "sha256": stored["sha256"],
+            "deduplicated": stored["deduplicated"],
+        }
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
 
-async def stream_llm_response(cmd: List[str]):
-    """Stream response from LLM command."""
+@app.get("/api/attachments/{sha256}")
+async def get_attachment(sha256: str):
+    """Describe a stored attachment by the SHA-256 of its content."""
+    stored = await run_in_threadpool(attachment_store.get, sha256)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"No such attachment: {sha256}")
+    return stored
+
+
+@app.post("/api/attachments/{sha256}/refs")
+async def acquire_attachment(sha256: str):
+    """Reuse a stored attachment instead of uploading the same content again.
+
+    404 means it isn't stored, and the client should upload it.
+    """
+    stored = await run_in_threadpool(attachment_store.acquire, sha256)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"No such attachment: {sha256}")
+    return stored
+
+
+@app.delete("/api/attachments/{sha256}/refs")
+async def release_attachment(sha256: str):
+    """Hand back the reference taken by an upload or a reuse."""
+    if not await run_in_threadpool(attachment_store.release, sha256):
+        raise HTTPException(status_code=404, detail=f"No reference to attachment: {sha256}")
+    return {"released": sha256}
+
+
+# Bytes requested per read; read() returns as soon as any output is available
+STREAM_CHUNK_SIZE = 4096
+
+
+async def start_llm_process(cmd: List[str]) -> asyncio.subprocess.Process:
+    """Start an llm command, on a warm worker when the pool is enabled.
+
+    stdin is left open for the caller to write to (or close).
+    """
+    if worker_pool.size and cmd[0] == "llm":
+        return await worker_pool.run(cmd[1:])
+    return await spawn(cmd)
+
+
+async def stream_process_output(process: asyncio.subprocess.Process):
+    """Yield a child's stdout as token events the moment bytes arrive.
+
+    An incremental decoder holds back partial multi-byte UTF-8 sequences
+    until the rest arrives. stderr is drained concurrently so a chatty child
+    can never block on a full pipe; its text is reported if the process fails.
+    """
+    stderr_task = asyncio.ensure_future(process.stderr.read())
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
     try:
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
         while True:
-            line = await process.stdout.readline()
-            if not line:
+            data = await process.stdout.read(STREAM_CHUNK_SIZE)
+            if not data:
                 break
-            yield line.decode('utf-8')
-        
+            text = decoder.decode(data)
+            if text:
+                yield TOKEN, text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield TOKEN, tail
+
         await process.wait()
+        stderr = await stderr_task
         if process.returncode != 0:
-            stderr = await process.stderr.read()
-            yield f"\nError: {stderr.decode('utf-8')}"
+            yield ERROR, stderr.decode("utf-8", errors="replace")
+    finally:
+        stderr_task.cancel()
+
+
+async def stream_llm_response(cmd: List[str], generation: Optional[Generation] = None):
+    """Stream response from LLM command."""
+    process = None
+    try:
+        process = await start_llm_process(cmd)
+        process.stdin.close()
+        if generation:
+            generation.attach(process)
+        async for event in stream_process_output(process):
+            if generation and generation.cancelled.is_set():
+                break
+            yield event
+    except Exception as e:
+        if not (generation and generation.cancelled.is_set()):
+            yield ERROR, str(e)
+    finally:
+        # Client disconnected or the generation was cancelled mid-stream
+        if process is not None:
+            stop_process(process, settings.cancel_grace)
+        generations.finish(generation)
+
+
+def stream_inprocess_response(
+    prompt: str, kwargs: Dict[str, Any], generation: Optional[Generation] = None
+):
+    """Stream response from the in-process engine.
+
+    This is a plain generator, so StreamingResponse iterates it in a worker
+    thread and the blocking model calls never touch the event loop.
+    """
+    cancelled = generation.cancelled if generation else None
+    try:
+        yield from engine.stream_events(prompt, cancelled=cancelled, **kwargs)
+    except Exception as e:
+        yield ERROR, str(e)
+    finally:
+        # Also reached when a disconnected client's stream is closed. This
+        # runs in a worker thread, so the registry's finish() is left to
+        # GenerationRegistry.run, on the event loop
+        if generation:
+            generation.cancelled.set()
+
+
+def stream_chat_session(message: ChatMessage, generation: Optional[Generation] = None):
+    """Stream a chat turn from the pooled conversation for its conversation_id."""
+    cancelled = generation.cancelled if generation else None
+    try:
+        with chat_sessions.conversation(message.conversation_id, message.model) as conversation:
+            yield CONVERSATION, {"conversation_id": conversation.id}
+            # Like `llm chat`, the system prompt is only sent with the first message
+            yield from engine.stream_events(
+                message.message,
+                cancelled=cancelled,
+                conversation=conversation,
+                model=message.model,
+                system=None if conversation.responses else message.system,
+                tools=message.tools,
+                options=message.options,
+                reasoning=message.reasoning,
+            )
     except Exception as e:
-        yield f"\nError: {str(e)}"
+        yield ERROR, str(e)
+    finally:
+        # In a worker thread too; finish() happens on the event loop
+        if generation:
+            generation.cancelled.set()
 
 
-async def stream_llm_chat_response(cmd: List[str], message: str):
+async def stream_llm_chat_response(
+    cmd: List[str], message: str, generation: Optional[Generation] = None
+):
     """Stream chat response from LLM command."""
+    process = None
     try:
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        process = await start_llm_process(cmd)
+        if generation:
+            generation.attach(process)
         
         # Send the message
         process.stdin.write((message + '\n').encode('utf-8'))
         await process.stdin.drain()
         process.stdin.close()
         
-        while True:
-            line = await process.stdout.readline()
-            if not line:
+        async for event in stream_process_output(process):
+            if generation and generation.cancelled.is_set():
                 break
-            yield line.decode('utf-8')
-        
-        await process.wait()
-        if process.returncode != 0:
-            stderr = await process.stderr.read()
-            yield f"\nError: {stderr.decode('utf-8')}"
+            yield event
     except Exception as e:
-        yield f"\nError: {str(e)}"
+        if not (generation and generation.cancelled.is_set()):
+            yield ERROR, str(e)
+    finally:
+        if process is not None:
+            stop_process(process, settings.cancel_grace)
+        generations.finish(generation)
 
 
 @app.get("/api/logs")
-async def get_logs(count: int = 5):
-    """Get recent logs."""
+async def get_logs(count: int = Query(5, ge=0), cursor: Optional[str] = None):
+    """Get recent logs, newest first; ?count=0 returns them all.
+
+    Pass the returned next_cursor as ?cursor= to fetch the following page.
+    """
     try:
-        result = subprocess.run(
-            ["llm", "logs", "list", "-n", str(count), "--json"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Failed to get logs: {e.stderr}")
-    except json.JSONDecodeError:
-        return {"logs": []}
+        logs, next_cursor = await run_in_threadpool(logsdb.list_logs, count, cursor)
+        return {"logs": logs, "next_cursor": next_cursor}
+    except logsdb.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get logs: {str(e)}")
 
 
-def start_server(host: str = "127.0.0.1", port: int = 8000, reload: bool = False, debug: bool = False):
-    """Start the FastAPI server."""
+def start_server(
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    reload: bool = False,
+    debug: bool = False,
+    backend: Optional[str] = None,
+    workers: Optional[int] = None,
+):
+    """Start the FastAPI server.
+
+    With ``workers`` above 1, uvicorn supervises that many server processes
+    and restarts any that die.
+
+    Without --reload or extra workers uvicorn serves this already imported
+    module, whose objects were built from the settings at import time; the
+    webui command exports ``backend`` and ``workers`` before importing it.
+    """
+    # Reloaded and extra worker processes load the app by import string, so
+    # settings travel via the environment
+    export_to_env(backend=backend, workers=workers)
     uvicorn.run(
         "llm_webui.server:app",
         host=host,
         port=port,
         reload=reload,
+        workers=workers,
         log_level="debug" if debug else "info"
     )
 
@@ -344,82 +1009,135 @@ async def get_help(path: Optional[str] = None):
             parts = path.split()
     cmd = ["llm", *parts, "--help"]
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=False,  # --help returns 0 but tolerate non-zero
-        )
+        # --help returns 0 but tolerate non-zero
+        result = await run_command(cmd, check=False, timeout=settings.command_timeout)
         return {"command": " ".join(cmd), "help": result.stdout or result.stderr}
+    except subprocess.TimeoutExpired:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to run help: {str(e)}")
 
 
 @app.get("/api/conversations")
-async def list_conversations(limit: int = 50):
-    """List conversations from LLM logs (if logging is enabled)."""
+async def list_conversations(limit: int = Query(50, ge=0), cursor: Optional[str] = None):
+    """List conversations from LLM logs (if logging is enabled); ?limit=0 lists them all.
+
+    Pass the returned next_cursor as ?cursor= to fetch older conversations.
+    """
     try:
-        # Use llm logs list in JSON and then group by conversation_id
-        result = subprocess.run(
-            ["llm", "logs", "list", "-n", "0", "--json"],
-            capture_output=True,
-            text=True,
-            check=True,
+        # Grouped and limited in SQL, straight from the logs database
+        conversations, next_cursor = await run_in_threadpool(
+            logsdb.list_conversations, limit, cursor
         )
-        logs = json.loads(result.stdout)
-        convs: Dict[str, Dict[str, Any]] = {}
-        for row in logs:
-            cid = row.get("conversation_id")
-            if not cid:
-                # Skip prompts not in a conversation
-                continue
-            conv = convs.setdefault(
-                cid,
-                {
-                    "conversation_id": cid,
-                    "latest": row.get("datetime_utc"),
-                    "model": row.get("model"),
-                    "count": 0,
-                    "last_prompt": row.get("prompt", ""),
-                },
-            )
-            conv["count"] += 1
-            # Update latest
-            if row.get("datetime_utc") and (
-                not conv["latest"] or row.get("datetime_utc") > conv["latest"]
-            ):
-                conv["latest"] = row.get("datetime_utc")
-                conv["last_prompt"] = row.get("prompt", "")
-                conv["model"] = row.get("model")
-
-        # Sort by latest desc and limit
-        conv_list = sorted(convs.values(), key=lambda x: x["latest"] or "", reverse=True)
-        return conv_list[:limit]
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Failed to list conversations: {e.stderr}")
-    except json.JSONDecodeError:
-        return []
+        return {"conversations": conversations, "next_cursor": next_cursor}
+    except logsdb.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list conversations: {str(e)}")
+
+
+@app.get("/api/search")
+async def search_logs(q: str, limit: int = 20, cursor: Optional[str] = None):
+    """Full-text search over logged prompts, responses and system prompts.
+
+    Results are ranked best first; snippets are HTML-escaped with matches
+    wrapped in <mark>. Pass next_cursor as ?cursor= for the next page.
+    """
+    try:
+        results, next_cursor = await run_in_threadpool(logsdb.search, q, limit, cursor)
+        return {"results": results, "next_cursor": next_cursor}
+    except logsdb.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+
+
+async def conversation_etag(cid: str) -> Optional[str]:
+    try:
+        return await run_in_threadpool(logsdb.conversation_version, cid)
+    except sqlite3.Error:
+        return None
+
+
+def conversation_not_modified(request: Request, etag: Optional[str]) -> Optional[Response]:
+    """A 304 when the client's copy of a conversation is current."""
+    if etag and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=conversation_headers(etag))
+    return None
+
+
+def conversation_headers(etag: Optional[str]) -> Dict[str, str]:
+    headers = {"Cache-Control": "no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    return headers
 
 
 @app.get("/api/conversations/{cid}")
-async def get_conversation(cid: str):
-    """Return all messages in a conversation."""
+async def get_conversation(
+    cid: str, request: Request, after_id: Optional[str] = None, since: Optional[str] = None
+):
+    """Return the messages in a conversation.
+
+    ?after_id= (a message id) or ?since= (a datetime_utc) return only the
+    messages logged after it. The ETag changes whenever a message is
+    logged, so If-None-Match gets a 304 when there is nothing new.
+    """
+    etag = await conversation_etag(cid)
+    not_modified = conversation_not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
     try:
-        result = subprocess.run(
-            ["llm", "logs", "list", "--cid", cid, "--json"],
-            capture_output=True,
-            text=True,
-            check=True,
+        messages, _ = await run_in_threadpool(
+            logsdb.conversation_messages, cid, limit=None, after_id=after_id, since=since
         )
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch conversation: {e.stderr}")
-    except json.JSONDecodeError:
-        return []
+    except logsdb.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch conversation: {str(e)}")
+    # Oldest first, as llm logs list has them
+    return JSONResponse(messages[::-1], headers=conversation_headers(etag))
+
+
+@app.get("/api/conversations/{cid}/messages")
+async def get_conversation_messages(
+    cid: str,
+    request: Request,
+    limit: int = Query(50, ge=0),
+    cursor: Optional[str] = None,
+    after_id: Optional[str] = None,
+    since: Optional[str] = None,
+):
+    """A page of a conversation's messages, newest first; ?limit=0 returns them all.
+
+    Pass the returned next_cursor as ?cursor= to fetch older messages.
+    ?after_id= and ?since= leave out what the client already has, and
+    If-None-Match is answered as for /api/conversations/{cid}.
+    """
+    etag = await conversation_etag(cid)
+    not_modified = conversation_not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    try:
+        messages, next_cursor = await run_in_threadpool(
+            logsdb.conversation_messages,
+            cid,
+            limit=limit,
+            cursor=cursor,
+            after_id=after_id,
+            since=since,
+        )
+        return JSONResponse(
+            {"messages": messages, "next_cursor": next_cursor}, headers=conversation_headers(etag)
+        )
+    except logsdb.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch conversation: {str(e)}")
 
 
 @app.post("/api/upload-clipboard")
-async def upload_clipboard_image(file: UploadFile = File(...)):
+async def upload_clipboard_image(request: Request):
     """Endpoint for clipboard-pasted images from the browser."""
     # This reuses upload_file semantics
-    return await upload_file(file)
\ No newline at end of file
+    return await upload_file(request)
\ No newline at end of file
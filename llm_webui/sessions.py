@@ -0,0 +1,157 @@
+"""Pool of live llm conversations for the chat endpoint.
+
+Keeping the ``Conversation`` object between turns means each chat message
+only sends the new prompt, instead of starting ``llm chat`` and reloading
+the whole history from the logs database every time.
+
+A pooled conversation is reloaded if the logs database holds more of its
+exchanges than it does, which happens when another server worker (or
+``llm chat --cid``) continued it in the meantime.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+from . import engine, logsdb
+
+
+def estimate_size(conversation) -> int:
+    """Rough in-memory size of a conversation, counted in characters."""
+    size = 0
+    for response in conversation.responses:
+        prompt = response.prompt
+        size += len(prompt.prompt or "") + len(prompt.system or "")
+        size += sum(len(chunk) for chunk in getattr(response, "_chunks", []))
+    return size
+
+
+def load_conversation(conversation_id: Optional[str] = None, model: Optional[str] = None):
+    """Load a conversation from the logs database, or start a new one."""
+    if not conversation_id:
+        return engine.resolve_model(model).conversation()
+
+    import click
+    from llm import cli
+
+    try:
+        conversation = cli.load_conversation(conversation_id)
+    except click.ClickException as e:
+        raise engine.PromptError(e.message)
+    if conversation is None:
+        raise engine.PromptError(f"No conversation found with id={conversation_id}")
+    return conversation
+
+
+class ChatSession:
+    def __init__(self, conversation, logged: int = 0):
+        self.conversation = conversation
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.size = estimate_size(conversation)
+        # Logged exchanges the conversation was loaded with but doesn't hold
+        # as responses (llm keeps newer history as loaded messages instead)
+        self.offset = max(logged - len(conversation.responses), 0)
+
+    @property
+    def exchanges(self) -> int:
+        return self.offset + len(self.conversation.responses)
+
+
+class SessionPool:
+    """LRU pool of chat sessions, bounded by count, idle time and size.
+
+    Sessions that are generating a reply are never evicted; a turn on an
+    evicted conversation simply reloads it from the logs database.
+    """
+
+    def __init__(self, max_sessions: int = 64, ttl: float = 1800.0, max_size: int = 64 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_size = max_size
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, conversation_id):
+        return conversation_id in self._sessions
+
+    @contextmanager
+    def conversation(self, conversation_id: Optional[str] = None, model: Optional[str] = None):
+        """Check out the live conversation for one chat turn.
+
+        Turns in the same conversation are serialised; different
+        conversations run concurrently.
+        """
+        session = self._checkout(conversation_id, model)
+        with session.lock:
+            try:
+                yield session.conversation
+            finally:
+                session.last_used = time.monotonic()
+                session.size = estimate_size(session.conversation)
+        with self._lock:
+            self._enforce_limits()
+
+    def discard(self, conversation_id: str):
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def _checkout(self, conversation_id, model) -> ChatSession:
+        with self._lock:
+            self._evict_expired()
+            session = self._sessions.get(conversation_id) if conversation_id else None
+        if session is not None and not self._outdated(session):
+            with self._lock:
+                if self._sessions.get(conversation_id) is session:
+                    self._sessions.move_to_end(conversation_id)
+                session.last_used = time.monotonic()
+            return session
+
+        # Reading history can be slow, so do it outside the pool lock
+        conversation = load_conversation(conversation_id, model)
+        session = ChatSession(conversation, self._logged(conversation.id) if conversation_id else 0)
+        with self._lock:
+            # Another request may have loaded the same conversation meanwhile
+            existing = self._sessions.get(session.conversation.id)
+            if existing is not None and not self._outdated(existing):
+                return existing
+            self._sessions[session.conversation.id] = session
+            self._enforce_limits()
+        return session
+
+    def _outdated(self, session: ChatSession) -> bool:
+        return self._logged(session.conversation.id) > session.exchanges
+
+    def _logged(self, conversation_id: str) -> int:
+        try:
+            return logsdb.count_exchanges(conversation_id)
+        except Exception:
+            # An unreadable logs database shouldn't stop the chat
+            return 0
+
+    def _evict_expired(self):
+        cutoff = time.monotonic() - self.ttl
+        for cid, session in list(self._sessions.items()):
+            if session.last_used < cutoff and not session.lock.locked():
+                del self._sessions[cid]
+
+    def _enforce_limits(self):
+        def over_limit():
+            total = sum(session.size for session in self._sessions.values())
+            return len(self._sessions) > self.max_sessions or total > self.max_size
+
+        # Oldest first, skipping sessions that are mid-turn
+        for cid, session in list(self._sessions.items()):
+            if not over_limit():
+                break
+            if not session.lock.locked():
+                del self._sessions[cid]
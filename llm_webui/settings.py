@@ -0,0 +1,112 @@
+"""Runtime settings for LLM WebUI.
+
+Settings are read from ``LLM_WEBUI_*`` environment variables so that they
+survive uvicorn's import-string startup (``--reload`` re-imports the app in a
+fresh process).
+"""
+
+import os
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+
+ENV_PREFIX = "LLM_WEBUI_"
+
+
+class Settings(BaseModel):
+    # How prompts are executed: "inprocess" calls the llm Python API inside
+    # the server, "subprocess" runs the llm CLI for every request.
+    backend: str = "inprocess"
+    # Server processes (same as --workers). With more than one, state the
+    # workers must agree on is kept in a SQLite file next to the logs database
+    workers: int = 1
+    # Idle pre-started llm processes kept ready by the subprocess backend
+    worker_pool: int = 2
+    # Live chat conversations kept in memory by the in-process backend
+    chat_sessions: int = 64
+    chat_session_ttl: float = 1800.0
+    chat_session_max_size: int = 64 * 1024 * 1024
+    # Seconds a cancelled llm process gets to exit before it is killed
+    cancel_grace: float = 5.0
+    # Seconds before a metadata command (llm models/templates/tools list, --help) is killed
+    command_timeout: float = 60.0
+    # Seconds before cached model/template/tool listings are refreshed
+    registry_ttl: float = 300.0
+    # Generations allowed to run at once, overall and per model (0: no limit);
+    # with several workers each enforces its share of these and max_queue
+    max_concurrent: int = 8
+    max_concurrent_per_model: int = 0
+    # Requests that may wait for a free slot before new ones get HTTP 429
+    max_queue: int = 64
+    # Seconds a generation keeps running with no client attached, waiting
+    # for the client to reconnect
+    resume_grace: float = 15.0
+    # Replay buffer per generation (characters), for clients that reconnect
+    replay_buffer_size: int = 1024 * 1024
+    # Seconds a finished generation can still be replayed
+    replay_ttl: float = 300.0
+    # Replay buffers across all generations (characters)
+    replay_memory: int = 64 * 1024 * 1024
+    # Concurrent generations one /ws/chat connection may run
+    ws_max_streams: int = 8
+    # Largest accepted upload in bytes (0: no limit)
+    max_upload_size: int = 512 * 1024 * 1024
+    # Unreferenced attachments are deleted after this many seconds unused, and
+    # references to attachments unused that long lapse; past the quota
+    # (bytes of unreferenced attachments, 0: none) the least recently used go first
+    attachment_max_age: float = 7 * 24 * 3600
+    attachment_quota: int = 2 * 1024 * 1024 * 1024
+    # Stored images are sent downscaled to fit this many pixels (0: as
+    # uploaded), overridable per model as "model=pixels,..." (needs Pillow)
+    image_max_dimension: int = 0
+    image_max_dimensions: str = ""
+    # Answer repeated non-streamed prompts from a cache (opt-in), for this
+    # many seconds, keeping at most this many characters of responses
+    response_cache: bool = False
+    response_cache_ttl: float = 3600.0
+    response_cache_size: int = 64 * 1024 * 1024
+    # Compress responses (gzip, or Brotli with the brotli module) for clients
+    # that accept it; responses sent whole below this many bytes are not
+    compression: bool = True
+    compression_min_size: int = 512
+
+    @classmethod
+    def field_names(cls):
+        fields = getattr(cls, "model_fields", None) or cls.__fields__
+        return list(fields)
+
+    @classmethod
+    def from_env(cls, environ: Optional[Dict[str, str]] = None) -> "Settings":
+        """Build settings from ``LLM_WEBUI_<NAME>`` environment variables."""
+        environ = os.environ if environ is None else environ
+        values = {}
+        for name in cls.field_names():
+            key = ENV_PREFIX + name.upper()
+            if key in environ:
+                values[name] = environ[key]
+        return cls(**values)
+
+
+def export_to_env(**values: Any):
+    """Write settings to the environment so the server process picks them up.
+
+    ``None`` values are skipped so that defaults (or variables the user has
+    already exported) still apply. ``settings`` is updated too, for a server
+    imported into this process afterwards.
+    """
+    names = Settings.field_names()
+    for name, value in values.items():
+        if name not in names:
+            raise ValueError(f"Unknown setting: {name}")
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = "1" if value else "0"
+        os.environ[ENV_PREFIX + name.upper()] = str(value)
+    current = Settings.from_env()
+    for name in values:
+        setattr(settings, name, getattr(current, name))
+
+
+settings = Settings.from_env()
@@ -0,0 +1,343 @@
+"""State shared between the worker processes of ``llm webui --workers N``.
+
+Each worker keeps its caches and running generations in memory, so with
+several workers a request can land on a worker that has never seen them.
+The parts every worker has to agree on live in a small SQLite database
+next to the logs database instead:
+
+* registry invalidations, so ``/api/registry/invalidate`` clears the cached
+  listings of every worker, not only the one that answered it;
+* the events of running generations, so any worker can resume or cancel a
+  generation that another worker is running.
+
+Chat sessions need nothing here: ``SessionPool`` reloads a conversation
+when the logs database has moved on without it. Uploads are plain files.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from .events import DONE, ERROR
+from .generations import Generation, GenerationRegistry
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+create table if not exists invalidations (
+    name text primary key,
+    at real not null
+);
+create table if not exists generations (
+    id text primary key,
+    owner integer not null,
+    created real not null,
+    last_id integer not null default 0,
+    done integer not null default 0,
+    cancel_requested integer not null default 0,
+    last_read real not null default 0
+);
+create table if not exists generation_events (
+    generation_id text not null,
+    id integer not null,
+    event text not null,
+    data text not null,
+    primary key (generation_id, id)
+);
+"""
+
+# (id, event, data)
+Event = Tuple[int, str, Any]
+
+
+def default_path() -> Path:
+    import llm
+
+    return llm.user_dir() / "webui-state.db"
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedState:
+    def __init__(self, path: Path, owner: Optional[int] = None):
+        self.path = Path(path)
+        # Generations are owned by the worker process that runs them
+        self.owner = os.getpid() if owner is None else owner
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections can't be shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            self._local.conn = conn
+        return conn
+
+    def invalidate(self, name: str) -> float:
+        at = time.time()
+        self._connect().execute(
+            "insert or replace into invalidations (name, at) values (?, ?)", [name, at]
+        )
+        return at
+
+    def invalidations(self) -> Dict[str, float]:
+        return dict(self._connect().execute("select name, at from invalidations"))
+
+    def add_generation(self, generation_id: str):
+        self._connect().execute(
+            "insert or ignore into generations (id, owner, created) values (?, ?, ?)",
+            [generation_id, self.owner, time.time()],
+        )
+
+    def generation(self, generation_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "select owner, last_id, done from generations where id = ?", [generation_id]
+        ).fetchone()
+        if row is None:
+            return None
+        return {"owner": row[0], "last_id": row[1], "done": bool(row[2])}
+
+    def append_events(self, batches: Dict[str, List[Event]]):
+        """Store newly buffered events, one transaction for all generations."""
+        conn = self._connect()
+        with conn:
+            conn.execute("begin")
+            for generation_id, events in batches.items():
+                conn.executemany(
+                    "insert or ignore into generation_events (generation_id, id, event, data)"
+                    " values (?, ?, ?, ?)",
+                    [
+                        (generation_id, event_id, event, json.dumps(data, default=str))
+                        for event_id, event, data in events
+                    ],
+                )
+                conn.execute(
+                    "update generations set last_id = ?, done = done or ? where id = ?",
+                    [events[-1][0], any(e[1] == DONE for e in events), generation_id],
+                )
+
+    def read_events(self, generation_id: str, after: int, limit: int = 500) -> List[Event]:
+        """Events after ``after``; also tells the owner someone is still reading."""
+        conn = self._connect()
+        conn.execute(
+            "update generations set last_read = ? where id = ?", [time.time(), generation_id]
+        )
+        rows = conn.execute(
+            "select id, event, data from generation_events"
+            " where generation_id = ? and id > ? order by id limit ?",
+            [generation_id, after, limit],
+        )
+        return [(event_id, event, json.loads(data)) for event_id, event, data in rows]
+
+    def request_cancel(self, generation_id: str) -> bool:
+        cursor = self._connect().execute(
+            "update generations set cancel_requested = 1 where id = ? and not done",
+            [generation_id],
+        )
+        return cursor.rowcount > 0
+
+    def owned_requests(self) -> List[Tuple[str, bool, float]]:
+        """(id, cancel requested, last remote read) of this worker's running generations."""
+        rows = self._connect().execute(
+            "select id, cancel_requested, last_read from generations where owner = ? and not done",
+            [self.owner],
+        )
+        return [(row[0], bool(row[1]), row[2]) for row in rows]
+
+    def purge(self, max_age: float):
+        """Forget generations started more than ``max_age`` seconds ago."""
+        conn = self._connect()
+        with conn:
+            conn.execute("begin")
+            conn.execute("delete from generations where created < ?", [time.time() - max_age])
+            conn.execute(
+                "delete from generation_events"
+                " where generation_id not in (select id from generations)"
+            )
+
+
+class RemoteGeneration:
+    """A generation another worker is running, followed through SharedState.
+
+    Offers the parts of the Generation interface that clients use to
+    resume or cancel it. ``info`` is the generation's shared record as of
+    the lookup, refreshed while following it, so none of these touch the
+    database from the event loop.
+    """
+
+    def __init__(
+        self,
+        state: SharedState,
+        generation_id: str,
+        info: Dict[str, Any],
+        poll_interval: float = 0.2,
+    ):
+        self.state = state
+        self.id = generation_id
+        self.info = info
+        self.poll_interval = poll_interval
+        self._cancelling: Optional[asyncio.Future] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.info["done"]
+
+    def cancel(self):
+        # The owner picks the request up on its next sync
+        self._cancelling = asyncio.ensure_future(
+            run_in_threadpool(self.state.request_cancel, self.id)
+        )
+
+    def check_resume(self, after: int):
+        if after < 0 or after > self.info["last_id"]:
+            raise ValueError(f"Generation {self.id} has no event {after}")
+
+    async def follow(self, after: int = 0):
+        """Yield ``(id, event, data)`` after ``after`` as the owner stores them."""
+        self.check_resume(after)
+        while True:
+            events = await run_in_threadpool(self.state.read_events, self.id, after)
+            for event_id, event, data in events:
+                after = event_id
+                yield event_id, event, data
+                if event == DONE:
+                    self.info = dict(self.info, last_id=event_id, done=True)
+                    return
+            if events:
+                continue
+            info = await run_in_threadpool(self.state.generation, self.id)
+            if info is not None:
+                self.info = info
+            if info is None or (not info["done"] and not process_alive(info["owner"])):
+                # The worker running it has gone; end the stream the usual way
+                yield after + 1, ERROR, "The server worker running this generation exited"
+                yield after + 2, DONE, {"generation_id": self.id}
+                return
+            await asyncio.sleep(self.poll_interval)
+
+
+class Coordinator:
+    """Keeps this worker's generations and caches in step with the other workers.
+
+    Newly buffered events are written to the shared database in batches
+    every ``interval`` seconds, which is also how often cancellations,
+    remote readers and registry invalidations from other workers are
+    picked up.
+    """
+
+    def __init__(
+        self,
+        state: SharedState,
+        generations: GenerationRegistry,
+        listings: Dict[str, Any],
+        interval: float = 0.2,
+        resume_grace: float = 15.0,
+        max_age: float = 3600.0,
+    ):
+        self.state = state
+        self.generations = generations
+        self.listings = listings
+        self.interval = interval
+        self.resume_grace = resume_grace
+        # Shared generation records are kept this long
+        self.max_age = max_age
+        self._pending: Dict[str, List[Event]] = {}
+        self._seen = state.invalidations()
+        self._last_purge = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def share(self, generation: Generation):
+        """Share a new generation of this worker, and every event it buffers.
+
+        Call it before the generation runs, so no event is missed.
+        """
+
+        def listener(event_id: int, event: str, data: Any):
+            self._pending.setdefault(generation.id, []).append((event_id, event, data))
+
+        generation.listeners.append(listener)
+        await run_in_threadpool(self.state.add_generation, generation.id)
+
+    async def remote(self, generation_id: str) -> Optional[RemoteGeneration]:
+        """The generation if another worker is running (or ran) it."""
+        info = await run_in_threadpool(self.state.generation, generation_id)
+        if info is None or info["owner"] == self.state.owner:
+            return None
+        return RemoteGeneration(self.state, generation_id, info, self.interval)
+
+    def invalidate(self, name: str):
+        """Clear a cached listing here and, on their next sync, in every other worker."""
+        self._seen[name] = self.state.invalidate(name)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await self.sync()
+
+    async def sync(self):
+        batches, self._pending = self._pending, {}
+        try:
+            requests, invalidations = await run_in_threadpool(self._exchange, batches)
+        except Exception:
+            # Keep the events for the next attempt
+            for generation_id, events in batches.items():
+                self._pending[generation_id] = events + self._pending.get(generation_id, [])
+            raise
+        for generation_id, cancel_requested, last_read in requests:
+            generation = self.generations.get(generation_id)
+            if generation is None or generation.finished:
+                continue
+            if cancel_requested:
+                if not generation.cancelled.is_set():
+                    generation.cancel()
+            elif time.time() - last_read < self.resume_grace:
+                generation.hold(self.resume_grace)
+        for name, at in invalidations.items():
+            if at > self._seen.get(name, 0) and name in self.listings:
+                self.listings[name].invalidate()
+            self._seen[name] = max(at, self._seen.get(name, 0))
+
+    def _exchange(self, batches: Dict[str, List[Event]]):
+        if batches:
+            self.state.append_events(batches)
+        now = time.monotonic()
+        if now - self._last_purge >= 60:
+            self._last_purge = now
+            self.state.purge(self.max_age)
+        return self.state.owned_requests(), self.state.invalidations()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning("Failed to sync shared state: %s", e)
+            await asyncio.sleep(self.interval)
@@ -1,4 +1,8 @@
 // LLM WebUI JavaScript Application
+
+// Exchanges fetched per page when opening or scrolling back through a conversation
+const MESSAGE_PAGE_SIZE = 50;
+
 class LLMWebUI {
     constructor() {
         this.currentTab = 'prompt';
@@ -8,6 +12,36 @@ class LLMWebUI {
         this.uploadedFiles = [];
         this.currentChatId = null;
         this.conversations = [];
+        this.conversationsCursor = null;
+        this.loadingConversations = false;
+        this.logsCursor = null;
+        this.currentGenerationId = null;
+        this.abortController = null;
+        // Chat turns multiplexed over one WebSocket, keyed by stream id
+        this.chatSocketReady = null;
+        this.chatStreams = new Map();
+        this.nextChatStream = 1;
+        this.currentChatStream = null;
+        this.chatReconnects = 0;
+        // Older messages of the open conversation are fetched page by page
+        this.messagesCursor = null;
+        this.loadingMessages = false;
+        this.scrollTranscriptOnShow = false;
+        // Conversations opened before, so reopening one fetches only new turns
+        this.conversationCache = new ConversationCache();
+        // Only the rows in view are in the DOM
+        this.chatTranscript = new VirtualList({
+            scroller: document.getElementById('chat-messages'),
+            container: document.getElementById('chat-messages'),
+            estimatedHeight: 80,
+            renderItem: (message) => this.renderChatMessage(message)
+        });
+        this.conversationList = new VirtualList({
+            scroller: document.getElementById('conversation-scroll'),
+            container: document.getElementById('conversation-list'),
+            estimatedHeight: 62,
+            renderItem: (item) => this.renderConversationItem(item)
+        });
         
         this.initializeEventListeners();
         this.initializeApp();
@@ -43,6 +77,11 @@ class LLMWebUI {
             this.sendChatMessage();
         });
 
+        // Stop buttons cancel the running generation
+        document.querySelectorAll('[data-stop-generation]').forEach(button => {
+            button.addEventListener('click', () => this.stopGeneration());
+        });
+
         // New chat button
         document.getElementById('new-chat').addEventListener('click', () => {
             this.startNewChat();
@@ -76,6 +115,12 @@ class LLMWebUI {
                 this.handleFileUpload(e.dataTransfer.files);
             }
         });
+        // Attachments still waiting for a prompt when the page goes away.
+        // A page kept for back/forward navigation keeps them; the server
+        // lets references lapse after a while in any case.
+        window.addEventListener('pagehide', (e) => {
+            if (!e.persisted) this.releaseAttachments(this.uploadedFiles);
+        });
         // Clipboard paste for images
         window.addEventListener('paste', async (e) => {
             const items = e.clipboardData && e.clipboardData.items;
@@ -117,8 +162,33 @@ class LLMWebUI {
         document.getElementById('refresh-conversations').addEventListener('click', () => {
             this.loadConversations();
         });
-        document.getElementById('conversation-filter').addEventListener('input', (e) => {
-            this.renderConversations(e.target.value.toLowerCase());
+        document.getElementById('conversation-filter').addEventListener('input', () => {
+            // Debounce server-side search while typing
+            clearTimeout(this.searchTimer);
+            this.searchTimer = setTimeout(() => this.refreshConversationList(), 250);
+        });
+        // Fetch older conversations when the sidebar is scrolled near the end
+        const conversationScroll = document.getElementById('conversation-scroll');
+        conversationScroll.addEventListener('scroll', () => {
+            const remaining = conversationScroll.scrollHeight - conversationScroll.scrollTop - conversationScroll.clientHeight;
+            if (remaining < 100) {
+                this.loadMoreConversations();
+            }
+        });
+        // One listener for every row, including rows rendered later
+        document.getElementById('conversation-list').addEventListener('click', (e) => {
+            const li = e.target.closest('li[data-cid]');
+            if (li) this.selectConversation(li.dataset.cid);
+        });
+        // Fetch older messages when the transcript is scrolled near the top
+        const chatMessages = document.getElementById('chat-messages');
+        chatMessages.addEventListener('scroll', () => {
+            if (chatMessages.scrollTop < 200) {
+                this.loadOlderMessages();
+            }
+        }, { passive: true });
+        document.getElementById('load-more-logs').addEventListener('click', () => {
+            this.loadLogs(true);
         });
 
         // Help modal
@@ -168,6 +238,15 @@ class LLMWebUI {
             this.displayTemplates();
         } else if (tabName === 'logs') {
             this.loadLogs();
+        } else if (tabName === 'chat') {
+            // Lists laid out while hidden had nothing to measure
+            this.conversationList.update();
+            this.chatTranscript.update();
+            if (this.scrollTranscriptOnShow) {
+                this.scrollTranscriptOnShow = false;
+                const messagesContainer = document.getElementById('chat-messages');
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            }
         }
     }
 
@@ -353,8 +432,19 @@ class LLMWebUI {
         if (Object.keys(options).length) chatData.options = options;
         if (Object.keys(reasoning).length) chatData.reasoning = reasoning;
 
+        const render = this.streamEventRenderer(messageContent);
+        const onEvent = (event, data) => {
+            if (event === 'conversation') this.currentChatId = data.conversation_id;
+            render(event, data);
+        };
+
         try {
-            await this.streamResponse('/api/chat', chatData, messageContent);
+            const socket = await this.connectChatSocket();
+            if (socket) {
+                await this.streamChatSocket(socket, chatData, onEvent);
+            } else {
+                await this.streamResponse('/api/chat', chatData, messageContent, onEvent);
+            }
             // After message sent, refresh conversation list and set currentChatId if new
             await this.loadConversations();
             if (!this.currentChatId && this.conversations.length > 0) {
@@ -370,24 +460,35 @@ class LLMWebUI {
     addChatMessage(content, role) {
         const messagesContainer = document.getElementById('chat-messages');
         
+        // The element is kept with the message: it may still be streamed
+        // into while scrolled out of view
+        const message = { role, content };
+        message.element = this.renderChatMessage(message);
+        this.chatTranscript.append(message);
+        
+        // Scroll to bottom
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        
+        return message.element;
+    }
+
+    renderChatMessage(message) {
+        if (message.element) return message.element;
         const messageEl = document.createElement('div');
-        messageEl.className = `message ${role}`;
+        messageEl.className = `message ${message.role}`;
         
         const contentEl = document.createElement('div');
         contentEl.className = 'message-content';
-        contentEl.textContent = content;
+        contentEl.textContent = message.content;
         
         messageEl.appendChild(contentEl);
-        messagesContainer.appendChild(messageEl);
-        
-        // Scroll to bottom
-        messagesContainer.scrollTop = messagesContainer.scrollHeight;
-        
         return messageEl;
     }
 
     startNewChat() {
         this.currentChatId = null;
+        this.messagesCursor = null;
+        this.highlightConversation(null);
         const messagesContainer = document.getElementById('chat-messages');
         messagesContainer.innerHTML = `
             <div class="welcome-message text-center p-4">
@@ -398,51 +499,270 @@ class LLMWebUI {
         document.getElementById('chat-input').focus();
     }
 
-    async streamResponse(url, data, container) {
-        const response = await fetch(url, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify(data)
-        });
+    async streamResponse(url, data, container, onEvent = this.streamEventRenderer(container)) {
+        this.abortController = new AbortController();
+        let response;
+        try {
+            response = await fetch(url, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
+                },
+                body: JSON.stringify(data),
+                signal: this.abortController.signal
+            });
+        } catch (error) {
+            if (error.name === 'AbortError') return;
+            throw error;
+        }
 
+        if (response.status === 429) {
+            const retryAfter = response.headers.get('Retry-After');
+            throw new Error(`The server is busy, please try again in ${retryAfter || 'a few'} seconds`);
+        }
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
 
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let fullResponse = '';
+        this.currentGenerationId = response.headers.get('X-Generation-Id');
+        this.toggleStopButtons(true);
+
+        let lastEventId = 0;
+        let finished = false;
+        const handle = (event, data, id) => {
+            if (id) lastEventId = id;
+            if (event === 'done') finished = true;
+            onEvent(event, data);
+        };
 
         try {
-            while (true) {
-                const { done, value } = await reader.read();
-                
-                if (done) break;
-                
-                const chunk = decoder.decode(value);
-                fullResponse += chunk;
-                container.innerHTML = this.formatResponse(fullResponse);
-                
-                // Auto-scroll chat messages
-                if (container.closest('.chat-messages')) {
-                    container.closest('.chat-messages').scrollTop = container.closest('.chat-messages').scrollHeight;
+            for (let attempt = 0; !finished; attempt++) {
+                if (attempt > 0) {
+                    // The connection dropped mid-generation; the server kept
+                    // going, so fetch only the events we missed
+                    if (attempt > 5) throw new Error('Connection lost');
+                    await new Promise(resolve => setTimeout(resolve, 500 * 2 ** (attempt - 1)));
+                    try {
+                        response = await fetch(`/api/generations/${encodeURIComponent(this.currentGenerationId)}/events`, {
+                            headers: {
+                                'Accept': 'text/event-stream',
+                                'Last-Event-ID': String(lastEventId)
+                            },
+                            signal: this.abortController.signal
+                        });
+                    } catch (error) {
+                        if (error.name === 'AbortError') throw error;
+                        continue;
+                    }
+                    if (response.status === 404 || response.status === 410) {
+                        throw new Error('Connection lost and the response can no longer be resumed');
+                    }
+                    if (!response.ok) continue;
+                }
+                try {
+                    await this.readEventStream(response.body.getReader(), handle);
+                } catch (error) {
+                    if (error.name === 'AbortError') throw error;
                 }
             }
+        } catch (error) {
+            // Stopped by the user; keep what has arrived so far
+            if (error.name !== 'AbortError') throw error;
         } finally {
-            reader.releaseLock();
+            this.currentGenerationId = null;
+            this.abortController = null;
+            this.toggleStopButtons(false);
         }
     }
 
+    streamEventRenderer(container) {
+        // Returns an (event, data) handler that draws a streamed response
+        const scroll = () => {
+            // Auto-scroll chat messages
+            if (container.closest('.chat-messages')) {
+                container.closest('.chat-messages').scrollTop = container.closest('.chat-messages').scrollHeight;
+            }
+        };
+        let markdown = null;
+        return (event, data) => {
+            if (event === 'token') {
+                if (!markdown) {
+                    // Replaces the queue notice, if any
+                    container.replaceChildren();
+                    markdown = new MarkdownStream(container, scroll);
+                }
+                // Rendered on the next animation frame
+                markdown.append(data.text);
+                return;
+            } else if (event === 'done') {
+                if (markdown) markdown.finish();
+                return;
+            } else if (event === 'queued' && !markdown) {
+                const queuedEl = document.createElement('div');
+                queuedEl.className = 'text-muted fst-italic';
+                queuedEl.textContent = `Waiting for a free slot (position ${data.position} in queue)...`;
+                container.replaceChildren(queuedEl);
+            } else if (event === 'error') {
+                if (markdown) markdown.finish();
+                const errorEl = document.createElement('div');
+                errorEl.className = 'text-danger';
+                errorEl.textContent = `Error: ${data.message}`;
+                container.appendChild(errorEl);
+            } else {
+                return;
+            }
+            scroll();
+        };
+    }
+
+    connectChatSocket() {
+        // One socket per tab carries every chat turn; resolves to null when
+        // WebSockets are unavailable so callers can fall back to /api/chat
+        if (this.chatSocketReady) return this.chatSocketReady;
+        this.chatSocketReady = new Promise(resolve => {
+            let socket;
+            try {
+                const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+                socket = new WebSocket(`${scheme}://${window.location.host}/ws/chat`);
+            } catch (error) {
+                this.chatSocketReady = null;
+                resolve(null);
+                return;
+            }
+            socket.addEventListener('open', () => {
+                this.chatReconnects = 0;
+                resolve(socket);
+            });
+            socket.addEventListener('message', (e) => this.handleChatSocketMessage(JSON.parse(e.data)));
+            socket.addEventListener('close', () => {
+                this.chatSocketReady = null;
+                resolve(null);
+                this.reattachChatStreams();
+            });
+        });
+        return this.chatSocketReady;
+    }
+
+    async reattachChatStreams() {
+        // Pick the turns in flight back up from the server's replay buffer
+        if (!this.chatStreams.size) return;
+        if (this.chatReconnects >= 5) {
+            this.chatStreams.forEach(stream => stream.reject(new Error('Connection lost')));
+            this.chatStreams.clear();
+            return;
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * 2 ** this.chatReconnects++));
+        const socket = await this.connectChatSocket();
+        // A failed attempt closes the socket, which retries from its close handler
+        if (!socket) return;
+        this.chatStreams.forEach((stream, streamId) => {
+            if (stream.generationId) {
+                socket.send(JSON.stringify({
+                    type: 'attach',
+                    stream: streamId,
+                    generation: stream.generationId,
+                    after: stream.lastId
+                }));
+            } else {
+                this.chatStreams.delete(streamId);
+                stream.reject(new Error('Connection lost'));
+            }
+        });
+    }
+
+    handleChatSocketMessage(message) {
+        const stream = this.chatStreams.get(message.stream);
+        if (!stream) return;
+        if (message.id) stream.lastId = message.id;
+        if (message.event === 'started') {
+            stream.generationId = message.data.generation_id;
+        } else if (message.event === 'done') {
+            this.chatStreams.delete(message.stream);
+            // Lets the handler flush what it has buffered (markdown.finish)
+            stream.onEvent(message.event, message.data);
+            stream.resolve();
+        } else if (message.event === 'error' && message.id === undefined) {
+            // Errors without an event id are about the request itself
+            this.chatStreams.delete(message.stream);
+            stream.reject(new Error(message.data.message));
+        } else {
+            stream.onEvent(message.event, message.data);
+        }
+    }
+
+    streamChatSocket(socket, data, onEvent) {
+        const streamId = String(this.nextChatStream++);
+        this.currentChatStream = streamId;
+        this.toggleStopButtons(true);
+        return new Promise((resolve, reject) => {
+            this.chatStreams.set(streamId, { onEvent, resolve, reject, generationId: null, lastId: 0 });
+            socket.send(JSON.stringify({ type: 'chat', stream: streamId, ...data }));
+        }).finally(() => {
+            if (this.currentChatStream === streamId) {
+                this.currentChatStream = null;
+                this.toggleStopButtons(false);
+            }
+        });
+    }
+
+    async readEventStream(reader, onEvent) {
+        // Minimal Server-Sent Events parser: the server only sends
+        // id/event/data fields, each message ending in a blank line
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            // stream: true keeps multi-byte characters split across reads intact
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const message = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                let data = '';
+                let id = null;
+                for (const line of message.split('\n')) {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                    else if (line.startsWith('id: ')) id = Number(line.slice(4));
+                }
+                if (data) onEvent(event, JSON.parse(data), id);
+            }
+        }
+    }
+
+    async stopGeneration() {
+        if (this.currentChatStream) {
+            const socket = await this.connectChatSocket();
+            if (socket) socket.send(JSON.stringify({ type: 'cancel', stream: this.currentChatStream }));
+            return;
+        }
+        const generationId = this.currentGenerationId;
+        if (generationId) {
+            try {
+                await fetch(`/api/prompt/${encodeURIComponent(generationId)}/cancel`, { method: 'POST' });
+            } catch (error) {
+                console.error('Failed to cancel generation:', error);
+            }
+        }
+        // Dropping the connection also stops the server-side run
+        if (this.abortController) {
+            this.abortController.abort();
+        }
+    }
+
+    toggleStopButtons(visible) {
+        document.querySelectorAll('[data-stop-generation]').forEach(button => {
+            button.classList.toggle('d-none', !visible);
+        });
+    }
+
     formatResponse(text) {
-        // Basic markdown-like formatting
-        return text
-            .replace(/\n/g, '<br>')
-            .replace(/```([^`]+)```/g, '<pre><code>$1</code></pre>')
-            .replace(/`([^`]+)`/g, '<code>$1</code>')
-            .replace(/\*\*([^*]+)\*\*/g, '<strong>$1</strong>')
-            .replace(/\*([^*]+)\*/g, '<em>$1</em>');
+        // Basic markdown-like formatting (see markdown.js)
+        return renderMarkdown(text);
     }
 
     displayModels() {
@@ -488,20 +808,27 @@ class LLMWebUI {
         `).join('');
     }
 
-    async loadLogs() {
+    async loadLogs(append = false) {
         const container = document.getElementById('logs-list');
+        const loadMore = document.getElementById('load-more-logs');
         
         try {
-            const response = await fetch('/api/logs');
+            let url = '/api/logs';
+            if (append && this.logsCursor) {
+                url += `?cursor=${encodeURIComponent(this.logsCursor)}`;
+            }
+            const response = await fetch(url);
             const data = await response.json();
             const logs = Array.isArray(data) ? data : (data.logs || []);
+            this.logsCursor = data.next_cursor || null;
+            loadMore.classList.toggle('d-none', !this.logsCursor);
             
-            if (logs.length === 0) {
+            if (logs.length === 0 && !append) {
                 container.innerHTML = '<p class="text-muted">No logs available</p>';
                 return;
             }
 
-            container.innerHTML = logs.map(log => `
+            const html = logs.map(log => `
                 <div class="log-entry">
                     <div class="log-meta">
                         <strong>Model:</strong> ${log.model || 'Default'} |
@@ -511,6 +838,11 @@ class LLMWebUI {
                     <div class="log-response">${this.truncateText(log.response || '', 500)}</div>
                 </div>
             `).join('');
+            if (append) {
+                container.insertAdjacentHTML('beforeend', html);
+            } else {
+                container.innerHTML = html;
+            }
         } catch (error) {
             console.error('Failed to load logs:', error);
             container.innerHTML = '<p class="text-danger">Failed to load logs</p>';
@@ -523,18 +855,54 @@ class LLMWebUI {
         });
     }
 
-    async uploadFile(file) {
-        const formData = new FormData();
-        formData.append('file', file);
+    async sha256Hex(file) {
+        const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async reuseStoredFile(file) {
+        // Hashing means reading the whole file, so only for small enough ones
+        if (!window.crypto || !crypto.subtle || file.size > 64 * 1024 * 1024) {
+            return null;
+        }
+        const sha256 = await this.sha256Hex(file);
+        const response = await fetch(`/api/attachments/${sha256}/refs`, { method: 'POST' });
+        if (!response.ok) {
+            return null;
+        }
+        const stored = await response.json();
+        return {
+            filename: file.name,
+            path: stored.path,
+            size: stored.size,
+            mimetype: file.type || stored.mimetype,
+            sha256: stored.sha256,
+            deduplicated: true
+        };
+    }
 
+    async uploadFile(file) {
         try {
-            const response = await fetch('/api/upload', {
+            // Already on the server: reuse it without sending it again
+            const reused = await this.reuseStoredFile(file).catch(() => null);
+            if (reused) {
+                this.uploadedFiles.push(reused);
+                this.displayUploadedFiles();
+                this.showSuccess(`Uploaded: ${file.name}`);
+                return;
+            }
+
+            // Send the file as the raw body; the browser streams it from disk
+            const url = `/api/upload?filename=${encodeURIComponent(file.name)}`;
+            const response = await fetch(url, {
                 method: 'POST',
-                body: formData
+                headers: { 'Content-Type': file.type || 'application/octet-stream' },
+                body: file
             });
 
             if (!response.ok) {
-                throw new Error('Upload failed');
+                const error = await response.json().catch(() => ({}));
+                throw new Error(error.detail || 'Upload failed');
             }
 
             const result = await response.json();
@@ -544,7 +912,7 @@ class LLMWebUI {
             this.showSuccess(`Uploaded: ${file.name}`);
         } catch (error) {
             console.error('Upload error:', error);
-            this.showError(`Failed to upload: ${file.name}`);
+            this.showError(`Failed to upload ${file.name}: ${error.message}`);
         }
     }
 
@@ -566,13 +934,22 @@ class LLMWebUI {
                 <button class="btn btn-sm btn-outline-danger" title="Remove"><i class="fas fa-times"></i></button>
             `;
             item.querySelector('button').addEventListener('click', () => {
-                this.uploadedFiles.splice(idx, 1);
+                const [removed] = this.uploadedFiles.splice(idx, 1);
+                if (removed) this.releaseAttachments([removed]);
                 this.displayUploadedFiles();
             });
             container.appendChild(item);
         });
     }
 
+    releaseAttachments(files) {
+        // Lets the server garbage-collect them once nobody uses them.
+        // keepalive lets the request outlive the page when it is closing.
+        files.filter(file => file.sha256).forEach(file => {
+            fetch(`/api/attachments/${file.sha256}/refs`, { method: 'DELETE', keepalive: true }).catch(() => {});
+        });
+    }
+
     updateModelOptions(modelId) {
         const container = document.getElementById('model-options');
         // This would be implemented to show model-specific options
@@ -660,70 +1037,208 @@ class LLMWebUI {
         try {
             const res = await fetch('/api/conversations');
             const data = await res.json();
-            this.conversations = Array.isArray(data) ? data : [];
-            this.renderConversations(document.getElementById('conversation-filter').value.toLowerCase());
+            this.conversations = Array.isArray(data) ? data : (data.conversations || []);
+            this.conversationsCursor = data.next_cursor || null;
+            this.refreshConversationList();
         } catch (e) {
             console.error('Failed to load conversations', e);
         }
     }
 
-    renderConversations(filter = '') {
-        const list = document.getElementById('conversation-list');
-        list.innerHTML = '';
-        const items = this.conversations.filter(c => {
-            const title = c.last_prompt || c.conversation_id || '';
-            return title.toLowerCase().includes(filter);
-        });
-        items.forEach((c, idx) => {
-            const li = document.createElement('li');
-            li.className = 'list-group-item';
-            li.dataset.cid = c.conversation_id;
-            li.innerHTML = `
-                <div>
-                    <div class="conv-title text-truncate">${this.escapeHtml(c.last_prompt || '(no prompt)')}</div>
-                    <div class="conv-meta">${c.model || 'model'} • ${c.latest || ''} • ${c.count || 1} msgs</div>
-                </div>
-            `;
-            li.addEventListener('click', () => {
-                this.selectConversation(c.conversation_id, li);
+    refreshConversationList() {
+        const query = document.getElementById('conversation-filter').value.trim();
+        if (query) {
+            this.searchConversations(query);
+        } else {
+            this.renderConversations();
+        }
+    }
+
+    async loadMoreConversations() {
+        if (!this.conversationsCursor || this.loadingConversations) return;
+        // Search results are not paged into the sidebar
+        if (document.getElementById('conversation-filter').value.trim()) return;
+        this.loadingConversations = true;
+        try {
+            const res = await fetch(`/api/conversations?cursor=${encodeURIComponent(this.conversationsCursor)}`);
+            const data = await res.json();
+            this.conversations.push(...(data.conversations || []));
+            this.conversationsCursor = data.next_cursor || null;
+            this.renderConversations();
+        } catch (e) {
+            console.error('Failed to load more conversations', e);
+        } finally {
+            this.loadingConversations = false;
+        }
+    }
+
+    renderConversations() {
+        this.conversationList.setItems(this.conversations.map(c => ({
+            cid: c.conversation_id,
+            title: this.escapeHtml(c.last_prompt || '(no prompt)'),
+            meta: `${this.escapeHtml(c.model || 'model')} • ${this.escapeHtml(c.latest || '')} • ${c.count || 1} msgs`
+        })));
+        if (!this.currentChatId && this.conversations.length > 0) {
+            // Auto-select first if none selected
+            this.selectConversation(this.conversations[0].conversation_id);
+        }
+    }
+
+    renderConversationItem(item) {
+        const li = document.createElement('li');
+        li.className = 'list-group-item';
+        if (!item.cid) {
+            li.classList.add('text-muted');
+            li.textContent = item.title;
+            return li;
+        }
+        li.dataset.cid = item.cid;
+        // Titles and meta are already escaped (search snippets carry <mark>)
+        li.innerHTML = `
+            <div>
+                <div class="conv-title text-truncate">${item.title}</div>
+                <div class="conv-meta text-truncate">${item.meta}</div>
+            </div>
+        `;
+        if (item.cid === this.currentChatId) {
+            li.classList.add('active');
+        }
+        return li;
+    }
+
+    async searchConversations(query) {
+        try {
+            const res = await fetch(`/api/search?q=${encodeURIComponent(query)}&limit=50`);
+            const data = await res.json();
+            // Ignore results for a query the user has already changed
+            if (document.getElementById('conversation-filter').value.trim() !== query) return;
+            this.renderSearchResults(data.results || []);
+        } catch (e) {
+            console.error('Search failed', e);
+        }
+    }
+
+    renderSearchResults(results) {
+        // Best match per conversation; snippets arrive escaped with <mark> highlights
+        const seen = new Set();
+        const items = [];
+        results.forEach(r => {
+            if (!r.conversation_id || seen.has(r.conversation_id)) return;
+            seen.add(r.conversation_id);
+            items.push({
+                cid: r.conversation_id,
+                title: r.prompt || r.response || r.system || '(no prompt)',
+                meta: `${this.escapeHtml(r.model || 'model')} • ${this.escapeHtml(r.datetime_utc || '')}`
             });
-            list.appendChild(li);
-            // Highlight current
-            if (this.currentChatId && this.currentChatId === c.conversation_id) {
-                li.classList.add('active');
-            } else if (!this.currentChatId && idx === 0) {
-                // Auto-select first if none selected
-                this.currentChatId = c.conversation_id;
-                li.classList.add('active');
-                this.selectConversation(c.conversation_id, li);
-            }
+        });
+        if (!items.length) {
+            items.push({ cid: null, title: 'No matches' });
+        }
+        this.conversationList.setItems(items);
+    }
+
+    highlightConversation(cid) {
+        // Rows out of view are rendered with the right class when they scroll in
+        document.querySelectorAll('#conversation-list li[data-cid]').forEach(li => {
+            li.classList.toggle('active', li.dataset.cid === cid);
         });
     }
 
-    async selectConversation(cid, listItemEl) {
+    async selectConversation(cid) {
         this.currentChatId = cid;
-        // Update active class
-        const list = document.getElementById('conversation-list');
-        list.querySelectorAll('.list-group-item').forEach(li => li.classList.remove('active'));
-        listItemEl?.classList.add('active');
-        // Load messages into chat panel
+        this.messagesCursor = null;
+        this.highlightConversation(cid);
+        const url = `/api/conversations/${encodeURIComponent(cid)}/messages?limit=${MESSAGE_PAGE_SIZE}`;
         try {
-            const res = await fetch(`/api/conversations/${encodeURIComponent(cid)}`);
-            const rows = await res.json();
+            const cached = await this.conversationCache.get(cid);
+            // Another conversation may have been selected meanwhile
+            if (this.currentChatId !== cid) return;
+            if (cached && await this.syncCachedConversation(cached, url)) return;
+            // Not cached, or too much changed: load the latest messages; older ones follow on scroll
+            const res = await fetch(url, { cache: 'no-store' });
+            const data = await res.json();
+            if (this.currentChatId !== cid) return;
+            this.messagesCursor = data.next_cursor || null;
+            const rows = data.messages || [];
             this.renderConversationMessages(rows);
+            if (rows.length) {
+                this.conversationCache.put({ cid, rows, cursor: this.messagesCursor, etag: res.headers.get('ETag') });
+            }
         } catch (e) {
             console.error('Failed to fetch conversation', e);
         }
     }
 
+    async syncCachedConversation(cached, url) {
+        // Show the cached copy straight away, then fetch only the turns
+        // logged after its newest one. False if it can't be brought up to date.
+        this.messagesCursor = cached.cursor;
+        this.renderConversationMessages(cached.rows);
+        const headers = cached.etag ? { 'If-None-Match': cached.etag } : {};
+        const res = await fetch(`${url}&after_id=${encodeURIComponent(cached.rows[0].id)}`, { cache: 'no-store', headers });
+        if (res.status === 304) return true;
+        // 400: the cached turns are no longer in the logs
+        if (!res.ok) return false;
+        const data = await res.json();
+        if (this.currentChatId !== cached.cid) return true;
+        // More new turns than one page: simpler to start over
+        if (data.next_cursor) return false;
+        const rows = data.messages || [];
+        if (rows.length) {
+            this.chatMessagesFromRows(rows).forEach(message => this.chatTranscript.append(message));
+            const messagesContainer = document.getElementById('chat-messages');
+            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        }
+        this.conversationCache.put({ ...cached, rows: rows.concat(cached.rows), etag: res.headers.get('ETag') });
+        return true;
+    }
+
     renderConversationMessages(rows) {
         const messagesContainer = document.getElementById('chat-messages');
-        messagesContainer.innerHTML = '';
-        // Build alternating user/assistant messages from logs
-        rows.forEach(row => {
-            if (row.prompt) this.addChatMessage(row.prompt, 'user');
-            if (row.response) this.addChatMessage(row.response, 'assistant');
+        this.chatTranscript.setItems(this.chatMessagesFromRows(rows));
+        // A hidden panel can't be scrolled; done when the chat tab is shown
+        this.scrollTranscriptOnShow = !messagesContainer.clientHeight;
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        requestAnimationFrame(() => {
+            // Again, now that the rows in view have been measured
+            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            // A short first page doesn't scroll, so nothing would ask for more
+            if (messagesContainer.clientHeight && messagesContainer.scrollHeight <= messagesContainer.clientHeight) {
+                this.loadOlderMessages();
+            }
+        });
+    }
+
+    chatMessagesFromRows(rows) {
+        // Rows come newest first; build alternating user/assistant messages oldest first
+        const messages = [];
+        rows.slice().reverse().forEach(row => {
+            if (row.prompt) messages.push({ role: 'user', content: row.prompt });
+            if (row.response) messages.push({ role: 'assistant', content: row.response });
         });
+        return messages;
+    }
+
+    async loadOlderMessages() {
+        const cid = this.currentChatId;
+        if (!cid || !this.messagesCursor || this.loadingMessages) return;
+        this.loadingMessages = true;
+        try {
+            const res = await fetch(`/api/conversations/${encodeURIComponent(cid)}/messages?limit=${MESSAGE_PAGE_SIZE}&cursor=${encodeURIComponent(this.messagesCursor)}`, { cache: 'no-store' });
+            const data = await res.json();
+            if (this.currentChatId !== cid) return;
+            this.messagesCursor = data.next_cursor || null;
+            const rows = data.messages || [];
+            this.chatTranscript.prepend(this.chatMessagesFromRows(rows));
+            const cached = await this.conversationCache.get(cid);
+            if (cached) {
+                this.conversationCache.put({ ...cached, rows: cached.rows.concat(rows), cursor: this.messagesCursor });
+            }
+        } catch (e) {
+            console.error('Failed to fetch older messages', e);
+        } finally {
+            this.loadingMessages = false;
+        }
     }
 
     escapeHtml(str) {
@@ -0,0 +1,73 @@
+// Conversations the user has opened, kept in IndexedDB so that opening one
+// again only fetches the turns logged since (see selectConversation).
+//
+// An entry holds the rows as the server sent them (newest first), the
+// cursor for older rows not fetched yet and the ETag of the conversation at
+// that point. Only the most recently opened conversations are kept. Where
+// IndexedDB is unavailable (some private browsing modes) nothing is cached.
+
+const CONVERSATION_CACHE_DB = 'llm-webui';
+const CONVERSATION_CACHE_STORE = 'conversations';
+const CONVERSATION_CACHE_LIMIT = 50;
+
+class ConversationCache {
+    constructor() {
+        this.opening = null;
+    }
+
+    open() {
+        if (!this.opening) {
+            this.opening = new Promise((resolve) => {
+                if (!window.indexedDB) {
+                    resolve(null);
+                    return;
+                }
+                const request = indexedDB.open(CONVERSATION_CACHE_DB, 1);
+                request.onupgradeneeded = () => {
+                    const store = request.result.createObjectStore(CONVERSATION_CACHE_STORE, { keyPath: 'cid' });
+                    store.createIndex('viewed', 'viewed');
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => resolve(null);
+                request.onblocked = () => resolve(null);
+            });
+        }
+        return this.opening;
+    }
+
+    async get(cid) {
+        const db = await this.open();
+        if (!db) return null;
+        return new Promise((resolve) => {
+            const request = db.transaction(CONVERSATION_CACHE_STORE).objectStore(CONVERSATION_CACHE_STORE).get(cid);
+            request.onsuccess = () => resolve(request.result || null);
+            request.onerror = () => resolve(null);
+        });
+    }
+
+    async put(entry) {
+        const db = await this.open();
+        if (!db) return;
+        return new Promise((resolve) => {
+            const tx = db.transaction(CONVERSATION_CACHE_STORE, 'readwrite');
+            const store = tx.objectStore(CONVERSATION_CACHE_STORE);
+            store.put({ ...entry, viewed: Date.now() });
+            // Drop the least recently opened beyond the limit
+            const count = store.count();
+            count.onsuccess = () => {
+                let excess = count.result - CONVERSATION_CACHE_LIMIT;
+                if (excess <= 0) return;
+                store.index('viewed').openCursor().onsuccess = (event) => {
+                    const cursor = event.target.result;
+                    if (!cursor || excess-- <= 0) return;
+                    cursor.delete();
+                    cursor.continue();
+                };
+            };
+            // A full disk or quota just means this entry isn't cached
+            tx.oncomplete = () => resolve();
+            tx.onerror = () => resolve();
+            tx.onabort = () => resolve();
+        });
+    }
+}
@@ -0,0 +1,172 @@
+// Incremental Markdown rendering for streamed responses.
+//
+// A response is split into blocks: fenced code blocks and paragraphs
+// separated by blank lines. A finished block is rendered once and appended
+// as a DOM node that is never touched again; only the trailing, still-open
+// block is re-rendered as text arrives, and DOM writes are batched to one
+// per animation frame. The cost of a chunk is proportional to the chunk and
+// the open block, not to everything received so far.
+
+const FENCE = '```';
+
+function escapeHtml(text) {
+    return text
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;');
+}
+
+function renderInline(text) {
+    // Code spans first, so their contents are left as written
+    return text.split(/(`[^`\n]+`)/).map((part, i) => {
+        if (i % 2) return `<code>${escapeHtml(part.slice(1, -1))}</code>`;
+        return escapeHtml(part)
+            .replace(/\*\*([^*]+)\*\*/g, '<strong>$1</strong>')
+            .replace(/\*([^*\n]+)\*/g, '<em>$1</em>')
+            .replace(/\n/g, '<br>');
+    }).join('');
+}
+
+// The first block of `text` if it is complete (or `final` is set), as
+// {block, length} where length is how much text it used up; null while the
+// block may still grow. block is null when only blank lines were used up.
+function takeBlock(text, final) {
+    const start = text.search(/[^\n]/);
+    if (start < 0) {
+        return final && text ? { block: null, length: text.length } : null;
+    }
+    const rest = text.slice(start);
+    if (rest.startsWith(FENCE)) {
+        const lineEnd = rest.indexOf('\n');
+        const close = lineEnd < 0 ? -1 : rest.indexOf(`\n${FENCE}`, lineEnd);
+        if (close < 0) {
+            if (!final) return null;
+            const code = lineEnd < 0 ? '' : rest.slice(lineEnd + 1);
+            return { block: codeBlock(rest, lineEnd, code), length: text.length };
+        }
+        const code = rest.slice(lineEnd + 1, close);
+        return { block: codeBlock(rest, lineEnd, code), length: start + close + 1 + FENCE.length };
+    }
+    // A paragraph ends at a blank line or where a code fence starts
+    const end = /\n[ \t]*\n|\n(?=```)/.exec(rest);
+    if (!end) {
+        return final ? { block: { type: 'paragraph', text: rest }, length: text.length } : null;
+    }
+    return {
+        block: { type: 'paragraph', text: rest.slice(0, end.index) },
+        length: start + end.index + end[0].length
+    };
+}
+
+function codeBlock(rest, lineEnd, code) {
+    const info = (lineEnd < 0 ? rest : rest.slice(0, lineEnd)).slice(FENCE.length).trim();
+    return { type: 'code', language: info.split(/\s/)[0], text: code };
+}
+
+function renderBlock(block) {
+    if (block.type === 'code') {
+        const pre = document.createElement('pre');
+        const code = document.createElement('code');
+        if (block.language) code.className = `language-${block.language}`;
+        code.textContent = block.text;
+        pre.appendChild(code);
+        return pre;
+    }
+    const paragraph = document.createElement('p');
+    paragraph.innerHTML = renderInline(block.text);
+    return paragraph;
+}
+
+// Markdown to HTML in one go, for responses that arrive whole
+function renderMarkdown(text) {
+    const container = document.createElement('div');
+    let taken;
+    while (text && (taken = takeBlock(text, true))) {
+        if (taken.block) container.appendChild(renderBlock(taken.block));
+        text = text.slice(taken.length);
+    }
+    return container.innerHTML;
+}
+
+class MarkdownStream {
+    constructor(container, onRender = null) {
+        this.container = container;
+        // Called after each batch of DOM writes, e.g. to keep scrolled down
+        this.onRender = onRender;
+        // Text not yet part of a finished block
+        this.pending = '';
+        // Element showing the open block, and for an open code block the
+        // text node that new code is appended to
+        this.tail = null;
+        this.tailCode = null;
+        this.frame = null;
+    }
+
+    append(text) {
+        this.pending += text;
+        if (this.frame === null) {
+            this.frame = requestAnimationFrame(() => {
+                this.frame = null;
+                this.render(false);
+            });
+        }
+    }
+
+    // Render everything now; the stream has ended
+    finish() {
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+            this.frame = null;
+        }
+        this.render(true);
+    }
+
+    render(final) {
+        let taken;
+        while (this.pending && (taken = takeBlock(this.pending, final))) {
+            if (taken.block) this.container.insertBefore(renderBlock(taken.block), this.tail);
+            this.pending = this.pending.slice(taken.length);
+            this.dropTail();
+        }
+        if (this.pending.trim()) this.renderTail();
+        if (this.onRender) this.onRender();
+    }
+
+    renderTail() {
+        const text = this.pending.replace(/^\n+/, '');
+        if (text.startsWith(FENCE)) {
+            const lineEnd = text.indexOf('\n');
+            const code = lineEnd < 0 ? '' : text.slice(lineEnd + 1);
+            if (this.tailCode) {
+                // Pending text only ever grows, so just the new code is added
+                this.tailCode.appendData(code.slice(this.tailCode.length));
+                return;
+            }
+            const element = renderBlock(codeBlock(text, lineEnd, ''));
+            this.replaceTail(element);
+            this.tailCode = element.firstChild.appendChild(document.createTextNode(code));
+            return;
+        }
+        if (!this.tail || this.tailCode) {
+            this.replaceTail(document.createElement('p'));
+        }
+        this.tail.innerHTML = renderInline(text);
+    }
+
+    replaceTail(element) {
+        if (this.tail) {
+            this.tail.replaceWith(element);
+        } else {
+            this.container.appendChild(element);
+        }
+        this.tail = element;
+        this.tailCode = null;
+    }
+
+    dropTail() {
+        if (this.tail) this.tail.remove();
+        this.tail = null;
+        this.tailCode = null;
+    }
+}
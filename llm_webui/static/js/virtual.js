@@ -0,0 +1,156 @@
+// Windowed rendering for long lists (the chat transcript and the
+// conversation sidebar).
+//
+// Only the items within `overscan` pixels of the visible part of `scroller`
+// are in the DOM; two spacer elements stand in for the rest. Items can have
+// different heights: each is measured once it has been rendered, and an
+// estimate is used until then. Items rendered once are not re-created while
+// they stay in view.
+
+class VirtualList {
+    constructor({ scroller, container, renderItem, estimatedHeight = 60, overscan = 600 }) {
+        this.scroller = scroller;
+        this.container = container;
+        // (item, index) -> element; may return a cached element (item.element)
+        this.renderItem = renderItem;
+        this.estimatedHeight = estimatedHeight;
+        this.overscan = overscan;
+        this.items = [];
+        this.heights = [];
+        // index -> element for the items currently in the DOM
+        this.rendered = new Map();
+        const spacerTag = container.tagName === 'UL' || container.tagName === 'OL' ? 'li' : 'div';
+        this.topSpacer = document.createElement(spacerTag);
+        this.bottomSpacer = document.createElement(spacerTag);
+        for (const spacer of [this.topSpacer, this.bottomSpacer]) {
+            spacer.className = 'virtual-spacer';
+            spacer.setAttribute('aria-hidden', 'true');
+        }
+        // Elements of the previous items, removed by the next update once it
+        // has measured the old layout (so the scroll position isn't clamped)
+        this.stale = [];
+        this.frame = null;
+        scroller.addEventListener('scroll', () => this.scheduleUpdate(), { passive: true });
+        window.addEventListener('resize', () => {
+            // Widths changed, so measured heights no longer hold
+            this.heights = [];
+            this.scheduleUpdate();
+        });
+    }
+
+    get attached() {
+        return this.topSpacer.parentNode === this.container;
+    }
+
+    setItems(items) {
+        if (!this.attached) this.container.replaceChildren(this.topSpacer, this.bottomSpacer);
+        this.items = items;
+        this.heights = [];
+        this.stale.push(...this.rendered.values());
+        this.rendered.clear();
+        this.update();
+    }
+
+    append(item) {
+        if (!this.attached) this.setItems([]);
+        this.items.push(item);
+        this.update();
+    }
+
+    // Add items before the first one, keeping what is on screen in place
+    prepend(items) {
+        if (!items.length) return;
+        if (!this.attached) this.setItems([]);
+        const shifted = new Map();
+        this.rendered.forEach((element, index) => shifted.set(index + items.length, element));
+        this.rendered = shifted;
+        this.items = items.concat(this.items);
+        this.heights = new Array(items.length).concat(this.heights);
+        this.scroller.scrollTop += items.length * this.estimatedHeight;
+        this.update();
+    }
+
+    scheduleUpdate() {
+        if (this.frame !== null) return;
+        this.frame = requestAnimationFrame(() => {
+            this.frame = null;
+            this.update();
+        });
+    }
+
+    heightOf(index) {
+        return this.heights[index] ?? this.estimatedHeight;
+    }
+
+    update() {
+        if (!this.attached) return;
+        // Where the visible area starts, measured from the top of the list
+        const visibleTop = Math.max(0,
+            this.scroller.getBoundingClientRect().top - this.topSpacer.getBoundingClientRect().top);
+        const viewTop = visibleTop - this.overscan;
+        const viewBottom = visibleTop + this.scroller.clientHeight + this.overscan;
+        this.stale.forEach(element => element.remove());
+        this.stale = [];
+
+        let first = this.items.length;
+        let last = this.items.length;
+        let position = 0;
+        let topSpace = 0;
+        for (let i = 0; i < this.items.length; i++) {
+            const height = this.heightOf(i);
+            if (first === this.items.length && position + height > viewTop) {
+                first = i;
+                topSpace = position;
+            }
+            if (position >= viewBottom) {
+                last = i;
+                break;
+            }
+            position += height;
+        }
+        if (first > last) first = last;
+        let bottomSpace = 0;
+        for (let i = last; i < this.items.length; i++) bottomSpace += this.heightOf(i);
+
+        // Drop rows that left the window, add the ones that entered it
+        this.rendered.forEach((element, index) => {
+            if (index < first || index >= last) {
+                element.remove();
+                this.rendered.delete(index);
+            }
+        });
+        let next = this.bottomSpacer;
+        for (let i = last - 1; i >= first; i--) {
+            let element = this.rendered.get(i);
+            if (!element) {
+                element = this.renderItem(this.items[i], i);
+                this.rendered.set(i, element);
+            }
+            if (element.nextSibling !== next || element.parentNode !== this.container) {
+                this.container.insertBefore(element, next);
+            }
+            next = element;
+        }
+        this.topSpacer.style.height = `${topSpace}px`;
+        this.bottomSpacer.style.height = `${bottomSpace}px`;
+
+        // Measure what was rendered; items above the visible area that turn
+        // out taller or shorter than assumed shift the scroll position
+        let drift = 0;
+        let changed = false;
+        let top = topSpace;
+        for (let i = first; i < last; i++) {
+            const element = this.rendered.get(i);
+            const style = getComputedStyle(element);
+            const height = element.offsetHeight + parseFloat(style.marginTop) + parseFloat(style.marginBottom);
+            if (height !== this.heightOf(i)) {
+                if (top + this.heightOf(i) <= visibleTop) drift += height - this.heightOf(i);
+                changed = true;
+            }
+            this.heights[i] = height;
+            top += height;
+        }
+        if (drift) this.scroller.scrollTop += drift;
+        if (changed) this.scheduleUpdate();
+    }
+}
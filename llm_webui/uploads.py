@@ -0,0 +1,231 @@
+"""Uploads streamed straight to disk.
+
+The request body is read as it arrives and written out in fixed-size
+chunks, hashed on the way, so an upload is never held in memory whole
+however large it is. A body that grows past ``max_size`` is cut off as
+soon as it crosses the limit, not after it has been received.
+
+Both a multipart form with a file field (``curl -F file=@video.mp4``) and
+the raw file as the body (named by ``?filename=``) are accepted.
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+# Bytes written to disk (and hashed) at a time
+CHUNK_SIZE = 1024 * 1024
+# Allowance for multipart boundaries and headers when checking Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadError(Exception):
+    status_code = 400
+
+
+class UploadTooLarge(UploadError):
+    status_code = 413
+
+    def __init__(self, max_size: int):
+        super().__init__(f"Upload exceeds the maximum size of {max_size} bytes")
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """The name part of a client-supplied filename, without any directories."""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    return name or "upload"
+
+
+class UploadWriter:
+    """Writes one upload to a temporary file, ``chunk_size`` bytes at a time."""
+
+    def __init__(
+        self,
+        filename: Optional[str],
+        mimetype: Optional[str],
+        max_size: int = 0,
+        chunk_size: int = CHUNK_SIZE,
+        directory: Optional[str] = None,
+    ):
+        self.filename = safe_filename(filename)
+        self.mimetype = mimetype or "application/octet-stream"
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.digest = hashlib.sha256()
+        fd, self.path = tempfile.mkstemp(suffix=f"_{self.filename}", dir=directory)
+        self.file = os.fdopen(fd, "wb")
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes):
+        """Take the next piece of the body; call ``flush`` to write it out."""
+        self.size += len(data)
+        if self.max_size and self.size > self.max_size:
+            raise UploadTooLarge(self.max_size)
+        self._buffer += data
+
+    async def flush(self, final: bool = False):
+        while len(self._buffer) >= self.chunk_size or (final and self._buffer):
+            chunk = bytes(self._buffer[: self.chunk_size])
+            del self._buffer[: self.chunk_size]
+            # Disk writes (and hashing big chunks) would stall the event loop
+            await run_in_threadpool(self._write, chunk)
+
+    async def finish(self) -> Dict[str, Any]:
+        await self.flush(final=True)
+        await run_in_threadpool(self.file.close)
+        return {
+            "filename": self.filename,
+            "path": self.path,
+            "size": self.size,
+            "mimetype": self.mimetype,
+            "sha256": self.digest.hexdigest(),
+        }
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _write(self, chunk: bytes):
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+
+async def receive_upload(
+    request: Request,
+    max_size: int = 0,
+    chunk_size: int = CHUNK_SIZE,
+    directory: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Stream the file in ``request`` to a temporary file and describe it.
+
+    The file is created in ``directory`` (default: the system temp dir).
+
+    Raises UploadError (UploadTooLarge past ``max_size`` bytes; 0 means no
+    limit). Nothing is left on disk when the upload fails.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    multipart = content_type == b"multipart/form-data"
+    length = request.headers.get("content-length", "")
+    if max_size and length.isdigit():
+        # Refuse before reading anything when the client says it's too big
+        if int(length) > max_size + (MULTIPART_OVERHEAD if multipart else 0):
+            raise UploadTooLarge(max_size)
+    if multipart:
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise UploadError("Missing multipart boundary")
+        return await receive_multipart(request, boundary, max_size, chunk_size, directory)
+
+    writer = UploadWriter(
+        request.query_params.get("filename"),
+        content_type.decode("latin-1") or None,
+        max_size,
+        chunk_size,
+        directory,
+    )
+    try:
+        async for data in request.stream():
+            writer.feed(data)
+            await writer.flush()
+        return await writer.finish()
+    except BaseException:
+        writer.discard()
+        raise
+
+
+async def receive_multipart(
+    request: Request,
+    boundary: bytes,
+    max_size: int = 0,
+    chunk_size: int = CHUNK_SIZE,
+    directory: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Like receive_upload, for a multipart form; the first file part is kept."""
+    state = {"writer": None, "headers": {}, "field": b"", "value": b"", "in_file": False}
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["in_file"] = False
+
+    def on_header_field(data, start, end):
+        state["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["field"].lower()] = state["value"]
+        state["field"] = state["value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition"))
+        if b"filename" in disposition and state["writer"] is None:
+            mimetype, _ = parse_options_header(state["headers"].get(b"content-type"))
+            state["writer"] = UploadWriter(
+                disposition[b"filename"].decode("utf-8", errors="replace"),
+                mimetype.decode("latin-1") or None,
+                max_size,
+                chunk_size,
+                directory,
+            )
+            state["in_file"] = True
+
+    def on_part_data(data, start, end):
+        # Other form fields are skipped
+        if state["in_file"]:
+            state["writer"].feed(data[start:end])
+
+    def on_part_end():
+        state["in_file"] = False
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+
+    def parse(data: Optional[bytes] = None):
+        try:
+            if data is None:
+                parser.finalize()
+            else:
+                parser.write(data)
+        except UploadError:
+            raise
+        except Exception as e:
+            raise UploadError(f"Malformed multipart upload: {e}")
+
+    try:
+        async for data in request.stream():
+            parse(data)
+            if state["writer"] is not None:
+                await state["writer"].flush()
+        parse()
+        if state["writer"] is None:
+            raise UploadError("No file in the upload")
+        return await state["writer"].finish()
+    except BaseException:
+        if state["writer"] is not None:
+            state["writer"].discard()
+        raise
@@ -0,0 +1,38 @@
+"""A pre-started llm CLI process, used by the subprocess backend's worker pool.
+
+It imports llm and its plugins straight away, then waits for one job on
+stdin: a JSON line ``{"args": [...]}`` holding the arguments to ``llm``.
+Anything after that line stays on stdin for the command itself (chat
+messages, for example). Output, errors and exit status are exactly those of
+running ``llm`` with the same arguments, and the process exits afterwards,
+so every job still gets a process of its own.
+"""
+
+import json
+import sys
+
+
+def main():
+    import llm
+    from llm.cli import cli
+
+    try:
+        # Runs the plugins' register_models hooks, importing their modules
+        llm.get_models()
+    except Exception:
+        # The job itself will report a broken plugin
+        pass
+
+    # Read through the binary buffer so nothing after the job line is
+    # consumed on the command's behalf
+    line = sys.stdin.buffer.readline()
+    if not line:
+        # The pool shut down before handing us a job
+        return
+    args = json.loads(line)["args"]
+    sys.argv = ["llm", *args]
+    cli.main(args=args, prog_name="llm")
+
+
+if __name__ == "__main__":
+    main()
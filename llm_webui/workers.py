@@ -0,0 +1,103 @@
+"""Pool of warm llm worker processes for the subprocess backend.
+
+Starting ``llm`` means starting Python and importing llm and every plugin,
+which often takes longer than the first token. The pool keeps a few
+processes (see llm_webui.worker) that have already done this, hands one
+out per job and starts replacements in the background. Workers run a single
+job and exit, so jobs stay isolated from each other exactly as before.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+WORKER_COMMAND = [sys.executable, "-m", "llm_webui.worker"]
+
+
+def child_env() -> Dict[str, str]:
+    """Environment for llm child processes, with Python output unbuffered."""
+    return {**os.environ, "PYTHONUNBUFFERED": "1"}
+
+
+async def spawn(cmd: List[str]) -> asyncio.subprocess.Process:
+    return await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=child_env(),
+    )
+
+
+class WorkerPool:
+    def __init__(self, size: int = 2):
+        # Idle workers to keep ready; 0 disables the pool
+        self.size = size
+        self._idle: Deque[asyncio.subprocess.Process] = deque()
+        self._refill_task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def __len__(self):
+        return len(self._idle)
+
+    async def start(self):
+        """Start filling the pool in the background."""
+        self.closed = False
+        self._schedule_refill()
+
+    async def run(self, args: List[str]) -> asyncio.subprocess.Process:
+        """Start ``llm <args>`` on a warm worker (or a fresh one if none is idle).
+
+        The returned process's stdin is still open for the command to read.
+        """
+        process = None
+        while self._idle:
+            candidate = self._idle.popleft()
+            if candidate.returncode is None:
+                process = candidate
+                break
+        if process is None:
+            process = await spawn(WORKER_COMMAND)
+        self._schedule_refill()
+        job = json.dumps({"args": args}) + "\n"
+        process.stdin.write(job.encode("utf-8"))
+        await process.stdin.drain()
+        return process
+
+    async def close(self):
+        """Stop the idle workers."""
+        self.closed = True
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+        while self._idle:
+            process = self._idle.popleft()
+            if process.returncode is None:
+                # EOF instead of a job makes the worker exit on its own
+                process.stdin.close()
+                try:
+                    await asyncio.wait_for(process.wait(), 5)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+
+    def _schedule_refill(self):
+        if self.closed or not self.size:
+            return
+        if self._refill_task is not None and not self._refill_task.done():
+            return
+        self._refill_task = asyncio.ensure_future(self._refill())
+
+    async def _refill(self):
+        while not self.closed and len(self._idle) < self.size:
+            try:
+                self._idle.append(await spawn(WORKER_COMMAND))
+            except OSError as e:
+                logger.warning("Could not start an llm worker: %s", e)
+                return
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Build the fingerprinted, precompressed static assets of the LLM WebUI.
+
+This script:
+  - Downloads Bootstrap and Font Awesome into llm_webui/static/vendor
+    (skipped for files already there, e.g. copied in on an air-gapped host)
+  - Drops CSS rules and icon glyphs the page doesn't use
+  - Writes content-hashed copies, with .gz/.br variants, to llm_webui/static/dist
+
+Run it before packaging, and again after changing anything under static/.
+
+Usage:
+  python scripts/build_assets.py
+  python scripts/build_assets.py --no-fetch
+
+Optional (font subsetting and Brotli variants):
+  pip install -e ".[assets]"
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm_webui import assets  # noqa: E402
+
+
+def main():
+    package_dir = Path(assets.__file__).parent
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--static-dir", default=str(package_dir / "static"))
+    parser.add_argument("--templates-dir", default=str(package_dir / "templates"))
+    parser.add_argument("--no-fetch", action="store_true", help="Only use vendored files already present")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if assets.font_subset is None:
+        print("fontTools not installed: icon fonts are kept whole", file=sys.stderr)
+    if assets.brotli is None:
+        print("brotli not installed: only gzip variants are written", file=sys.stderr)
+    manifest = assets.build(Path(args.static_dir), Path(args.templates_dir), fetch=not args.no_fetch)
+    for name, entry in sorted(manifest.items()):
+        print(f"{name} -> dist/{entry['path']}")
+
+
+if __name__ == "__main__":
+    main()
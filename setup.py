@@ -23,6 +23,8 @@ setup(
         "jinja2>=3.0.0",
     ],
     extras_require={
+        "images": ["Pillow"],
+        "assets": ["brotli", "fonttools"],
         "dev": [
             "pytest",
             "black",
@@ -1,5 +1,30 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from typing import Optional
+
+import llm
 import pytest
-from llm_webui import server
+from llm_webui import assets, engine, logsdb, server
+from llm_webui.attachments import AttachmentStore
+from llm_webui.cache import ResponseCache
+from llm_webui.compression import CompressionMiddleware
+from llm_webui.admission import AdmissionController, QueueFull, admitted_events, per_worker
+from llm_webui.generations import Generation, GenerationRegistry, ReplayExpired
+from llm_webui.multiplex import StreamMultiplexer
+from llm_webui.registry import CachedListing
+from llm_webui.sessions import SessionPool
+from llm_webui.shared import Coordinator, SharedState
+from llm_webui.workers import WorkerPool
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
 client = TestClient(server.app)
@@ -23,4 +48,1054 @@ def test_templates_api():
 def test_tools_api():
     """Test the tools API endpoint."""
     response = client.get("/api/tools")
-    assert response.status_code in [200, 500]  # May fail if no tools available
\ No newline at end of file
+    assert response.status_code in [200, 500]  # May fail if no tools available
+
+class EchoModel(llm.Model):
+    """Test model that echoes the prompt back in two chunks."""
+
+    model_id = "webui-echo"
+    can_stream = True
+
+    class Options(llm.Options):
+        temperature: Optional[float] = None
+
+    def execute(self, prompt, stream, response, conversation):
+        turns = len(conversation.responses) if conversation else 0
+        yield f"echo({turns}): "
+        yield prompt.prompt
+        response.set_usage(input=len(prompt.prompt.split()), output=2)
+
+
+class EchoPlugin:
+    __name__ = "EchoPlugin"
+
+    @llm.hookimpl
+    def register_models(self, register):
+        register(EchoModel(), aliases=("echo-alias",))
+
+
+llm.plugins.pm.register(EchoPlugin(), name="webui-echo")
+
+
+@pytest.fixture(autouse=True)
+def user_dir(tmp_path, monkeypatch):
+    """Keep llm logs and config out of the real user directory."""
+    monkeypatch.setenv("LLM_USER_PATH", str(tmp_path))
+    return tmp_path
+
+
+def test_prompt_inprocess_stream(monkeypatch):
+    """The in-process backend streams model output without spawning llm."""
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    response = client.post("/api/prompt", json={"prompt": "hi", "model": "webui-echo"})
+    assert response.status_code == 200
+    assert response.text == "echo(0): hi"
+
+
+def test_prompt_inprocess_non_stream(monkeypatch, user_dir):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    response = client.post(
+        "/api/prompt", json={"prompt": "hi", "model": "webui-echo", "stream": False}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"response": "echo(0): hi"}
+    assert (user_dir / "logs.db").exists()
+
+
+def test_prompt_inprocess_unknown_model(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    response = client.post(
+        "/api/prompt", json={"prompt": "hi", "model": "no-such-model", "stream": False}
+    )
+    assert response.status_code == 500
+    assert "no-such-model" in response.json()["detail"]
+
+
+def parse_sse(text):
+    messages = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        messages.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return messages
+
+
+def test_prompt_sse_stream(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    response = client.post(
+        "/api/prompt",
+        json={"prompt": "line one\nline two", "model": "webui-echo"},
+        headers={"Accept": "text/event-stream"},
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    messages = parse_sse(response.text)
+    assert [id for id, _, _ in messages] == [1, 2, 3, 4]
+    assert messages[0][1:] == ("token", {"text": "echo(0): "})
+    assert messages[1][1:] == ("token", {"text": "line one\nline two"})
+    assert messages[2][1:] == ("usage", {"input": 4, "output": 2, "details": None})
+    assert messages[3][1:] == ("done", {"generation_id": response.headers["x-generation-id"]})
+
+
+def test_prompt_sse_reports_errors_as_events(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    response = client.post(
+        "/api/prompt",
+        json={"prompt": "hi", "model": "no-such-model"},
+        headers={"Accept": "text/event-stream"},
+    )
+    events = [event for _, event, _ in parse_sse(response.text)]
+    assert events == ["error", "done"]
+
+
+def test_chat_reuses_pooled_conversation(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    server.chat_sessions.clear()
+    first = client.post("/api/chat", json={"message": "one", "model": "webui-echo"})
+    assert first.text == "echo(0): one"
+    [cid] = list(server.chat_sessions._sessions)
+    second = client.post("/api/chat", json={"message": "two", "conversation_id": cid})
+    assert second.text == "echo(1): two"
+    assert len(server.chat_sessions) == 1
+
+
+def test_session_pool_reloads_conversation_continued_elsewhere(monkeypatch):
+    """Another server worker answering a turn makes the pooled copy stale."""
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    server.chat_sessions.clear()
+    client.post("/api/chat", json={"message": "one", "model": "webui-echo"})
+    [cid] = list(server.chat_sessions._sessions)
+    other_worker = SessionPool()
+    with other_worker.conversation(cid) as conversation:
+        list(engine.iter_response(conversation.prompt("two")))
+    pooled = server.chat_sessions._sessions[cid]
+    client.post("/api/chat", json={"message": "three", "conversation_id": cid})
+    reloaded = server.chat_sessions._sessions[cid]
+    assert reloaded is not pooled
+    assert reloaded.exchanges == 3
+    # Its own turns don't make it look stale again
+    client.post("/api/chat", json={"message": "four", "conversation_id": cid})
+    assert server.chat_sessions._sessions[cid] is reloaded
+
+
+def test_session_pool_evicts_least_recently_used():
+    pool = SessionPool(max_sessions=2)
+    ids = []
+    for _ in range(3):
+        with pool.conversation(model="webui-echo") as conversation:
+            ids.append(conversation.id)
+    assert ids[0] not in pool
+    assert ids[1] in pool and ids[2] in pool
+
+
+def test_run_command_timeout_kills_child():
+    with pytest.raises(subprocess.TimeoutExpired):
+        asyncio.run(
+            server.run_command([sys.executable, "-c", "import time; time.sleep(30)"], timeout=0.2)
+        )
+
+
+def test_metadata_endpoint_timeout(monkeypatch):
+    monkeypatch.setattr(server.settings, "command_timeout", 0.001)
+    response = client.get("/api/help")
+    assert response.status_code == 504
+    assert "timed out" in response.json()["detail"]
+
+
+def test_registry_serves_cached_listing_with_etag(monkeypatch):
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return {"templates": ["summarize"]}
+
+    monkeypatch.setitem(server.registries, "templates", CachedListing("templates", loader))
+    first = client.get("/api/templates")
+    assert first.json() == {"templates": ["summarize"]}
+    etag = first.headers["etag"]
+    second = client.get("/api/templates", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert len(calls) == 1
+
+    assert client.post("/api/registry/invalidate?name=templates").status_code == 200
+    client.get("/api/templates")
+    assert len(calls) == 2
+    assert client.post("/api/registry/invalidate?name=nope").status_code == 404
+
+
+def test_cached_listing_serves_stale_while_refreshing():
+    values = iter([1, 2])
+
+    async def loader():
+        return next(values)
+
+    async def scenario():
+        listing = CachedListing("numbers", loader, ttl=0)
+        assert (await listing.get())[0] == 1
+        # Stale: the old value is returned and a refresh starts
+        assert (await listing.get())[0] == 1
+        await listing._refresh_task
+        return listing.value
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_list_conversations_reads_logs_database(monkeypatch, user_dir):
+    # A legacy responses table, as written by older llm releases
+    conn = sqlite3.connect(user_dir / "logs.db")
+    conn.execute(
+        "create table responses (id text primary key, model text, prompt text,"
+        " response text, conversation_id text, datetime_utc text)"
+    )
+    conn.executemany(
+        "insert into responses values (?, ?, ?, ?, ?, ?)",
+        [
+            ("r1", "m1", "first", "a", "c1", "2024-01-01T00:00:00"),
+            ("r2", "m2", "second", "b", "c1", "2024-01-02T00:00:00"),
+            ("r3", "m1", "other", "c", "c2", "2024-01-01T12:00:00"),
+            ("r4", "m1", "no conversation", "d", None, "2024-01-03T00:00:00"),
+        ],
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(server, "run_command", None)
+    response = client.get("/api/conversations?limit=1")
+    assert response.json()["conversations"] == [
+        {"conversation_id": "c1", "latest": "2024-01-02T00:00:00", "model": "m2", "count": 2, "last_prompt": "second"}
+    ]
+    cursor = response.json()["next_cursor"]
+    response = client.get(f"/api/conversations?limit=1&cursor={cursor}")
+    assert [c["conversation_id"] for c in response.json()["conversations"]] == ["c2"]
+    assert response.json()["next_cursor"] is None
+
+    pages = []
+    cursor = None
+    while True:
+        data = client.get("/api/logs", params={"count": 3, "cursor": cursor}).json()
+        pages.append([row["id"] for row in data["logs"]])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == [["r4", "r2", "r3"], ["r1"]]
+    assert client.get("/api/logs?cursor=bogus").status_code == 400
+
+    # 0 means everything, as with llm logs list -n 0
+    everything = client.get("/api/logs?count=0").json()
+    assert len(everything["logs"]) == 4 and everything["next_cursor"] is None
+    assert len(client.get("/api/conversations?limit=0").json()["conversations"]) == 2
+    assert client.get("/api/conversations/c1/messages?limit=0").json()["next_cursor"] is None
+    for url in ["/api/logs?count=-1", "/api/conversations?limit=-1", "/api/conversations/c1/messages?limit=-1"]:
+        assert client.get(url).status_code == 422
+
+
+def test_list_conversations_reads_logged_chats(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    server.chat_sessions.clear()
+    client.post("/api/chat", json={"message": "one", "model": "webui-echo"})
+    [cid] = list(server.chat_sessions._sessions)
+    client.post("/api/chat", json={"message": "two", "conversation_id": cid})
+    [conversation] = client.get("/api/conversations").json()["conversations"]
+    assert conversation["conversation_id"] == cid
+    assert conversation["count"] == 2
+    assert conversation["last_prompt"] == "two"
+
+
+def test_conversation_messages_page_back_from_newest(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    server.chat_sessions.clear()
+    client.post("/api/chat", json={"message": "one", "model": "webui-echo"})
+    [cid] = list(server.chat_sessions._sessions)
+    for message in ["two", "three"]:
+        client.post("/api/chat", json={"message": message, "conversation_id": cid})
+
+    first = client.get(f"/api/conversations/{cid}/messages?limit=2").json()
+    assert [m["prompt"] for m in first["messages"]] == ["three", "two"]
+    second = client.get(
+        f"/api/conversations/{cid}/messages", params={"limit": 2, "cursor": first["next_cursor"]}
+    ).json()
+    assert [m["prompt"] for m in second["messages"]] == ["one"]
+    assert second["next_cursor"] is None
+    assert client.get(f"/api/conversations/{cid}/messages?cursor=bogus").status_code == 400
+
+
+def test_conversation_messages_sync_only_new_turns(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    server.chat_sessions.clear()
+    client.post("/api/chat", json={"message": "one", "model": "webui-echo"})
+    [cid] = list(server.chat_sessions._sessions)
+    client.post("/api/chat", json={"message": "two", "conversation_id": cid})
+    url = f"/api/conversations/{cid}/messages"
+    first = client.get(url)
+    etag = first.headers["etag"]
+    latest = first.json()["messages"][0]["id"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/api/chat", json={"message": "three", "conversation_id": cid})
+    delta = client.get(url, params={"after_id": latest}, headers={"If-None-Match": etag})
+    assert delta.status_code == 200
+    assert delta.headers["etag"] != etag
+    assert [m["prompt"] for m in delta.json()["messages"]] == ["three"]
+    assert client.get(url, params={"after_id": "nope"}).status_code == 400
+
+
+def test_conversation_endpoint_filters_and_validates(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    server.chat_sessions.clear()
+    client.post("/api/chat", json={"message": "one", "model": "webui-echo"})
+    [cid] = list(server.chat_sessions._sessions)
+    client.post("/api/chat", json={"message": "two", "model": "webui-echo", "conversation_id": cid})
+
+    response = client.get(f"/api/conversations/{cid}")
+    rows = response.json()
+    assert [row["prompt"] for row in rows] == ["one", "two"]
+    assert rows[1]["response"] == "echo(1): two"
+    assert client.get(f"/api/conversations/{cid}?after_id={rows[0]['id']}").json() == rows[1:]
+    since = {"since": rows[0]["datetime_utc"]}
+    assert client.get(f"/api/conversations/{cid}", params=since).json() == rows[1:]
+    assert client.get(f"/api/conversations/{cid}?after_id=zzz").status_code == 400
+    etag = response.headers["etag"]
+    assert client.get(f"/api/conversations/{cid}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/conversations/unknown").json() == []
+
+
+def test_search_indexes_new_exchanges_incrementally(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    client.post("/api/prompt", json={"prompt": "pelicans <b>on</b> bicycles", "model": "webui-echo"})
+    assert logsdb.search_indexer.wait(timeout=10)
+    data = client.get("/api/search?q=pelican").json()
+    assert len(data["results"]) == 1
+    assert data["results"][0]["prompt"].startswith("<mark>pelicans</mark> &lt;b&gt;")
+
+    for i in range(3):
+        client.post("/api/prompt", json={"prompt": f"walrus {i}", "model": "webui-echo"})
+    assert logsdb.search_indexer.wait(timeout=10)
+    first = client.get("/api/search?q=walrus&limit=2").json()
+    assert len(first["results"]) == 2
+    second = client.get(f"/api/search?q=walrus&limit=2&cursor={first['next_cursor']}").json()
+    assert len(second["results"]) == 1 and second["next_cursor"] is None
+    assert client.get("/api/search?q=nothing-matches-this").json()["results"] == []
+    assert len(client.get("/api/search?q=walrus-2").json()["results"]) == 1
+
+    # The index holds no copy of the text; results are read from the log
+    conn = sqlite3.connect(str(logsdb.logs_db_path()))
+    assert conn.execute(f"select prompt from {logsdb.SEARCH_TABLE} limit 1").fetchone() == (None,)
+    conn.close()
+
+
+def test_stream_forwards_partial_lines_without_splitting_characters():
+    script = (
+        "import sys, time\n"
+        "data = 'café'.encode()\n"
+        "sys.stdout.buffer.write(data[:-1]); sys.stdout.flush(); time.sleep(0.5)\n"
+        "sys.stdout.buffer.write(data[-1:] + b'!'); sys.stdout.flush()\n"
+    )
+
+    async def collect():
+        chunks = []
+        start = asyncio.get_running_loop().time()
+        async for event, chunk in server.stream_llm_response([sys.executable, "-c", script]):
+            assert event == "token"
+            chunks.append((chunk, asyncio.get_running_loop().time() - start))
+        return chunks
+
+    chunks = asyncio.run(collect())
+    assert "".join(chunk for chunk, _ in chunks) == "café!"
+    # "caf" arrives before the newline-less remainder is written
+    assert chunks[0][0] == "caf" and chunks[0][1] < 0.45
+
+
+def test_cancel_terminates_child_process():
+    script = "import time\nprint('started', flush=True)\ntime.sleep(30)\n"
+
+    async def scenario():
+        generation = server.generations.start()
+        stream = server.stream_llm_response([sys.executable, "-c", script], generation)
+        _, first = await stream.__anext__()
+        process = generation.process
+        generation.cancel()
+        rest = [chunk async for _, chunk in stream]
+        await asyncio.wait_for(process.wait(), 5)
+        return first, rest, process.returncode, generation.id
+
+    first, rest, returncode, generation_id = asyncio.run(scenario())
+    assert first.startswith("started")
+    assert "".join(rest).strip() == ""
+    assert returncode != 0
+    # Kept for replay, but no longer running
+    assert server.generations.get(generation_id).finished
+
+
+def test_cancel_endpoint(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    response = client.post("/api/prompt", json={"prompt": "hi", "model": "webui-echo"})
+    assert len(response.headers["x-generation-id"]) == 32
+    # Finished generations are no longer cancellable
+    assert client.post(f"/api/prompt/{response.headers['x-generation-id']}/cancel").status_code == 404
+
+
+def test_cancelled_inprocess_generation_is_not_logged(user_dir):
+    cancelled = threading.Event()
+    chunks = engine.stream_prompt("hi", model="webui-echo", cancelled=cancelled)
+    assert next(chunks) == "echo(0): "
+    cancelled.set()
+    assert list(chunks) == []
+    assert not (user_dir / "logs.db").exists()
+
+
+IMPORT_CHECK = """
+import sys, time
+import llm
+start = time.perf_counter()
+import llm_webui.plugin
+elapsed = time.perf_counter() - start
+heavy = sorted(
+    name for name in ("fastapi", "starlette", "uvicorn", "jinja2", "llm_webui.server")
+    if name in sys.modules
+)
+print(elapsed)
+print(",".join(heavy))
+"""
+
+
+def test_plugin_import_does_not_load_server_stack():
+    # llm imports every plugin on every command, so this must stay cheap
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_CHECK], capture_output=True, text=True, check=True
+    )
+    elapsed, heavy = result.stdout.splitlines()
+    assert heavy == ""
+    # On top of llm itself; generous so a slow machine doesn't fail it,
+    # importing the server stack takes several times longer
+    assert float(elapsed) < 0.1
+
+
+WEBUI_COMMAND_CHECK = """
+import uvicorn
+from llm.cli import cli
+
+def run(app, **kwargs):
+    from llm_webui import server
+    print(server.settings.backend, server.worker_pool.size, kwargs["workers"])
+
+uvicorn.run = run
+cli(["webui", "--backend", "subprocess"], standalone_mode=False)
+"""
+
+
+def test_webui_command_options_reach_the_server(user_dir):
+    env = {k: v for k, v in os.environ.items() if not k.startswith("LLM_WEBUI_")}
+    result = subprocess.run(
+        [sys.executable, "-c", WEBUI_COMMAND_CHECK],
+        capture_output=True, text=True, check=True, env=env,
+    )
+    assert result.stdout.splitlines()[-1] == "subprocess 2 None"
+
+
+def test_webui_command_validates_options_before_starting():
+    from click.testing import CliRunner
+    from llm.cli import cli
+
+    runner = CliRunner()
+    for args in (["--reload", "--workers", "2"], ["--backend", "nope"], ["--workers", "0"]):
+        result = runner.invoke(cli, ["webui", *args])
+        assert result.exit_code == 2
+        assert "Starting" not in result.output
+
+
+def read_streams(websocket, count):
+    """Collect events per stream until ``count`` streams are done."""
+    streams = {}
+    finished = 0
+    while finished < count:
+        message = websocket.receive_json()
+        streams.setdefault(message["stream"], []).append(message)
+        if message["event"] == "done":
+            finished += 1
+    return streams
+
+
+def test_chat_websocket_multiplexes_streams(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    with client.websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({"type": "chat", "stream": "a", "message": "first", "model": "webui-echo"})
+        websocket.send_json({"type": "chat", "stream": "b", "message": "second", "model": "webui-echo"})
+        streams = read_streams(websocket, 2)
+        for stream_id, prompt in (("a", "first"), ("b", "second")):
+            started, *messages = streams[stream_id]
+            assert started["event"] == "started"
+            assert [m["id"] for m in messages] == list(range(1, len(messages) + 1))
+            text = "".join(m["data"]["text"] for m in messages if m["event"] == "token")
+            assert text == f"echo(0): {prompt}"
+        cid = streams["a"][1]["data"]["conversation_id"]
+
+        # The next turn continues the pooled conversation
+        websocket.send_json({"type": "chat", "stream": "c", "message": "again", "conversation_id": cid})
+        messages = read_streams(websocket, 1)["c"]
+        assert "".join(m["data"]["text"] for m in messages if m["event"] == "token") == "echo(1): again"
+
+
+def test_chat_websocket_attaches_to_a_generation(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    with client.websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({"type": "chat", "stream": "a", "message": "hello", "model": "webui-echo"})
+        first = read_streams(websocket, 1)["a"]
+    generation_id = first[0]["data"]["generation_id"]
+
+    # A new connection picks up after the events it already has
+    with client.websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({"type": "attach", "stream": "b", "generation": generation_id, "after": 2})
+        resumed = read_streams(websocket, 1)["b"]
+    assert resumed[1:] == [dict(m, stream="b") for m in first[3:]]
+
+
+def test_chat_websocket_reports_bad_messages(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    with client.websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({"type": "cancel", "stream": "missing"})
+        assert websocket.receive_json() == {
+            "stream": "missing", "event": "error", "data": {"message": "No running stream: missing"}
+        }
+        websocket.send_json({"type": "chat", "message": "no stream id"})
+        assert websocket.receive_json()["event"] == "error"
+        websocket.send_text("not json")
+        assert websocket.receive_json()["data"]["message"] == "Messages must be JSON objects"
+        websocket.send_bytes(b'{"type": "cancel"}')
+        assert websocket.receive_json()["data"]["message"].startswith("Messages must be JSON text")
+        # The socket is still usable
+        websocket.send_json({"type": "cancel", "stream": "missing"})
+        assert websocket.receive_json()["event"] == "error"
+
+
+def test_paused_stream_stops_reading_from_the_model():
+    class FakeSocket:
+        def __init__(self):
+            self.sent = []
+
+        async def send_json(self, message):
+            self.sent.append(message)
+
+    pulled = []
+
+    async def events():
+        for i in range(50):
+            pulled.append(i)
+            yield "token", "x" * 100
+
+    async def scenario():
+        socket = FakeSocket()
+        mux = StreamMultiplexer(socket)
+        generation = Generation("paused", buffer_size=1000)
+        mux.start("s", generation)
+        task = mux.streams["s"].task
+        mux.pause("s")
+        generation.task = asyncio.ensure_future(generation.pump(events()))
+        await asyncio.sleep(0.05)
+        paused_pulls = len(pulled)
+        mux.resume("s")
+        await asyncio.wait_for(task, 5)
+        return paused_pulls, socket.sent
+
+    paused_pulls, sent = asyncio.run(scenario())
+    # The pump stops once the buffer is full of events the paused stream still needs
+    assert paused_pulls < 10
+    assert [m["event"] for m in sent] == ["started"] + ["token"] * 50 + ["done"]
+    assert [m["id"] for m in sent[1:]] == list(range(1, 52))
+
+
+def test_stream_resumes_after_last_event_id(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    response = client.post(
+        "/api/prompt",
+        json={"prompt": "resume me", "model": "webui-echo"},
+        headers={"Accept": "text/event-stream"},
+    )
+    generation_id = response.headers["x-generation-id"]
+    full = parse_sse(response.text)
+
+    resumed = client.get(
+        f"/api/generations/{generation_id}/events",
+        headers={"Accept": "text/event-stream", "Last-Event-ID": "1"},
+    )
+    assert parse_sse(resumed.text) == full[1:]
+    # Plain-text clients pass the offset as ?after=
+    assert client.get(f"/api/generations/{generation_id}/events?after=1").text == "resume me"
+    assert client.get(f"/api/generations/{generation_id}/events?after=99").status_code == 400
+    assert client.get("/api/generations/unknown/events").status_code == 404
+
+
+def test_generation_replay_buffer_is_bounded():
+    async def events():
+        for i in range(20):
+            yield "token", "y" * 100
+
+    async def scenario():
+        generation = Generation("bounded", buffer_size=1000)
+        await generation.pump(events())
+        # Nobody was reading, so old events were dropped as new ones arrived
+        assert generation.buffered <= 1000 + 200
+        assert generation.first_id > 1
+        with pytest.raises(ReplayExpired):
+            generation.check_resume(0)
+        tail = [record async for record in generation.follow(generation.first_id - 1)]
+        assert tail[-1][1] == "done"
+
+    asyncio.run(scenario())
+
+
+def test_unattended_generation_is_cancelled_after_grace():
+    async def events():
+        yield "token", "first"
+        await asyncio.sleep(30)
+        yield "token", "never"
+
+    async def scenario():
+        generation = Generation("unattended", resume_grace=0.05)
+        generation.task = asyncio.ensure_future(generation.pump(events()))
+        reader = generation.follow()
+        assert (await reader.__anext__())[1:] == ("token", "first")
+        await reader.aclose()
+        await asyncio.sleep(0.1)
+        return generation
+
+    generation = asyncio.run(scenario())
+    assert generation.cancelled.is_set()
+
+
+def test_admission_queues_fairly_across_models():
+    async def scenario():
+        controller = AdmissionController(max_running=2, max_per_model=1, max_queue=2)
+        a1, a2 = controller.request("a"), controller.request("a")
+        # a2 waits for model a, but doesn't hold up model b behind it
+        b1 = controller.request("b")
+        assert (a1.admitted, a2.admitted, b1.admitted) == (True, False, True)
+        b2 = controller.request("b")
+        assert (a2.position, b2.position) == (1, 2)
+        with pytest.raises(QueueFull) as e:
+            controller.request("c")
+        assert e.value.retry_after >= 1
+
+        controller.release(b1)
+        assert b2.admitted and a2.position == 1
+        controller.release(a1)
+        assert a2.admitted and controller.queue == []
+
+    asyncio.run(scenario())
+    # Server-wide limits, split between workers
+    assert [per_worker(8, n) for n in (1, 3, 16)] == [8, 2, 1]
+    assert per_worker(0, 4) == 0
+
+
+def test_admission_counts_requests_against_the_resolved_model(monkeypatch, user_dir):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    server.chat_sessions.clear()
+    client.post("/api/chat", json={"message": "one", "model": "echo-alias"})
+    [cid] = list(server.chat_sessions._sessions)
+    assert server.admission_key(None, conversation_id=cid) == "webui-echo"
+    assert server.admission_key("echo-alias") == "webui-echo"
+    assert server.admission_key("no-such-model") == "no-such-model"
+    (user_dir / "templates").mkdir()
+    (user_dir / "templates" / "t.yaml").write_text("model: echo-alias\nprompt: hi\n")
+    assert server.admission_key(None, "t") == "webui-echo"
+    llm.set_default_model("echo-alias")
+    assert server.admission_key(None) == "webui-echo"
+
+
+def test_queued_generation_reports_position_then_runs():
+    def source():
+        yield "token", "ran"
+
+    async def scenario():
+        controller = AdmissionController(max_running=1)
+        first = controller.request()
+        second = controller.request()
+        events = admitted_events(controller, second, source())
+        assert await events.__anext__() == ("queued", {"position": 1})
+        controller.release(first)
+        assert [event async for event in events] == [("token", "ran")]
+        assert controller.running == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_answers_429(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    monkeypatch.setattr(server, "admission", AdmissionController(max_running=1, max_queue=0))
+    server.admission.request("webui-echo")
+    response = client.post("/api/prompt", json={"prompt": "hi", "model": "webui-echo"})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+
+def test_worker_pool_runs_llm_on_warm_workers(monkeypatch):
+    async def scenario():
+        pool = WorkerPool(size=1)
+        monkeypatch.setattr(server, "worker_pool", pool)
+        await pool.start()
+        await pool._refill_task
+        warm = pool._idle[0]
+
+        generation = server.generations.start()
+        chunks = [chunk async for _, chunk in server.stream_llm_response(["llm", "--version"], generation)]
+        assert generation.process is warm
+        # A replacement is started in the background
+        await pool._refill_task
+        assert len(pool) == 1 and pool._idle[0] is not warm
+        await pool.close()
+        return "".join(chunks), warm.returncode
+
+    output, returncode = asyncio.run(scenario())
+    assert output.startswith("llm, version")
+    assert returncode == 0
+
+
+def test_worker_reports_command_errors_like_llm():
+    async def scenario():
+        pool = WorkerPool(size=0)
+        process = await pool.run(["prompt", "-m", "no-such-model", "hi"])
+        process.stdin.close()
+        stdout, stderr = await process.communicate()
+        return process.returncode, stderr.decode()
+
+    returncode, stderr = asyncio.run(scenario())
+    assert returncode != 0
+    assert "no-such-model" in stderr
+
+
+def test_workers_share_generations_and_invalidations(tmp_path):
+    """Two workers, each with its own registry, coordinated through one file."""
+
+    async def events(generation):
+        yield "token", "shared"
+        while not generation.cancelled.is_set():
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        path = tmp_path / "state.db"
+        listings = {name: CachedListing(name, None) for name in ("a", "b")}
+        for listing in listings.values():
+            listing.fetched_at = 0
+        owner = Coordinator(SharedState(path, owner=1), GenerationRegistry(), {}, interval=0.01)
+        other = Coordinator(SharedState(path, owner=2), GenerationRegistry(), listings, interval=0.01)
+        owner.start()
+        other.start()
+
+        generation = owner.generations.start()
+        await owner.share(generation)
+        owner.generations.run(generation, events(generation))
+        remote = await other.remote(generation.id)
+        assert await other.remote("unknown") is None
+        assert await owner.remote(generation.id) is None and not remote.finished
+        reader = remote.follow()
+        assert await reader.__anext__() == (1, "token", "shared")
+        remote.cancel()
+        rest = [record async for record in reader]
+        assert generation.cancelled.is_set()
+        assert rest[-1] == (2, "done", {"generation_id": generation.id})
+        assert remote.finished
+
+        owner.invalidate("a")
+        await asyncio.sleep(0.05)
+        assert not listings["a"].loaded and listings["b"].loaded
+        await owner.close()
+        await other.close()
+
+    asyncio.run(scenario())
+
+
+def test_upload_streams_to_disk_with_hash():
+    import hashlib
+
+    body = b"0123456789" * 50_000
+    multipart = client.post("/api/upload", files={"file": ("../notes.txt", body, "text/plain")})
+    assert multipart.status_code == 200
+    result = multipart.json()
+    assert result["filename"] == "notes.txt"
+    assert result["size"] == len(body)
+    assert result["sha256"] == hashlib.sha256(body).hexdigest()
+    with open(result["path"], "rb") as f:
+        assert f.read() == body
+
+    raw = client.post(
+        "/api/upload?filename=clip.png", content=body, headers={"Content-Type": "image/png"}
+    ).json()
+    assert raw["mimetype"] == "image/png"
+    assert raw["sha256"] == result["sha256"]
+    # Same content, so the same stored file
+    assert raw["deduplicated"] and raw["path"] == result["path"]
+
+
+def test_upload_over_max_size_is_rejected_while_streaming(monkeypatch, tmp_path):
+    monkeypatch.setattr(server.settings, "max_upload_size", 1000)
+
+    def body():
+        # No Content-Length, so the limit has to be enforced as it streams
+        for _ in range(10):
+            yield b"x" * 500
+
+    response = client.post("/api/upload?filename=big.bin", content=body())
+    assert response.status_code == 413
+    assert not list(tmp_path.glob("**/*big.bin"))
+    assert client.post("/api/upload", files={"file": ("big.bin", b"x" * 2000)}).status_code == 413
+
+
+def test_attachment_store_references_and_garbage_collection(tmp_path):
+    import hashlib
+
+    store = AttachmentStore(tmp_path / "store", max_age=60, quota=150)
+
+    def upload(content):
+        fd, path = tempfile.mkstemp(dir=store.upload_dir)
+        with open(fd, "wb") as f:
+            f.write(content)
+        return store.add(path, hashlib.sha256(content).hexdigest())
+
+    def last_used(sha256, seconds_ago):
+        store._connect().execute(
+            "update blobs set last_used = ? where sha256 = ?", [time.time() - seconds_ago, sha256]
+        )
+
+    a = upload(b"a" * 100)
+    assert upload(b"a" * 100)["refs"] == 2
+    assert store.release(a["sha256"]) and store.release(a["sha256"])
+    assert not store.release(a["sha256"])
+    b = upload(b"b" * 100)
+    assert store.acquire(b["sha256"])["refs"] == 2
+    assert store.acquire("0" * 64) is None
+
+    # Referenced blobs don't count against the quota and are never deleted for it
+    c = upload(b"c" * 100)
+    assert store.collect() == 0
+    store.quota = 50
+    assert store.collect() == 1
+    assert store.get(a["sha256"]) is None
+    assert store.get(b["sha256"]) and store.get(c["sha256"])
+    assert store.collect() == 0
+
+    # Unreferenced and unused for max_age
+    store.quota = 0
+    store.release(c["sha256"])
+    last_used(c["sha256"], 120)
+    store.collect()
+    assert store.get(c["sha256"]) is None and store.get(b["sha256"])
+    assert not (tmp_path / "store" / c["sha256"][:2] / c["sha256"]).exists()
+
+    # References are leases: never handed back and unused for max_age
+    last_used(b["sha256"], 120)
+    assert store.collect() == 1 and store.get(b["sha256"]) is None
+
+
+def test_attachment_reuse_endpoints():
+    import hashlib
+
+    content = b"screenshot"
+    sha256 = hashlib.sha256(content).hexdigest()
+    assert client.post(f"/api/attachments/{sha256}/refs").status_code == 404
+    uploaded = client.post("/api/upload?filename=shot.png", content=content).json()
+    reused = client.post(f"/api/attachments/{sha256}/refs").json()
+    assert reused["path"] == uploaded["path"] and reused["refs"] == 2
+    assert client.get(f"/api/attachments/{sha256}").json()["size"] == len(content)
+    assert client.delete(f"/api/attachments/{sha256}/refs").status_code == 200
+
+
+def test_stored_images_are_sent_downscaled(monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    import io
+
+    buffer = io.BytesIO()
+    Image.linear_gradient("L").resize((3000, 2000)).convert("RGB").save(buffer, "PNG")
+    uploaded = client.post("/api/upload?filename=shot.png", content=buffer.getvalue()).json()
+
+    sent = {}
+
+    def fake_stream_events(prompt, cancelled=None, **kwargs):
+        sent.update(kwargs)
+        yield "token", "ok"
+
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    monkeypatch.setattr(server.settings, "image_max_dimension", 1000)
+    monkeypatch.setattr(engine, "stream_events", fake_stream_events)
+    client.post(
+        "/api/prompt",
+        json={
+            "prompt": "what is this",
+            "model": "webui-echo",
+            "attachment_types": [[uploaded["path"], "image/png"]],
+        },
+    )
+    [[path, mimetype]] = sent["attachment_types"]
+    assert mimetype == "image/webp"
+    assert path.startswith(uploaded["path"] + ".1000.")
+    with Image.open(path) as variant:
+        assert variant.size == (1000, 667)
+
+
+def test_images_not_worth_a_variant_are_remembered_within_a_bound(tmp_path, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    from collections import OrderedDict
+
+    from llm_webui import images
+
+    monkeypatch.setattr(images, "_skipped", OrderedDict())
+    monkeypatch.setattr(images, "SKIPPED_LIMIT", 1)
+    # A failure that says nothing about the image isn't remembered
+    assert asyncio.run(images.prepare(tmp_path / "collected.png", 100)) is None
+    assert not images._skipped
+
+    small, other = tmp_path / "small.jpg", tmp_path / "other.jpg"
+    for path in (small, other):
+        Image.new("RGB", (10, 10)).save(path)
+    assert asyncio.run(images.prepare(small, 100)) is None
+    assert list(images._skipped) == [images.variant_path(small, 100, "")]
+    assert asyncio.run(images.prepare(other, 100)) is None
+    assert list(images._skipped) == [images.variant_path(other, 100, "")]
+
+
+def test_non_streamed_prompts_are_cached(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    monkeypatch.setattr(server.settings, "response_cache", True)
+    calls = []
+    run_prompt = engine.run_prompt
+
+    def counting_run_prompt(prompt, **kwargs):
+        calls.append(prompt)
+        return run_prompt(prompt, **kwargs)
+
+    monkeypatch.setattr(engine, "run_prompt", counting_run_prompt)
+    request = {"prompt": "cache me", "model": "webui-echo", "stream": False}
+
+    first = client.post("/api/prompt", json=request)
+    assert first.headers["x-cache"] == "MISS"
+    second = client.post("/api/prompt", json=request)
+    assert second.headers["x-cache"] == "HIT"
+    assert second.json() == first.json() == {"response": "echo(0): cache me"}
+    assert "age" in second.headers
+    assert len(calls) == 1
+
+    refreshed = client.post("/api/prompt", json=request, headers={"Cache-Control": "no-cache"})
+    assert refreshed.headers["x-cache"] == "MISS"
+    bypassed = client.post("/api/prompt", json=request, headers={"Cache-Control": "no-store"})
+    assert bypassed.headers["x-cache"] == "BYPASS"
+    other = client.post("/api/prompt", json=dict(request, system="Be brief"))
+    assert other.headers["x-cache"] == "MISS"
+    assert len(calls) == 4
+
+
+def test_response_cache_key_covers_template_text_and_model_defaults(user_dir):
+    from click.testing import CliRunner
+    from llm.cli import cli
+
+    (user_dir / "templates").mkdir()
+    template = user_dir / "templates" / "greet.yaml"
+    template.write_text("prompt: 'Say hello to $input'\n")
+    request = server.PromptRequest(prompt="Ada", model="webui-echo", template="greet")
+    key = server.prompt_cache_key(request)
+    assert key and server.prompt_cache_key(request) == key
+
+    template.write_text("prompt: 'Say goodbye to $input'\n")
+    edited = server.prompt_cache_key(request)
+    assert edited != key
+
+    result = CliRunner().invoke(cli, ["models", "options", "set", "webui-echo", "temperature", "0.5"])
+    assert result.exit_code == 0, result.output
+    assert server.prompt_cache_key(request) != edited
+    # The same options given explicitly make the same prompt
+    explicit = request.model_copy(update={"options": {"temperature": 0.5}})
+    assert server.prompt_cache_key(explicit) == server.prompt_cache_key(request)
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.db", ttl=60, max_size=10)
+    cache.put("a", "aaaa")
+    cache.put("b", "bbbb")
+    assert cache.get("a")[0] == "aaaa"
+    cache.put("c", "cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    cache.ttl = 0
+    assert cache.get("a") is None
+
+
+def test_built_assets_are_trimmed_fingerprinted_and_precompressed(tmp_path):
+    static, templates = tmp_path / "static", tmp_path / "templates"
+    for directory in [static / "js", static / "vendor/kit/css", static / "vendor/kit/fonts", templates]:
+        directory.mkdir(parents=True)
+    (templates / "index.html").write_text('<i class="icon icon-ok"></i>')
+    source = "element.classList.add('active');\n" * 50
+    (static / "js/app.js").write_text(source)
+    (static / "vendor/kit/css/kit.css").write_text(
+        '/*! kit */.icon{font-family:kit}.icon-ok:before,.icon-yes:before{content:"\\e001"}'
+        '.icon-no:before{content:"\\e002"}@media print{.unused{color:red}}'
+        '@font-face{font-family:kit;src:url(../fonts/kit.woff2) format("woff2")}'
+    )
+    (static / "vendor/kit/fonts/kit.woff2").write_bytes(b"font")
+
+    manifest = assets.build(static, templates, fetch=False)
+    built_js = manifest["js/app.js"]["path"]
+    assert re.fullmatch(r"js/app\.[0-9a-f]{12}\.js", built_js)
+    css = (static / "dist" / manifest["vendor/kit/css/kit.css"]["path"]).read_text()
+    assert css.startswith("/*! kit */.icon{")
+    assert ".icon-ok:before{" in css
+    assert "icon-no" not in css and "icon-yes" not in css and "@media" not in css
+    font = manifest["vendor/kit/fonts/kit.woff2"]["path"].rsplit("/", 1)[1]
+    assert f"url(../fonts/{font})" in css
+
+    app = FastAPI()
+    app.mount("/static", assets.StaticAssets(directory=str(static)), name="static")
+    static_client = TestClient(app)
+    response = static_client.get(f"/static/dist/{built_js}", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["cache-control"] == assets.IMMUTABLE
+    assert response.headers["content-type"].startswith("text/javascript")
+    assert response.text == source
+    response = static_client.get("/static/js/app.js", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["cache-control"] == "no-cache"
+
+    assert assets.AssetManifest(static).path("js/app.js") == f"dist/{built_js}"
+    # Edited since the build, or never vendored
+    (static / "js/app.js").write_text("changed")
+    assert assets.AssetManifest(static).path("js/app.js") == "js/app.js"
+    assert assets.AssetManifest(static).path("vendor/bootstrap/css/bootstrap.min.css") is None
+
+
+def test_compression_flushes_every_streamed_chunk():
+    chunks = [b'event: token\ndata: {"text": "%d"}\n\n' % i for i in range(5)]
+
+    async def app(scope, receive, send):
+        headers = [(b"content-type", b"text/event-stream"), (b"etag", b'"v1"')]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for chunk in chunks:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(CompressionMiddleware(app)(scope, None, send))
+    headers = dict(sent[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"etag"] == b'W/"v1"'
+    # Each chunk decodes on its own: nothing waits in the compressor
+    decoder = zlib.decompressobj(31)
+    assert [decoder.decompress(m["body"]) for m in sent[1:-1]] == chunks
+    decoder.decompress(sent[-1]["body"])
+    assert decoder.eof
+
+
+def test_json_responses_are_compressed_when_accepted(monkeypatch):
+    monkeypatch.setattr(server.settings, "backend", "inprocess")
+    server.chat_sessions.clear()
+    client.post("/api/chat", json={"message": "long " * 400, "model": "webui-echo"})
+    [cid] = list(server.chat_sessions._sessions)
+    url = f"/api/conversations/{cid}/messages"
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in compressed.headers["vary"].lower()
+    assert int(compressed.headers["content-length"]) < len(compressed.content)
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == compressed.json()
+    # Small responses go out as they are
+    small = client.get("/api/conversations/none/messages", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers